@@ -0,0 +1,96 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable
+
+class AffinityCache:
+    """
+    Persistent cache of affinity scores, one row per (context, keyword) pair
+
+    Keys are content hashes of everything that determines a score (model,
+    temperature, prompt template, context text and keyword), so a changed
+    mentor or prompt simply misses instead of returning a stale score. The
+    table is bounded to max_entries, evicting the least recently used rows.
+    """
+
+    def __init__(self, path: str = 'affinity_cache.sqlite', max_entries: int = 200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS scores_last_access ON scores (last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, template: str, context: str, keyword: str) -> str:
+        """Hashes the inputs of a single score into a cache key"""
+        parts = [str(model), repr(float(temperature)), template, context, keyword]
+        return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        """Returns the cached scores found for keys and refreshes their access time"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self.lock:
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT key, score FROM scores WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                # Scores come back as REAL, keep whole numbers as the model returned them
+                found.update((key, int(score) if score.is_integer() else score) for key, score in rows)
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE scores SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, scores: Dict[str, float]):
+        """Stores scores and evicts the least recently used rows above max_entries"""
+        if not scores:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO scores (key, score, last_access) VALUES (?, ?, ?)",
+                [(key, float(score), now) for key, score in scores.items()]
+            )
+            excess = self._count() - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    "DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY last_access LIMIT ?)",
+                    (excess,)
+                )
+            self.conn.commit()
+
+    def _count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this session and the current number of entries"""
+        with self.lock:
+            entries = self._count()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
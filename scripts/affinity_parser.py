@@ -0,0 +1,153 @@
+import json
+import re
+import threading
+from collections import Counter
+from typing import List, Optional, Tuple
+
+MIN_SCORE = 1
+MAX_SCORE = 100
+
+# JSON schema for the structured-output response format
+AFFINITY_RESPONSE_SCHEMA = {
+    "name": "affinity_scores",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "scores": {
+                "type": "array",
+                "items": {"type": "array", "items": {"type": "integer"}}
+            }
+        },
+        "required": ["scores"],
+        "additionalProperties": False
+    }
+}
+
+ROW_PATTERN = re.compile(r"\[([^\[\]]*)\]")
+
+def load_matrix(content: str):
+    """
+    Decodes the answer as JSON, falling back to the outermost brackets
+
+    Returns the decoded value, or None when no JSON could be recovered.
+    """
+    content = content.replace('```json', '').replace('```', '').strip()
+    try:
+        value = json.loads(content)
+    except json.JSONDecodeError:
+        start, end = content.find('['), content.rfind(']')
+        if start == -1 or end <= start:
+            return None
+        try:
+            value = json.loads(content[start:end + 1])
+        except json.JSONDecodeError:
+            return None
+    if isinstance(value, dict):
+        value = value.get('scores')
+    return value
+
+def salvage_rows(content: str) -> list:
+    """Recovers every complete inner [..] list from an answer that is not valid JSON, e.g. truncated"""
+    rows = []
+    for match in ROW_PATTERN.finditer(content):
+        try:
+            row = json.loads(f"[{match.group(1)}]")
+        except json.JSONDecodeError:
+            row = None
+        rows.append(row)
+    return rows
+
+def check_row(row, n_keywords: int) -> Tuple[Optional[List[int]], Optional[str]]:
+    """Returns (scores, None) for a valid row or (None, failure reason)"""
+    if not isinstance(row, list):
+        return None, 'not_a_list'
+    if len(row) != n_keywords:
+        return None, 'row_length'
+    if not all(isinstance(score, (int, float)) and not isinstance(score, bool) for score in row):
+        return None, 'not_a_number'
+    if not all(MIN_SCORE <= score <= MAX_SCORE for score in row):
+        return None, 'out_of_range'
+    return [int(round(score)) for score in row], None
+
+def parse_affinity_response(content: str, n_contexts: int, n_keywords: int):
+    """
+    Parses an affinity answer into one row of scores per context
+
+    Rows are checked one by one, so a single bad row does not discard the
+    rest. A truncated answer keeps its complete leading rows. An answer with
+    more rows than contexts cannot be aligned and fails as a whole.
+
+    Returns:
+        tuple: (list with a score list or None per context, list of failure reasons)
+    """
+    matrix = load_matrix(content)
+    if matrix is None:
+        rows = salvage_rows(content)
+        if not rows:
+            return [None] * n_contexts, ['invalid_json'] * n_contexts
+        failures = ['truncated'] * max(0, n_contexts - len(rows))
+    elif not isinstance(matrix, list):
+        return [None] * n_contexts, ['not_a_matrix'] * n_contexts
+    else:
+        # A single context answered with a flat list instead of a list of lists
+        if n_contexts == 1 and matrix and not any(isinstance(row, list) for row in matrix):
+            matrix = [matrix]
+        rows = matrix
+        failures = ['missing_row'] * max(0, n_contexts - len(rows))
+
+    if len(rows) > n_contexts:
+        return [None] * n_contexts, ['extra_rows'] * n_contexts
+
+    parsed = []
+    for row in rows:
+        scores, reason = check_row(row, n_keywords)
+        parsed.append(scores)
+        if reason:
+            failures.append(reason)
+    parsed.extend([None] * (n_contexts - len(parsed)))
+    return parsed, failures
+
+class ParseStats:
+    """Thread-safe counters of affinity requests, API errors, retries and parse failures by reason"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.api_errors = 0
+        self.contexts_requested = 0
+        self.contexts_parsed = 0
+        self.contexts_retried = 0
+        self.failures = Counter()
+
+    def record_response(self, n_contexts: int, failures: List[str], retried: int):
+        with self.lock:
+            self.requests += 1
+            self.contexts_requested += n_contexts
+            self.contexts_parsed += n_contexts - len(failures)
+            self.contexts_retried += retried
+            self.failures.update(failures)
+
+    def record_api_error(self):
+        """Counts a request that still failed after the client's own retries"""
+        with self.lock:
+            self.api_errors += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            requested = self.contexts_requested
+            return {
+                'requests': self.requests,
+                'api_errors': self.api_errors,
+                'contexts_requested': requested,
+                'contexts_parsed': self.contexts_parsed,
+                'contexts_retried': self.contexts_retried,
+                'parse_failure_rate': (requested - self.contexts_parsed) / requested if requested else 0.0,
+                'retry_rate': self.contexts_retried / requested if requested else 0.0,
+                'failures': dict(self.failures)
+            }
+
+PARSE_STATS = ParseStats()
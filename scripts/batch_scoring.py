@@ -0,0 +1,240 @@
+import json
+import os
+import time
+from dotenv import load_dotenv
+from affinity_parser import PARSE_STATS, parse_affinity_response
+from checkpoint import CheckpointLog
+from mentor_records import records_from_frame
+from score_sampling import consensus_score, score_variance
+from tracing import TRACER, estimate_cost
+import evaluate_affinity as affinity
+
+# Load environment variables
+load_dotenv()
+
+BATCH_INPUT_FILE = os.getenv('BATCH_INPUT_FILE', 'affinity_batch_input.jsonl')
+BATCH_STATE_FILE = os.getenv('BATCH_STATE_FILE', 'affinity_batch.json')
+BATCH_POLL_SECONDS = float(os.getenv('BATCH_POLL_SECONDS', '30'))
+BATCH_COMPLETION_WINDOW = os.getenv('BATCH_COMPLETION_WINDOW', '24h')
+BATCH_RETRY_SYNC = os.getenv('BATCH_RETRY_SYNC', 'true').lower() == 'true'
+BATCH_ENDPOINT = '/v1/chat/completions'
+# Batch requests are billed at half the synchronous price
+BATCH_PRICE_FACTOR = 0.5
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+def write_batch_input(path: str, requests: dict) -> int:
+    """
+    Writes one Batch API request line per prompt
+
+    Args:
+        path: JSONL file to write
+        requests: {custom_id: chat completion arguments}
+
+    Returns:
+        int: Number of requests written
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for custom_id, body in requests.items():
+            f.write(json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': BATCH_ENDPOINT,
+                                'body': body}, ensure_ascii=False) + '\n')
+    return len(requests)
+
+def submit_batch(client, path: str, completion_window: str = BATCH_COMPLETION_WINDOW):
+    """Uploads the input file and creates the batch"""
+    with open(path, 'rb') as f:
+        input_file = client.files.create(file=f, purpose='batch')
+    return client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                 completion_window=completion_window)
+
+def wait_for_batch(client, batch_id: str, poll_seconds: float = BATCH_POLL_SECONDS):
+    """Polls the batch until it completes, fails, expires or is cancelled, printing progress"""
+    last_progress = None
+    try:
+        while True:
+            batch = client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            progress = (batch.status, counts.completed if counts else 0, counts.failed if counts else 0)
+            if progress != last_progress:
+                total = counts.total if counts else '?'
+                print(f"Batch {batch_id}: {batch.status}, {progress[1]} of {total} requests done, {progress[2]} failed")
+                last_progress = progress
+            if batch.status in FINAL_STATUSES:
+                return batch
+            time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        print(f"\nStopped waiting; batch {batch_id} keeps running. Run again to collect its results.")
+        raise
+
+def read_batch_output(client, file_id: str) -> dict:
+    """Downloads an output or error file as {custom_id: result line}"""
+    if not file_id:
+        return {}
+    lines = {}
+    for line in client.files.content(file_id).text.splitlines():
+        if line.strip():
+            entry = json.loads(line)
+            lines[entry['custom_id']] = entry
+    return lines
+
+def response_content(entry: dict):
+    """Returns (answer texts, one per choice, usage dict) of a result line, or (None, error message) for a failed request"""
+    if entry is None:
+        return None, 'no result'
+    response = entry.get('response') or {}
+    if entry.get('error') or response.get('status_code') != 200:
+        error = entry.get('error') or response.get('body', {}).get('error') or {}
+        return None, error.get('message') or f"status {response.get('status_code')}"
+    body = response['body']
+    return [choice['message']['content'] or '' for choice in body['choices']], body.get('usage') or {}
+
+def load_state(path: str = BATCH_STATE_FILE) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state: dict, path: str = BATCH_STATE_FILE):
+    if not path:
+        return
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def clear_state(path: str = BATCH_STATE_FILE):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def submit_or_resume(client, requests: dict, plan: dict) -> str:
+    """
+    Submits the requests as a new batch, or reuses the batch of an interrupted run
+
+    The state file records the batch ID with the planned packs (context
+    hashes and keywords), the model and a signature of the temperature,
+    prompt and sample count, so a batch is only reused for the same prompts.
+    """
+    state = load_state()
+    signature = affinity.scoring_signature()
+    if state.get('plan') == plan and state.get('model') == os.getenv('MODEL_AFFINITY') \
+            and state.get('signature') == signature:
+        print(f"Resuming batch {state['batch_id']} submitted at {state['submitted_at']}")
+        return state['batch_id']
+
+    with TRACER.span('batch.submit', requests=len(requests)) as span:
+        write_batch_input(BATCH_INPUT_FILE, requests)
+        batch = submit_batch(client, BATCH_INPUT_FILE)
+        span['batch_id'] = batch.id
+    save_state({'batch_id': batch.id, 'model': os.getenv('MODEL_AFFINITY'), 'signature': signature, 'plan': plan,
+                'submitted_at': time.strftime('%Y-%m-%d %H:%M:%S')})
+    print(f"Submitted batch {batch.id} with {len(requests)} requests ({BATCH_INPUT_FILE})")
+    return batch.id
+
+def score_mentors_batch(mentors_df, keywords, client, cache=None, on_result=None):
+    """
+    Scores mentors through the OpenAI Batch API instead of synchronous requests
+
+    Prompts are planned and packed exactly like score_mentors, written to a
+    batch input file and submitted. Once the batch finishes, the answers are
+    parsed with the same parser, combined like synchronous samples when
+    AFFINITY_SAMPLES asks for several, and cached. Mentors whose request failed or
+    whose rows were malformed are scored synchronously when BATCH_RETRY_SYNC
+    is set. An interrupted run picks up its batch again from BATCH_STATE_FILE.
+
+    Returns:
+        list: Mentor results in the order of mentors_df, skipping failed mentors
+    """
+    rows = records_from_frame(mentors_df)
+    contexts = [affinity.create_context(row) for row in rows]
+    affinities, tasks = affinity.plan_packs(contexts, keywords, cache)
+
+    variances = [{} for _ in rows]
+    # Cached scores are consensus scores of AFFINITY_SAMPLES samples
+    counts = [dict.fromkeys(cached, affinity.AFFINITY_SAMPLES) if affinity.AFFINITY_SAMPLES > 1 else {}
+              for cached in affinities]
+
+    def result(i):
+        return affinity.mentor_result(rows[i], {keyword: affinities[i][keyword] for keyword in keywords},
+                                      {keyword: variances[i][keyword] for keyword in keywords if keyword in variances[i]},
+                                      {keyword: counts[i][keyword] for keyword in keywords if keyword in counts[i]})
+
+    def complete(i):
+        return len(affinities[i]) == len(keywords)
+
+    if on_result is not None:
+        for i in range(len(rows)):
+            if complete(i):
+                on_result(rows[i], contexts[i], result(i))
+
+    if tasks:
+        requests, plan = {}, {}
+        for n, (indexes, task_keywords) in enumerate(tasks):
+            custom_id = f"pack-{n}"
+            requests[custom_id] = affinity.affinity_request([contexts[i] for i in indexes], task_keywords,
+                                                            affinity.AFFINITY_SAMPLES)
+            plan[custom_id] = {'contexts': [CheckpointLog.context_hash(contexts[i]) for i in indexes],
+                               'keywords': task_keywords}
+
+        batch_id = submit_or_resume(client, requests, plan)
+        with TRACER.span('batch.wait', batch_id=batch_id) as span:
+            batch = wait_for_batch(client, batch_id)
+            span['batch_status'] = batch.status
+        if batch.status != 'completed':
+            print(f"Batch {batch_id} ended as {batch.status}, keeping the requests it finished")
+
+        with TRACER.span('batch.ingest', requests=len(tasks)) as span:
+            entries = read_batch_output(client, batch.output_file_id)
+            entries.update(read_batch_output(client, batch.error_file_id))
+            prompt_tokens = completion_tokens = 0
+            failed = []
+            for n, (indexes, task_keywords) in enumerate(tasks):
+                answers, usage = response_content(entries.get(f"pack-{n}"))
+                if answers is None:
+                    print(f"Batch request pack-{n} failed: {usage}")
+                    failed.extend(indexes)
+                    continue
+                prompt_tokens += usage.get('prompt_tokens', 0)
+                completion_tokens += usage.get('completion_tokens', 0)
+
+                parsed = [parse_affinity_response(answer, len(indexes), len(task_keywords)) for answer in answers]
+                sampled = [[matrix[j] for matrix, _ in parsed if matrix[j] is not None] for j in range(len(indexes))]
+                retried = sum(not sample_rows for sample_rows in sampled) if BATCH_RETRY_SYNC else 0
+                for k, (_, failures) in enumerate(parsed):
+                    PARSE_STATS.record_response(len(indexes), failures, retried if k == 0 else 0)
+                matrix = [[consensus_score([row[column] for row in sample_rows]) for column in range(len(task_keywords))]
+                          if sample_rows else None for sample_rows in sampled]
+                affinity.cache_matrix(cache, [contexts[i] for i in indexes], task_keywords, matrix)
+                for i, sample_rows, scores in zip(indexes, sampled, matrix):
+                    if scores is None:
+                        failed.append(i)
+                        continue
+                    affinities[i].update(zip(task_keywords, scores))
+                    if len(sample_rows) > 1:
+                        variances[i].update((keyword, score_variance([row[column] for row in sample_rows]))
+                                            for column, keyword in enumerate(task_keywords))
+                        counts[i].update(dict.fromkeys(task_keywords, len(sample_rows)))
+                    if on_result is not None:
+                        on_result(rows[i], contexts[i], result(i))
+
+            cost = estimate_cost(os.getenv('MODEL_AFFINITY'), prompt_tokens, completion_tokens)
+            span.update({'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                         'cost_usd': cost * BATCH_PRICE_FACTOR if cost is not None else None,
+                         'failed_mentors': len(failed)})
+        clear_state()
+        print(f"Batch {batch_id}: {len(rows) - len(failed)} mentors scored, {len(failed)} failed")
+
+        if failed and BATCH_RETRY_SYNC:
+            print(f"Scoring the {len(failed)} failed mentors synchronously")
+            positions = {(rows[i]['name'], contexts[i]): i for i in failed}
+
+            def on_retried(row, context, retried):
+                position = positions[(row['name'], context)]
+                affinities[position] = retried['affinities']
+                variances[position] = retried.get('variance', {})
+                counts[position] = retried.get('samples', {})
+                if on_result is not None:
+                    on_result(row, context, retried)
+
+            affinity.score_mentors(mentors_df.iloc[sorted(failed)], keywords, client, cache,
+                                   affinity.MAX_CONCURRENCY, on_retried)
+
+    return [result(i) for i in range(len(rows)) if complete(i)]
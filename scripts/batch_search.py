@@ -0,0 +1,153 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from dotenv import load_dotenv
+import evaluate_affinity
+import merge_results
+from extract_keywords import extract_keywords
+from openai_client import setup_client
+
+# Load environment variables
+load_dotenv()
+
+SEARCHES_FILE = os.getenv('SEARCHES_FILE', 'searches.txt')
+BATCH_RESULTS_DIR = os.getenv('BATCH_RESULTS_DIR', 'batch_results')
+MAX_CONCURRENCY_KEYWORDS = int(os.getenv('MAX_CONCURRENCY_KEYWORDS', '4'))
+TOP_K_RESULTS = int(os.getenv('TOP_K_RESULTS', '10'))
+
+def read_searches(searches_file: str = SEARCHES_FILE) -> list:
+    """
+    Reads the search descriptions to run
+
+    A .json file holds a list of strings or of {"id", "description"} objects,
+    any other file holds one description per line.
+
+    Returns:
+        list: {'id', 'description'} dicts
+    """
+    if not os.path.exists(searches_file):
+        raise Exception(f"Searches file not found: {searches_file}")
+
+    with open(searches_file, 'r', encoding='utf-8') as f:
+        if searches_file.endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = [line.strip() for line in f if line.strip()]
+
+    searches = []
+    for i, entry in enumerate(entries, 1):
+        if isinstance(entry, str):
+            entry = {'id': f"search_{i}", 'description': entry}
+        searches.append({'id': str(entry.get('id', f"search_{i}")), 'description': entry['description'].strip()})
+    return searches
+
+def extract_all_keywords(searches: list, client, max_concurrency: int = MAX_CONCURRENCY_KEYWORDS) -> list:
+    """Extracts keywords for every search concurrently, in the order of searches"""
+    def extract(search):
+        try:
+            return extract_keywords(search['description'], client)
+        except Exception as e:
+            print(f"Error extracting keywords for {search['id']}: {str(e)}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        return list(executor.map(extract, searches))
+
+def union_keywords(keyword_lists: list):
+    """
+    Merges the keywords of all searches, ignoring case and surrounding spaces
+
+    Returns:
+        tuple: (unique keywords, each search's keywords mapped onto the unique spelling)
+    """
+    canonical = {}
+    for keywords in keyword_lists:
+        for keyword in keywords:
+            canonical.setdefault(keyword.strip().casefold(), keyword.strip())
+
+    mapped = [
+        list(dict.fromkeys(canonical[keyword.strip().casefold()] for keyword in keywords))
+        for keywords in keyword_lists
+    ]
+    return list(canonical.values()), mapped
+
+def rank_search(mentors_df, all_keywords: list, matrix, keywords: list):
+    """Ranks mentors for one search from its columns of the shared score matrix"""
+    # Keywords no mentor could be scored on have no column
+    keywords = [keyword for keyword in keywords if keyword in all_keywords]
+    columns = [all_keywords.index(keyword) for keyword in keywords]
+    search_matrix = matrix[:, columns]
+    order, scores = merge_results.rank_mentors(search_matrix, keywords)
+    return merge_results.ranked_frame(mentors_df, keywords, search_matrix, scores, order)
+
+def run_batch_search(searches: list, mentors_df, client=None, output_dir: str = BATCH_RESULTS_DIR) -> dict:
+    """
+    Runs many searches against one mentor snapshot, scoring each (mentor, keyword) pair once
+
+    Returns:
+        dict: {search id: ranked DataFrame}
+    """
+    # Sized for the keyword extraction pool as well, not just affinity scoring
+    client = client or setup_client(max(MAX_CONCURRENCY_KEYWORDS, evaluate_affinity.MAX_CONCURRENCY))
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"\nExtracting keywords for {len(searches)} searches...")
+    keyword_lists = extract_all_keywords(searches, client)
+    all_keywords, search_keywords = union_keywords(keyword_lists)
+    total = sum(len(keywords) for keywords in search_keywords)
+    print(f"\n{total} keywords across searches, {len(all_keywords)} unique: {all_keywords}")
+
+    affinity_scores = evaluate_affinity.evaluate(
+        mentors_df, all_keywords, client, os.path.join(output_dir, 'affinity_scores.json')
+    ) if all_keywords else []
+
+    matrix_keywords, matrix = merge_results.build_score_matrix(mentors_df, affinity_scores)
+    rankings = {}
+    summary = []
+    for search, keywords in zip(searches, search_keywords):
+        if not keywords:
+            print(f"\nSkipping {search['id']}: no keywords extracted")
+            continue
+        ranked_df = rank_search(mentors_df, matrix_keywords, matrix, keywords)
+        rankings[search['id']] = ranked_df
+        ranked_df.to_csv(os.path.join(output_dir, f"{search['id']}.csv"), index=False, encoding='utf-8')
+
+        top = ranked_df[['name', 'average_affinity']].head(TOP_K_RESULTS)
+        summary.append({
+            'id': search['id'],
+            'description': search['description'],
+            'keywords': keywords,
+            'top_mentors': [
+                {'name': row['name'], 'average_affinity': round(float(row['average_affinity']), 2)}
+                for _, row in top.iterrows()
+            ]
+        })
+
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    for entry in summary:
+        print(f"\nTop mentors for {entry['id']} ({', '.join(entry['keywords'])}):")
+        for mentor in entry['top_mentors'][:3]:
+            print(f"{mentor['name']}: {mentor['average_affinity']:.2f}")
+
+    return rankings
+
+def main():
+    try:
+        searches = read_searches(sys.argv[1] if len(sys.argv) > 1 else SEARCHES_FILE)
+        mentors_df = pd.read_csv('mentors.csv')
+        run_batch_search(searches, mentors_df)
+        print(f"\nResults saved to {BATCH_RESULTS_DIR}/")
+        return True
+
+    except Exception as e:
+        print(f"\nError: {str(e)}")
+        return False
+
+if __name__ == "__main__":
+    success = main()
+    if not success:
+        sys.exit(1)
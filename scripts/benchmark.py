@@ -0,0 +1,222 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+import numpy as np
+from benchmark_extraction import peak_rss_mb
+from fake_openai_server import FakeOpenAIServer, fake_score
+from load_test import configure_environment
+from synthetic_data import generate_descriptions, generate_keyword_sets, write_mentors_csv, write_mentors_page
+
+STAGES = ['extract', 'keywords', 'affinity', 'merge', 'end_to_end']
+DEFAULT_SIZES = [100, 1000]
+
+def time_requests(client, latencies: list):
+    """Records the latency of every chat completion made through client, retries included"""
+    create = client.chat.completions.create
+
+    def timed_create(**kwargs):
+        start_time = time.perf_counter()
+        try:
+            return create(**kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start_time)
+
+    client.chat = SimpleNamespace(completions=SimpleNamespace(create=timed_create))
+    return client
+
+def load_mentors(size: int):
+    import pandas as pd
+    return pd.read_csv(f'mentors_{size}.csv')
+
+def bench_extract(size: int, options: dict) -> dict:
+    """Parses the synthetic page options['repeat'] times, one latency per page"""
+    import extract_mentors
+    latencies, count = [], 0
+    for _ in range(options['repeat']):
+        start_time = time.perf_counter()
+        count = len(extract_mentors.extract_mentors(f'mentors_{size}.html', output_file=None))
+        latencies.append(time.perf_counter() - start_time)
+    return {'items': count * options['repeat'], 'unit': 'mentor', 'latencies': latencies, 'seconds': sum(latencies)}
+
+def bench_keywords(size: int, options: dict) -> dict:
+    """Extracts keywords for options['searches'] descriptions, one latency per description"""
+    from concurrent.futures import ThreadPoolExecutor
+    import evaluate_affinity
+    from extract_keywords import extract_keywords
+    client = evaluate_affinity.setup_openai()
+    descriptions = generate_descriptions(options['searches'])
+    latencies = []
+    start_time = time.perf_counter()
+
+    def extract(description):
+        start_time = time.perf_counter()
+        extract_keywords(description, client)
+        latencies.append(time.perf_counter() - start_time)
+
+    with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+        list(executor.map(extract, descriptions))
+    return {'items': len(descriptions), 'unit': 'search', 'latencies': latencies,
+            'seconds': time.perf_counter() - start_time}
+
+def bench_affinity(size: int, options: dict) -> dict:
+    """Scores every mentor against one keyword set, one latency per model request"""
+    import evaluate_affinity
+    latencies = []
+    client = time_requests(evaluate_affinity.setup_openai(), latencies)
+    keywords = generate_keyword_sets(1, options['keywords'], options['keywords'])[0]
+    mentors_df = load_mentors(size)
+    start_time = time.perf_counter()
+    results = evaluate_affinity.evaluate(mentors_df, keywords, client, output_file=None)
+    return {'items': len(results), 'unit': 'mentor', 'latencies': latencies,
+            'seconds': time.perf_counter() - start_time}
+
+def bench_merge(size: int, options: dict) -> dict:
+    """Ranks precomputed scores options['repeat'] times, one latency per ranking"""
+    import merge_results
+    mentors_df = load_mentors(size)
+    keywords = generate_keyword_sets(1, options['keywords'], options['keywords'])[0]
+    affinity_scores = [
+        {'mentor_name': row['name'],
+         'affinities': {keyword: fake_score(keyword, f"{row['position']} - {row['description']}") for keyword in keywords}}
+        for _, row in mentors_df.iterrows()
+    ]
+    latencies = []
+    for _ in range(options['repeat']):
+        start_time = time.perf_counter()
+        merge_results.process_results(mentors_df, affinity_scores)
+        latencies.append(time.perf_counter() - start_time)
+    return {'items': len(mentors_df) * options['repeat'], 'unit': 'mentor', 'latencies': latencies,
+            'seconds': sum(latencies)}
+
+def bench_end_to_end(size: int, options: dict) -> dict:
+    """Page to ranking in one interpreter, the way run_pipeline.py --in-process runs it"""
+    import evaluate_affinity
+    import extract_mentors
+    import merge_results
+    from extract_keywords import extract_keywords
+    from mentor_records import records_frame
+    start_time = time.perf_counter()
+    mentors_data = extract_mentors.extract_mentors(f'mentors_{size}.html', output_file=None)
+    mentors_df = records_frame(mentors_data).replace('', np.nan)
+    client = evaluate_affinity.setup_openai()
+    keywords = extract_keywords(generate_descriptions(1)[0], client)
+    results = evaluate_affinity.evaluate(mentors_df, keywords, client, output_file=None)
+    merge_results.merge(mentors_df, results, output_file=None)
+    seconds = time.perf_counter() - start_time
+    return {'items': len(mentors_df), 'unit': 'mentor', 'latencies': [seconds], 'seconds': seconds}
+
+BENCHMARKS = {
+    'extract': bench_extract,
+    'keywords': bench_keywords,
+    'affinity': bench_affinity,
+    'merge': bench_merge,
+    'end_to_end': bench_end_to_end
+}
+
+def run_benchmark(stage: str, size: int, options: dict, workdir: str, environment: dict, queue):
+    """Runs one stage in a fresh process and reports its throughput, latencies and memory"""
+    os.chdir(workdir)
+    os.environ.update(environment)
+    baseline_mb = peak_rss_mb()
+    # The pipeline prints and logs per mentor progress, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        result = BENCHMARKS[stage](size, options)
+    # Stages time their own work, leaving out imports
+    result.update({
+        'peak_rss_mb': peak_rss_mb(),
+        'baseline_rss_mb': baseline_mb
+    })
+    queue.put(result)
+
+def measure(stage: str, size: int, options: dict, workdir: str, fake_server) -> dict:
+    # Spawned children start from a clean interpreter, so peaks are comparable
+    before = fake_server.counters()
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_benchmark,
+                              args=(stage, size, options, workdir, dict(os.environ), queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    after = fake_server.counters()
+
+    latencies = result.pop('latencies')
+    result.update({
+        'stage': stage,
+        'size': size,
+        'throughput': result['items'] / result['seconds'] if result['seconds'] else 0.0,
+        'p50_seconds': float(np.percentile(latencies, 50)) if latencies else 0.0,
+        'p95_seconds': float(np.percentile(latencies, 95)) if latencies else 0.0,
+        'requests': after['requests'] - before['requests'],
+        'errors': after['errors'] - before['errors'],
+        'rate_limited': after['rate_limited'] - before['rate_limited']
+    })
+    result['requests_per_item'] = result['requests'] / result['items'] if result['items'] else 0.0
+    return result
+
+def print_result(result: dict):
+    print(f"{result['stage']:>10} {result['size']:>7} {result['items']:>7} {result['throughput']:>9.1f}/{result['unit']:<7}"
+          f"{result['p50_seconds']:>9.3f} {result['p95_seconds']:>9.3f} {result['peak_rss_mb']:>9.1f} "
+          f"{result['requests']:>8} {result['requests_per_item']:>8.2f} {result['errors']:>6} {result['rate_limited']:>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage and the end-to-end run "
+                                                 "against a deterministic fake model server")
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES, help="Mentors per synthetic dataset")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--keywords', type=int, default=5, help="Keywords each mentor is scored against")
+    parser.add_argument('--searches', type=int, default=20, help="Descriptions for the keywords stage")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs of the extract and merge stages")
+    parser.add_argument('--concurrency', type=int, default=8, help="MAX_CONCURRENCY_AFFINITY and keyword threads")
+    parser.add_argument('--contexts-per-request', type=int, default=5, help="CONTEXTS_PER_REQUEST")
+    parser.add_argument('--latency', type=float, default=0.05, help="Fake model latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of model requests failing with 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Share of model requests failing with 429")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    fake_server = FakeOpenAIServer(latency=args.latency, error_rate=args.error_rate,
+                                   rate_limit_rate=args.rate_limit_rate, retry_after=0.05).start()
+    configure_environment(fake_server.base_url)
+    # Every run starts cold: no caches, checkpoints or prefilter
+    os.environ.update({
+        'AFFINITY_CACHE_FILE': '', 'KEYWORD_CACHE_FILE': '', 'AFFINITY_CHECKPOINT_FILE': '',
+        'PREFILTER_TOP_K': '0', 'MENTOR_INDEX_DIR': '', 'STREAMING_EXTRACTION': 'false',
+        'MAX_CONCURRENCY_AFFINITY': str(args.concurrency),
+        'CONTEXTS_PER_REQUEST': str(args.contexts_per_request),
+        'BACKOFF_BASE_SECONDS': '0.05', 'BACKOFF_MAX_SECONDS': '1'
+    })
+    options = {'keywords': args.keywords, 'searches': args.searches, 'repeat': args.repeat,
+               'concurrency': args.concurrency}
+
+    print(f"Fake model: {args.latency}s latency, {args.error_rate:.0%} errors, {args.rate_limit_rate:.0%} 429s; "
+          f"concurrency {args.concurrency}, {args.contexts_per_request} mentors per request, {args.keywords} keywords\n")
+    print(f"{'stage':>10} {'size':>7} {'items':>7} {'throughput':>17}{'p50 s':>9} {'p95 s':>9} {'peak MB':>9} "
+          f"{'requests':>8} {'req/item':>8} {'500s':>6} {'429s':>6}")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            write_mentors_page(os.path.join(workdir, f'mentors_{size}.html'), size)
+            write_mentors_csv(os.path.join(workdir, f'mentors_{size}.csv'), size)
+            for stage in args.stages:
+                # Keyword extraction does not depend on the number of mentors
+                if stage == 'keywords' and size != args.sizes[0]:
+                    continue
+                result = measure(stage, size, options, workdir, fake_server)
+                results.append(result)
+                print_result(result)
+
+    fake_server.shutdown()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
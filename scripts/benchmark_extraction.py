@@ -0,0 +1,66 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from synthetic_data import write_mentors_page
+
+DEFAULT_SIZES = [1000, 5000, 20000, 50000]
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process in MB (Linux reports KB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_extraction(mode: str, html_path: str, workdir: str, queue):
+    """Runs one extraction mode in a fresh process and reports its time and memory"""
+    os.chdir(workdir)
+    import extract_mentors
+    baseline_mb = peak_rss_mb()
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'full':
+            with open(html_path, 'r', encoding='utf-8') as f:
+                count = len(extract_mentors.process_mentors_page(f.read()))
+        else:
+            count = extract_mentors.extract_mentors_streaming(html_path)
+    queue.put({
+        'mode': mode,
+        'mentors': count,
+        'seconds': time.time() - start_time,
+        'peak_rss_mb': peak_rss_mb(),
+        'baseline_rss_mb': baseline_mb
+    })
+
+def measure(mode: str, html_path: str, workdir: str) -> dict:
+    # Spawned children start from a clean interpreter, so peaks are comparable
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_extraction, args=(mode, html_path, workdir, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-tree and streaming mentor extraction")
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES, help="Mentors per synthetic page")
+    args = parser.parse_args()
+
+    print(f"{'mentors':>8} {'mode':>10} {'page MB':>8} {'seconds':>8} {'mentors/s':>10} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            html_path = os.path.join(workdir, f'mentors_{size}.html')
+            write_mentors_page(html_path, size)
+            page_mb = os.path.getsize(html_path) / (1024 * 1024)
+            for mode in ('full', 'streaming'):
+                result = measure(mode, html_path, workdir)
+                print(f"{size:>8} {mode:>10} {page_mb:>8.1f} {result['seconds']:>8.2f} "
+                      f"{result['mentors'] / result['seconds']:>10.0f} {result['peak_rss_mb']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
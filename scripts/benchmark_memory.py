@@ -0,0 +1,111 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from benchmark_extraction import peak_rss_mb
+from fake_openai_server import FakeOpenAIServer
+from load_test import configure_environment
+from synthetic_data import generate_keyword_sets, write_mentors_page
+
+DEFAULT_SIZES = [10000, 50000, 100000]
+MODES = ['in_memory', 'chunked']
+
+def run_mode(mode: str, size: int, keywords: list, workdir: str, environment: dict, queue):
+    """Runs extraction, scoring and merge in one fresh process and reports peak memory after each"""
+    os.chdir(workdir)
+    os.environ.update(environment)
+    if mode == 'chunked':
+        os.environ['ARTIFACT_FORMAT'] = 'npy'
+    html_path = f'mentors_{size}.html'
+    # The pipeline prints and logs per mentor progress, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        import evaluate_affinity
+        import extract_mentors
+        import merge_results
+        from mentor_records import records_frame
+        baseline_mb = peak_rss_mb()
+        start_time = time.time()
+        if mode == 'in_memory':
+            # The in-process pipeline: whole page tree, every mentor and result held at once
+            with open(html_path, 'r', encoding='utf-8') as f:
+                mentors_df = records_frame(extract_mentors.process_mentors_page(f.read(), 'mentors.csv'))
+            extract_mb = peak_rss_mb()
+            results = evaluate_affinity.evaluate(mentors_df, keywords, output_file='affinity_scores.json')
+            score_mb = peak_rss_mb()
+            merge_results.process_results(mentors_df, results)
+        else:
+            extract_mentors.extract_mentors_streaming(html_path, 'mentors.csv')
+            extract_mb = peak_rss_mb()
+            evaluate_affinity.evaluate_chunked(evaluate_affinity.load_mentor_chunks(), keywords,
+                                               output_file='affinity_scores.json')
+            score_mb = peak_rss_mb()
+            merge_results.process_results(*merge_results.load_data())
+    queue.put({
+        'mode': mode,
+        'mentors': size,
+        'seconds': time.time() - start_time,
+        'baseline_rss_mb': baseline_mb,
+        'extract_peak_mb': extract_mb,
+        'score_peak_mb': score_mb,
+        'merge_peak_mb': peak_rss_mb()
+    })
+
+def measure(mode: str, size: int, keywords: list, workdir: str) -> dict:
+    # Spawned children start from a clean interpreter, so peaks are comparable
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_mode, args=(mode, size, keywords, workdir, dict(os.environ), queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of in-memory vs chunked mentor processing "
+                                                 "as the directory grows")
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES, help="Mentors per synthetic page")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="MENTOR_CHUNK_SIZE of the chunked mode")
+    parser.add_argument('--keywords', type=int, default=3, help="Keywords each mentor is scored against")
+    parser.add_argument('--contexts-per-request', type=int, default=50, help="CONTEXTS_PER_REQUEST")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    fake_server = FakeOpenAIServer(latency=0.0).start()
+    configure_environment(fake_server.base_url)
+    # Every run starts cold and scores every mentor
+    os.environ.update({
+        'AFFINITY_CACHE_FILE': '', 'AFFINITY_CHECKPOINT_FILE': '', 'INCREMENTAL_AFFINITY': 'false',
+        'PREFILTER_TOP_K': '0', 'MENTOR_INDEX_DIR': '', 'MENTORS_DIFF_FILE': '', 'TRACE_FILE': '',
+        'AFFINITY_MODE': 'sync', 'ARTIFACT_FORMAT': 'csv', 'MAX_CONCURRENCY_AFFINITY': '4',
+        'CONTEXTS_PER_REQUEST': str(args.contexts_per_request), 'PROMPT_TOKEN_BUDGET_AFFINITY': '100000',
+        'MENTOR_CHUNK_SIZE': str(args.chunk_size)
+    })
+    keywords = generate_keyword_sets(1, args.keywords, args.keywords)[0]
+
+    print(f"{'mentors':>8} {'mode':>10} {'seconds':>8} {'extract MB':>11} {'score MB':>9} {'merge MB':>9} "
+          f"{'KB/mentor':>10}")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            write_mentors_page(os.path.join(workdir, f'mentors_{size}.html'), size)
+            for mode in args.modes:
+                result = measure(mode, size, keywords, workdir)
+                results.append(result)
+                # Memory above the interpreter and imports, per mentor, up to the end of scoring
+                per_mentor_kb = (result['score_peak_mb'] - result['baseline_rss_mb']) * 1024 / size
+                print(f"{size:>8} {mode:>10} {result['seconds']:>8.1f} {result['extract_peak_mb']:>11.1f} "
+                      f"{result['score_peak_mb']:>9.1f} {result['merge_peak_mb']:>9.1f} {per_mentor_kb:>10.2f}")
+
+    fake_server.shutdown()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import threading
+from typing import List
+
+class CheckpointLog:
+    """
+    Append-only JSONL log of mentors whose affinity evaluation has finished
+
+    Each line is written and flushed to disk as soon as a mentor completes, so
+    an interrupted run loses at most the requests that were in flight. Lines
+    record the model and the mentor context hash, so a resumed run only reuses
+    scores computed for the same model, keywords and mentor text. A signature
+    of everything else a score depends on (temperature, prompt and sample
+    count) is recorded too, so changing any of them starts over.
+    """
+
+    def __init__(self, path: str = 'affinity_checkpoint.jsonl'):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def context_hash(context: str) -> str:
+        return hashlib.sha1(context.encode('utf-8')).hexdigest()
+
+    def load(self, model: str, keywords: List[str], signature: str = '') -> dict:
+        """
+        Reads finished mentors that match model and signature and cover every keyword
+
+        Returns:
+            dict: {(mentor_name, context_hash): (affinities, variance, samples)}
+        """
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave the last line half written
+                    continue
+                if entry.get('model') != model or entry.get('signature', '') != signature:
+                    continue
+                affinities = entry.get('affinities', {})
+                variance = entry.get('variance') or {}
+                samples = entry.get('samples') or {}
+                if all(keyword in affinities for keyword in keywords):
+                    done[(entry['mentor_name'], entry['context_hash'])] = (
+                        {keyword: affinities[keyword] for keyword in keywords},
+                        {keyword: variance[keyword] for keyword in keywords if keyword in variance},
+                        {keyword: samples[keyword] for keyword in keywords if keyword in samples}
+                    )
+        return done
+
+    def append(self, mentor_name: str, context: str, model: str, affinities: dict, signature: str = '',
+               variance: dict = None, samples: dict = None):
+        """Writes one finished mentor and forces it to disk"""
+        entry = {
+            'mentor_name': mentor_name,
+            'context_hash': self.context_hash(context),
+            'model': model,
+            'signature': signature,
+            'affinities': affinities
+        }
+        if variance:
+            entry['variance'] = variance
+        if samples:
+            entry['samples'] = samples
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def reset(self):
+        """Starts a fresh log"""
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
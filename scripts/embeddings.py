@@ -0,0 +1,121 @@
+import hashlib
+import math
+import re
+from typing import List
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9+#]+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases text and splits it into word tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class HashedTfidfEmbedder:
+    """
+    Local, deterministic embeddings built from hashed word unigrams and bigrams
+
+    Terms are hashed into a fixed number of buckets, weighted by sublinear term
+    frequency and, once fit() has seen a corpus, by inverse document frequency.
+    Needs no network access, so it works offline and in tests.
+    """
+
+    name = 'tfidf'
+
+    def __init__(self, dimensions: int = 2048):
+        self.dimensions = dimensions
+        self.idf = None
+
+    def _bucket(self, term: str) -> int:
+        # Python's hash() is salted per process, md5 keeps vectors reproducible
+        digest = hashlib.md5(term.encode('utf-8')).digest()
+        return int.from_bytes(digest[:4], 'little') % self.dimensions
+
+    def _term_counts(self, text: str) -> dict:
+        tokens = tokenize(text)
+        terms = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        counts = {}
+        for term in terms:
+            bucket = self._bucket(term)
+            counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    def fit(self, texts: List[str]):
+        """Learns inverse document frequencies from the corpus"""
+        document_frequency = np.zeros(self.dimensions, dtype=np.float32)
+        for text in texts:
+            for bucket in self._term_counts(text):
+                document_frequency[bucket] += 1
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        return self
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Returns one L2-normalised row per text"""
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for bucket, count in self._term_counts(text).items():
+                vectors[i, bucket] = 1 + math.log(count)
+        if self.idf is not None:
+            vectors *= self.idf
+        return normalize_rows(vectors)
+
+class OpenAIEmbedder:
+    """Embeddings from the OpenAI embeddings endpoint, requested in batches"""
+
+    name = 'openai'
+
+    def __init__(self, client, model: str = 'text-embedding-3-small', batch_size: int = 256):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+
+    def fit(self, texts: List[str]):
+        return self
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(
+                model=self.model,
+                input=texts[start:start + self.batch_size]
+            )
+            rows.extend(item.embedding for item in response.data)
+        return normalize_rows(np.asarray(rows, dtype=np.float32).reshape(len(texts), -1))
+
+def get_embedder(backend: str, client=None, model: str = 'text-embedding-3-small', dimensions: int = 2048):
+    """Creates the embedding backend selected by name ('tfidf' or 'openai')"""
+    if backend == 'tfidf':
+        return HashedTfidfEmbedder(dimensions)
+    if backend == 'openai':
+        if client is None:
+            raise Exception("The 'openai' embedding backend needs an OpenAI client")
+        return OpenAIEmbedder(client, model)
+    raise Exception(f"Unknown embedding backend: {backend}")
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scales every row to unit length, leaving all-zero rows untouched"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+def cosine_similarity_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Cosine similarity between every row of a and every row of b"""
+    return normalize_rows(a) @ normalize_rows(b).T
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indexes of the top_k highest scores, best first"""
+    if top_k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def shortlist(contexts: List[str], keywords: List[str], embedder, top_k: int):
+    """
+    Ranks contexts by their mean cosine similarity to the keywords
+
+    Returns:
+        tuple: (indexes of the top_k contexts best first, relevance of every context)
+    """
+    embedder.fit(contexts)
+    similarity = cosine_similarity_matrix(embedder.embed(contexts), embedder.embed(keywords))
+    relevance = similarity.mean(axis=1)
+    return top_k_indices(relevance, top_k), relevance
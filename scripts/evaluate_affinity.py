@@ -1,27 +1,73 @@
 import pandas as pd
 import json
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
-from prompts import AFFINITY_EVALUATION_PROMPT
+from prompt_builder import (AFFINITY_RESPONSE_FORMAT, build_messages, cache_template, context_line, count_tokens,
+                            prepare_context, prompt_tokens)
+from affinity_cache import AffinityCache
+from checkpoint import CheckpointLog
+from affinity_parser import AFFINITY_RESPONSE_SCHEMA, PARSE_STATS, parse_affinity_response
+from openai_client import setup_client
+from tracing import TRACER
+import storage
+from embeddings import get_embedder, shortlist
+from mentor_records import records_from_frame
+from score_sampling import RESAMPLE_SAMPLES, consensus_score, resample_uncertain, sampling_signature, score_variance
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
 import sys
 
 # Load environment variables
 load_dotenv()
 
 MAX_RETRIES = int(os.getenv('MAX_RETRIES_AFFINITY', '3'))
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY_AFFINITY', '1'))
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT_AFFINITY', '60'))
+CONTEXTS_PER_REQUEST = int(os.getenv('CONTEXTS_PER_REQUEST', '1'))
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET_AFFINITY', '3000'))
+AFFINITY_CACHE_FILE = os.getenv('AFFINITY_CACHE_FILE', 'affinity_cache.sqlite')
+AFFINITY_CACHE_MAX_ENTRIES = int(os.getenv('AFFINITY_CACHE_MAX_ENTRIES', '200000'))
+PREFILTER_TOP_K = int(os.getenv('PREFILTER_TOP_K', '0'))
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'tfidf')
+MODEL_EMBEDDING = os.getenv('MODEL_EMBEDDING', 'text-embedding-3-small')
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '2048'))
+MENTOR_INDEX_DIR = os.getenv('MENTOR_INDEX_DIR', '')
+AFFINITY_CHECKPOINT_FILE = os.getenv('AFFINITY_CHECKPOINT_FILE', 'affinity_checkpoint.jsonl')
+RESUME_AFFINITY = os.getenv('RESUME_AFFINITY', 'true').lower() == 'true'
+INCREMENTAL_AFFINITY = os.getenv('INCREMENTAL_AFFINITY', 'true').lower() == 'true'
+AFFINITY_MODE = os.getenv('AFFINITY_MODE', 'sync')
+AFFINITY_MODES = ('sync', 'batch', 'lexical')
+PREFILTER_METHOD = os.getenv('PREFILTER_METHOD', 'embeddings')
+PROGRESSIVE_TOP_K = int(os.getenv('PROGRESSIVE_TOP_K', '0'))
+AFFINITY_SAMPLES = int(os.getenv('AFFINITY_SAMPLES', '1'))
+AFFINITY_SAMPLING = os.getenv('AFFINITY_SAMPLING', 'n')
+MENTOR_CHUNK_SIZE = int(os.getenv('MENTOR_CHUNK_SIZE', '0'))
 
 def setup_openai():
-    """Configure OpenAI client"""
-    return OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    """Configure OpenAI client, rate limited and sized for MAX_CONCURRENCY"""
+    return setup_client(MAX_CONCURRENCY)
+
+# Location is not used for scoring, so it is not read from the columnar table
+SCORING_COLUMNS = ['mentor_id', 'name', 'position', 'description', 'content_hash']
 
 def load_data(keywords_file='extracted_keywords.json'):
     """Loads mentors data and keywords"""
-    # Read mentors CSV
-    mentors_df = pd.read_csv('mentors.csv')
+    if storage.columnar_enabled() and storage.mentors_table_exists():
+        mentors_df = storage.load_mentors_table(SCORING_COLUMNS)
+    else:
+        # Read mentors CSV
+        mentors_df = pd.read_csv('mentors.csv')
     
-    # Read keywords from file generated by extract_keywords.py
+    return mentors_df, load_keywords(keywords_file)
+
+def load_mentor_chunks(chunk_size: int = MENTOR_CHUNK_SIZE):
+    """Mentors chunk_size at a time, from the same source load_data reads"""
+    if storage.columnar_enabled() and storage.mentors_table_exists():
+        return storage.iter_mentors_table(chunk_size, SCORING_COLUMNS)
+    return pd.read_csv('mentors.csv', chunksize=chunk_size)
+
+def load_keywords(keywords_file='extracted_keywords.json'):
+    """Reads the keywords generated by extract_keywords.py"""
     try:
         with open(keywords_file, 'r') as f:
             keywords = json.load(f)
@@ -29,88 +75,721 @@ def load_data(keywords_file='extracted_keywords.json'):
         raise Exception(f"Keywords file '{keywords_file}' not found. Please run extract_keywords.py first.")
     except json.JSONDecodeError:
         raise Exception(f"Invalid JSON format in '{keywords_file}'")
-    
-    return mentors_df, keywords
+    return keywords
 
 def create_context(row):
     """Creates context by combining position and description"""
     return f"{row['position']} - {row['description']}"
 
-def get_affinity_scores(context: str, keywords: List[str], client):
-    """Obtiene puntuaciones de afinidad de forma síncrona"""
-    for attempt in range(MAX_RETRIES):
-        try:
-            contexts_formatted = "\n".join([f"Context {i+1}: {ctx}" for i, ctx in enumerate([context])])
-            
-            prompt = f"""Evaluate the relationship between each keyword and the provided contexts, assigning an affinity score between 1 and 100 for each combination.
+def mentor_result(row, affinities, variance=None, samples=None):
+    """Result entry of one mentor, with its ID and content hash when mentors.csv has them"""
+    result = {'mentor_name': row['name'], 'affinities': affinities}
+    if variance:
+        result['variance'] = variance
+    if samples:
+        result['samples'] = samples
+    if 'mentor_id' in row and pd.notna(row['mentor_id']):
+        result['mentor_id'] = int(row['mentor_id'])
+        result['content_hash'] = row['content_hash']
+    result['model'] = os.getenv('MODEL_AFFINITY')
+    return result
 
-Keywords: {keywords}
+def row_key(row):
+    """Identifies a mentor row: by mentor_id when mentors.csv has one, by name otherwise"""
+    if 'mentor_id' in row and pd.notna(row['mentor_id']):
+        return int(row['mentor_id'])
+    return row['name']
 
-{contexts_formatted}
+def result_key(result):
+    """Identifies the mentor of a result the same way row_key does"""
+    return result.get('mentor_id', result['mentor_name'])
 
-Return ONLY a list of lists with numbers, where each sublist contains the affinity scores for one context, in the same order as the keywords. 
-Example format: [[80, 45, 90], [70, 65, 85], [55, 95, 75]]"""
+def relevance_method() -> str:
+    """How prefilter_mentors ranks mentors, for messages"""
+    if PREFILTER_METHOD == 'lexical':
+        return 'BM25 keyword matching'
+    return f"{EMBEDDING_BACKEND} embeddings"
 
-            response = client.chat.completions.create(
-                model=os.getenv('MODEL_AFFINITY'),
-                messages=[
-                    {"role": "system", "content": AFFINITY_EVALUATION_PROMPT["system"]},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=float(os.getenv('TEMPERATURE_AFFINITY'))
-            )
-            
-            content = response.choices[0].message.content.strip()
-            content = content.replace('```', '').strip()
-            
-            scores = eval(content)
-            return scores[0]
-            
-        except Exception as e:
-            if attempt == MAX_RETRIES - 1:
-                print(f"Final attempt failed with error: {str(e)}")
-                raise
-            print(f"Attempt {attempt + 1} failed with error: {str(e)}, retrying...")
-            continue
+def prefilter_mentors(mentors_df, keywords, client=None, top_k: int = PREFILTER_TOP_K, ranked: bool = False):
+    """
+    Keeps the top_k mentors whose context embeddings are closest to the keywords
+    
+    Similarities for all mentors and keywords come from a single matrix product,
+    so this costs far less than scoring every mentor with the chat model. With
+    MENTOR_INDEX_DIR set, mentor vectors come from the persistent index and only
+    new or edited mentors are embedded. PREFILTER_METHOD=lexical ranks mentors
+    by their BM25 keyword scores instead.
+    
+    With ranked=True the mentors come back most relevant first (all of them
+    when top_k is 0) instead of in their original order.
+    """
+    shortlisting = 0 < top_k < len(mentors_df)
+    if not shortlisting and not ranked:
+        return mentors_df
+    limit = top_k if shortlisting else len(mentors_df)
+    
+    if PREFILTER_METHOD == 'lexical':
+        # Imported here because lexical_scoring builds on create_context from this module
+        from lexical_scoring import lexical_shortlist
+        contexts = [create_context(row) for row in records_from_frame(mentors_df)]
+        indexes, _ = lexical_shortlist(contexts, keywords, limit)
+    else:
+        embedder = get_embedder(EMBEDDING_BACKEND, client, MODEL_EMBEDDING, EMBEDDING_DIMENSIONS)
+        if MENTOR_INDEX_DIR:
+            # Imported here because mentor_index builds on create_context from this module
+            from mentor_index import MentorIndex
+            index = MentorIndex(MENTOR_INDEX_DIR)
+            index.update(records_from_frame(mentors_df.fillna('')), embedder)
+            indexes, _ = index.query(keywords, embedder, limit)
+        else:
+            contexts = [create_context(row) for row in records_from_frame(mentors_df)]
+            indexes, _ = shortlist(contexts, keywords, embedder, limit)
+    
+    if shortlisting:
+        print(f"\nPrefilter kept {len(indexes)} of {len(mentors_df)} mentors using {relevance_method()}")
+    return mentors_df.iloc[list(indexes) if ranked else sorted(indexes)]
 
-def process_batch(batch_df, keywords, client):
-    """Procesa un lote de mentores de forma síncrona"""
-    results = []
-    for _, row in batch_df.iterrows():
+def pack_contexts(contexts: List[str], keywords: List[str],
+                  max_contexts: int = CONTEXTS_PER_REQUEST,
+                  token_budget: int = PROMPT_TOKEN_BUDGET) -> List[List[int]]:
+    """
+    Groups contexts into packs that fit in a single affinity prompt
+    
+    Args:
+        contexts: Mentor contexts to score
+        keywords: Keywords every context is scored against
+        max_contexts: Maximum number of contexts per request
+        token_budget: Maximum prompt plus estimated answer tokens per request
+        
+    Returns:
+        list: Packs of indexes into contexts, in their original order
+    """
+    base_tokens = prompt_tokens([], keywords)
+    # Every context adds its own line plus one row of scores to the answer
+    answer_tokens = 4 * len(keywords) + 2
+    
+    packs, current, used = [], [], base_tokens
+    for i, context in enumerate(contexts):
+        cost = count_tokens(context_line(len(current) + 1, context)) + 1 + answer_tokens
+        if current and (len(current) >= max_contexts or used + cost > token_budget):
+            packs.append(current)
+            current, used = [], base_tokens
+        current.append(i)
+        used += cost
+    if current:
+        packs.append(current)
+    
+    return packs
+
+def request_options() -> dict:
+    """Extra chat completion options for AFFINITY_RESPONSE_FORMAT"""
+    if AFFINITY_RESPONSE_FORMAT == 'json_schema':
+        return {'response_format': {'type': 'json_schema', 'json_schema': AFFINITY_RESPONSE_SCHEMA}}
+    return {}
+
+def affinity_request(contexts: List[str], keywords: List[str], samples: int = 1) -> dict:
+    """Chat completion arguments scoring contexts against keywords, shared by the sync and batch paths"""
+    request = {
+        'model': os.getenv('MODEL_AFFINITY'),
+        'messages': build_messages(contexts, keywords),
+        'temperature': float(os.getenv('TEMPERATURE_AFFINITY')),
+        **request_options()
+    }
+    if samples > 1:
+        request['n'] = samples
+    return request
+
+def request_answers(contexts: List[str], keywords: List[str], client, samples: int, timeout: float) -> List[str]:
+    """
+    Requests samples answers for one prompt
+    
+    With AFFINITY_SAMPLING=n a single request asks for every answer through
+    the n parameter, so the prompt is only billed once. AFFINITY_SAMPLING=requests
+    sends samples identical requests at the same time instead, for servers
+    without n support.
+    """
+    if samples > 1 and AFFINITY_SAMPLING == 'requests':
+        with ThreadPoolExecutor(max_workers=samples) as executor:
+            responses = list(executor.map(TRACER.bind(
+                lambda _: client.chat.completions.create(**affinity_request(contexts, keywords), timeout=timeout)),
+                range(samples)))
+    else:
+        responses = [client.chat.completions.create(**affinity_request(contexts, keywords, samples), timeout=timeout)]
+    return [choice.message.content or '' for response in responses for choice in response.choices]
+
+def get_affinity_samples(contexts: List[str], keywords: List[str], client, samples: int = AFFINITY_SAMPLES,
+                         timeout: float = REQUEST_TIMEOUT):
+    """
+    Scores several contexts against the keywords in a single prompt, sampling every answer samples times
+    
+    Every answer is parsed row by row: valid rows are kept and only the
+    contexts without a single valid row are requested again. When nothing in
+    a multi-context prompt can be used, the pack is split in two instead.
+    API errors are not retried here, the client already retries them with
+    backoff: a failed re-request keeps the rows parsed so far.
+    
+    Returns:
+        list: One list of sampled score rows per context, in the order of
+        contexts, empty for contexts still malformed after MAX_RETRIES
+    """
+    sampled = [[] for _ in contexts]
+    pending = list(range(len(contexts)))
+    for attempt in range(MAX_RETRIES):
         try:
-            context = create_context(row)
-            scores = get_affinity_scores(context, keywords, client)
-            mentor_result = {
-                'mentor_name': row['name'],
-                'affinities': dict(zip(keywords, scores))
-            }
-            results.append(mentor_result)
-            print(f"Processed mentor: {row['name']}")
+            answers = request_answers([contexts[i] for i in pending], keywords, client, samples, timeout)
         except Exception as e:
+            PARSE_STATS.record_api_error()
+            if not any(sampled):
+                raise
+            print(f"Re-request of {len(pending)} contexts failed with error: {str(e)}, keeping the rows already parsed")
+            break
+        
+        parsed = [parse_affinity_response(answer, len(pending), len(keywords)) for answer in answers]
+        for rows, _ in parsed:
+            for i, row in zip(pending, rows):
+                if row is not None:
+                    sampled[i].append(row)
+        failed = [i for i in pending if not sampled[i]]
+        split = len(failed) == len(pending) > 1
+        retry = bool(failed) and (split or attempt < MAX_RETRIES - 1)
+        failures = [reason for _, answer_failures in parsed for reason in answer_failures]
+        for n, (_, answer_failures) in enumerate(parsed):
+            # Contexts requested again are counted once, against the first answer
+            PARSE_STATS.record_response(len(pending), answer_failures, len(failed) if retry and n == 0 else 0)
+        if not failed:
+            return sampled
+        
+        reasons = ', '.join(sorted(set(failures)))
+        if split:
+            middle = len(pending) // 2
+            print(f"Malformed scores ({reasons}) for {len(pending)} contexts, splitting into {middle} + {len(pending) - middle}")
+            for half in (pending[:middle], pending[middle:]):
+                try:
+                    half_sampled = get_affinity_samples([contexts[i] for i in half], keywords, client, samples, timeout)
+                except Exception as e:
+                    print(f"Error scoring {len(half)} contexts: {str(e)}")
+                    continue
+                for i, rows in zip(half, half_sampled):
+                    sampled[i] = rows
+            break
+        
+        if attempt < MAX_RETRIES - 1:
+            print(f"Attempt {attempt + 1}: malformed scores ({reasons}) for {len(failed)} of {len(pending)} contexts, "
+                  f"re-requesting only those")
+        pending = failed
+    
+    if not any(sampled):
+        raise Exception("Maximum retries reached. Could not get valid affinity scores.")
+    return sampled
+
+def get_affinity_matrix(contexts: List[str], keywords: List[str], client, timeout: float = REQUEST_TIMEOUT):
+    """
+    Scores several contexts against the keywords in a single prompt
+    
+    Returns:
+        list: One list of scores per context, in the order of contexts, or
+        None for contexts still malformed after MAX_RETRIES
+    """
+    return [rows[0] if rows else None for rows in get_affinity_samples(contexts, keywords, client, 1, timeout)]
+
+def get_affinity_scores(context: str, keywords: List[str], client, timeout: float = REQUEST_TIMEOUT):
+    """Obtiene puntuaciones de afinidad de forma síncrona"""
+    return get_affinity_matrix([context], keywords, client, timeout)[0]
+
+def setup_cache():
+    """Opens the affinity score cache, or returns None when AFFINITY_CACHE_FILE is empty"""
+    if not AFFINITY_CACHE_FILE:
+        return None
+    return AffinityCache(AFFINITY_CACHE_FILE, AFFINITY_CACHE_MAX_ENTRIES)
+
+def cache_key(context: str, keyword: str, samples: int = AFFINITY_SAMPLES) -> str:
+    """Cache key of a (context, keyword) score under the current model and prompt, from samples samples"""
+    return AffinityCache.make_key(
+        os.getenv('MODEL_AFFINITY'), float(os.getenv('TEMPERATURE_AFFINITY')),
+        cache_template() + sampling_signature(samples), prepare_context(context), keyword
+    )
+
+def scoring_signature() -> str:
+    """Hash of the temperature, prompt and sample count scores are computed with, for checkpoints and batches"""
+    signature = (repr(float(os.getenv('TEMPERATURE_AFFINITY'))) + '|' + cache_template()
+                 + sampling_signature(AFFINITY_SAMPLES))
+    return CheckpointLog.context_hash(signature)
+
+def checkpoint_writer(checkpoint):
+    """on_result callback appending every finished mentor to checkpoint"""
+    model, signature = os.getenv('MODEL_AFFINITY'), scoring_signature()
+    
+    def on_result(row, context, result):
+        checkpoint.append(result['mentor_name'], context, model, result['affinities'], signature,
+                          result.get('variance'), result.get('samples'))
+    return on_result
+
+def cache_matrix(cache, contexts, keywords, matrix, samples: int = AFFINITY_SAMPLES):
+    """Stores the valid rows of a score matrix, consensus scores of samples samples, in the cache"""
+    if cache is not None:
+        cache.put_many({
+            cache_key(context, keyword, samples): score
+            for context, scores in zip(contexts, matrix) if scores is not None
+            for keyword, score in zip(keywords, scores)
+        })
+
+def evaluate_pack(rows, contexts, keywords, client, cache=None, samples: int = AFFINITY_SAMPLES):
+    """
+    Evaluates a pack of mentor rows with one prompt, sampling it samples times
+    
+    The consensus of the samples (see score_sampling) is what gets cached.
+    
+    Returns:
+        list: One {keyword: sampled scores} dict per row (empty for rows
+        without valid scores), or an empty list if the whole pack failed
+    """
+    try:
+        with TRACER.span('affinity.pack', mentors=len(rows), keywords=len(keywords), samples=samples):
+            sampled = get_affinity_samples(contexts, keywords, client, samples)
+    except Exception as e:
+        for row in rows:
             print(f"Error processing mentor {row['name']}: {str(e)}")
+        return []
     
-    return results
+    pack_samples = [{keyword: [row[column] for row in sample_rows] for column, keyword in enumerate(keywords)}
+                    if sample_rows else {} for sample_rows in sampled]
+    cache_matrix(cache, contexts, keywords, [
+        [consensus_score(scores[keyword]) for keyword in keywords] if scores else None for scores in pack_samples
+    ], samples)
+    
+    for row, scores in zip(rows, pack_samples):
+        if not scores:
+            print(f"Error processing mentor {row['name']}: no valid scores after {MAX_RETRIES} attempts")
+        else:
+            print(f"Processed mentor: {row['name']}")
+    return pack_samples
 
-def main():
+def plan_packs(contexts, keywords, cache=None):
+    """
+    Looks up cached scores and packs the contexts that still miss some into prompts
+    
+    Contexts missing the same keywords are grouped, so they can share a prompt.
+    
+    Returns:
+        tuple: (one {keyword: score} dict of cached scores per context,
+        list of (context indexes, keywords to request) packs)
+    """
+    affinities = [{} for _ in contexts]
+    
+    if cache is not None:
+        cached = cache.get_many(cache_key(context, keyword) for context in contexts for keyword in keywords)
+        for i, context in enumerate(contexts):
+            for keyword in keywords:
+                key = cache_key(context, keyword)
+                if key in cached:
+                    affinities[i][keyword] = cached[key]
+    
+    groups = {}
+    for i in range(len(contexts)):
+        missing = tuple(keyword for keyword in keywords if keyword not in affinities[i])
+        if missing:
+            groups.setdefault(missing, []).append(i)
+    
+    tasks = []
+    for missing, indexes in groups.items():
+        group_contexts = [contexts[i] for i in indexes]
+        for pack in pack_contexts(group_contexts, list(missing)):
+            tasks.append(([indexes[j] for j in pack], list(missing)))
+    
+    return affinities, tasks
+
+def score_mentors(mentors_df, keywords, client, cache=None, max_concurrency: int = 1, on_result=None,
+                  sample_log=None):
+    """
+    Scores every mentor against keywords, only requesting pairs missing from the cache
+    
+    Mentors are grouped by the keywords they still need, each group is packed
+    into prompts and the packs run on up to max_concurrency worker threads.
+    on_result(row, context, result) is called as soon as each mentor is complete.
+    With AFFINITY_SAMPLES above 1 every score is the consensus of its samples,
+    the result also has the variance and the sample count of every sampled
+    pair and the samples are recorded in sample_log ({context: {keyword:
+    samples}}) when given.
+    
+    Returns:
+        list: Mentor results in the order of mentors_df, skipping failed mentors
+    """
+    rows = records_from_frame(mentors_df)
+    contexts = [create_context(row) for row in rows]
+    affinities, tasks = plan_packs(contexts, keywords, cache)
+    variances = [{} for _ in rows]
+    # Cached scores are consensus scores of AFFINITY_SAMPLES samples
+    counts = [dict.fromkeys(cached, AFFINITY_SAMPLES) if AFFINITY_SAMPLES > 1 else {} for cached in affinities]
+    
+    def result(i):
+        return mentor_result(rows[i], {keyword: affinities[i][keyword] for keyword in keywords},
+                             {keyword: variances[i][keyword] for keyword in keywords if keyword in variances[i]},
+                             {keyword: counts[i][keyword] for keyword in keywords if keyword in counts[i]})
+    
+    def run_task(task):
+        indexes, task_keywords = task
+        pack_samples = evaluate_pack([rows[i] for i in indexes], [contexts[i] for i in indexes],
+                                     task_keywords, client, cache)
+        # Every mentor belongs to a single task, so threads never share an entry
+        for i, samples in zip(indexes, pack_samples):
+            for keyword, scores in samples.items():
+                affinities[i][keyword] = consensus_score(scores)
+                if len(scores) > 1:
+                    variances[i][keyword] = score_variance(scores)
+                    counts[i][keyword] = len(scores)
+            if sample_log is not None and samples:
+                sample_log.setdefault(contexts[i], {}).update(samples)
+            if on_result is not None:
+                on_result(rows[i], contexts[i], result(i))
+    
+    if on_result is not None:
+        for i in range(len(rows)):
+            if len(affinities[i]) == len(keywords):
+                on_result(rows[i], contexts[i], result(i))
+    
+    if max_concurrency > 1:
+        executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        try:
+            list(executor.map(TRACER.bind(run_task), tasks))
+        finally:
+            # On Ctrl-C, drop the queued packs instead of paying for them
+            executor.shutdown(cancel_futures=True)
+    else:
+        for task in tasks:
+            run_task(task)
+    
+    return [result(i) for i in range(len(rows)) if len(affinities[i]) == len(keywords)]
+
+def process_batch(batch_df, keywords, client, cache=None, on_result=None, sample_log=None):
+    """Procesa un lote de mentores de forma síncrona"""
+    return score_mentors(batch_df, keywords, client, cache, on_result=on_result, sample_log=sample_log)
+
+def process_concurrently(mentors_df, keywords, client, cache=None, max_concurrency: int = MAX_CONCURRENCY,
+                         on_result=None, sample_log=None):
+    """
+    Evaluates mentors with at most max_concurrency requests in flight
+    
+    The client is shared between worker threads, so its connection pool is
+    reused. Results keep the order of mentors_df regardless of completion order.
+    """
+    return score_mentors(mentors_df, keywords, client, cache, max_concurrency, on_result, sample_log)
+
+def resume_from_checkpoint(mentors_df, keywords, checkpoint, done=None):
+    """
+    Splits mentors into those already finished in the checkpoint and those still pending
+    
+    done is what checkpoint.load returned, for callers resuming several
+    chunks from one read of the checkpoint.
+    
+    Returns:
+        tuple: ({row position: result} for finished mentors, DataFrame of pending mentors)
+    """
+    if done is None:
+        done = checkpoint.load(os.getenv('MODEL_AFFINITY'), keywords, scoring_signature())
+    finished = {}
+    for position, row in enumerate(records_from_frame(mentors_df)):
+        key = (row['name'], CheckpointLog.context_hash(create_context(row)))
+        if key in done:
+            finished[position] = mentor_result(row, *done[key])
+    
+    pending_positions = [p for p in range(len(mentors_df)) if p not in finished]
+    return finished, mentors_df.iloc[pending_positions]
+
+def in_mentor_order(mentors_df, finished, results):
+    """Puts finished results ({row position: result}) and new results back in the order of mentors_df"""
+    new_results = {result_key(result): result for result in results}
+    ordered = []
+    for position, row in enumerate(records_from_frame(mentors_df)):
+        if position in finished:
+            ordered.append(finished[position])
+        elif row_key(row) in new_results:
+            ordered.append(new_results[row_key(row)])
+    return ordered
+
+def print_parse_stats():
+    """Prints how many contexts needed another request and why their answers were rejected"""
+    stats = PARSE_STATS.stats()
+    if not stats['requests']:
+        return
+    print(f"Affinity answers: {stats['requests']} requests, {stats['contexts_requested']} contexts, "
+          f"{stats['parse_failure_rate']:.1%} malformed, {stats['retry_rate']:.1%} re-requested, "
+          f"{stats['api_errors']} failed requests")
+    if stats['failures']:
+        breakdown = ', '.join(f"{reason}: {count}" for reason, count in sorted(stats['failures'].items()))
+        print(f"Parse failures: {breakdown}")
+
+def load_previous_results(results_file, keywords=None):
+    """Results of the previous run, from the columnar scores or results_file, or [] if there are none"""
+    if not results_file:
+        return []
+    if storage.columnar_enabled():
+        scores = storage.load_scores(keywords, storage.results_artifact_directory(results_file))
+        return storage.scores_to_results(scores) if scores is not None else []
+    if not os.path.exists(results_file):
+        return []
     try:
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        mentors_df, keywords = load_data()
-        
-        results = []
-        batch_size = int(os.getenv('BATCH_SIZE', '10'))
+        with open(results_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return []
+
+def carry_forward(mentors_df, keywords, previous_results):
+    """
+    Reuses previous scores of mentors whose profile did not change
+    
+    A previous entry is reused when its mentor_id and content_hash match the
+    mentor, it was scored by the same model and it covers every keyword.
+    Added and changed mentors (see mentors_diff.json) never match, so they
+    are the only ones left to score. Variances and sample counts of sampled
+    scores are kept too.
+    
+    Returns:
+        dict: {row position: result} for the mentors carried forward
+    """
+    if 'mentor_id' not in mentors_df.columns:
+        return {}
+    model = os.getenv('MODEL_AFFINITY')
+    previous = {
+        (entry['mentor_id'], entry['content_hash']): entry
+        for entry in previous_results
+        if 'mentor_id' in entry and entry.get('model') == model
+    }
+    
+    carried = {}
+    for position, row in enumerate(records_from_frame(mentors_df)):
+        if pd.isna(row['mentor_id']):
+            continue
+        entry = previous.get((int(row['mentor_id']), row['content_hash']))
+        if entry is not None and all(keyword in entry['affinities'] for keyword in keywords):
+            variance, samples = entry.get('variance') or {}, entry.get('samples') or {}
+            carried[position] = mentor_result(row, {keyword: entry['affinities'][keyword] for keyword in keywords},
+                                              {keyword: variance[keyword] for keyword in keywords if keyword in variance},
+                                              {keyword: samples[keyword] for keyword in keywords if keyword in samples})
+    return carried
+
+def check_settings():
+    if AFFINITY_MODE not in AFFINITY_MODES:
+        raise Exception(f"Unknown AFFINITY_MODE '{AFFINITY_MODE}', use sync, batch or lexical")
+    if AFFINITY_SAMPLING not in ('n', 'requests'):
+        raise Exception(f"Unknown AFFINITY_SAMPLING '{AFFINITY_SAMPLING}', use n or requests")
+
+@TRACER.stage('evaluate_affinity')
+def evaluate(mentors_df, keywords, client=None, output_file='affinity_scores.json'):
+    """
+    Runs the whole affinity stage on mentors already in memory
+    
+    Args:
+        mentors_df: Mentors to score
+        keywords: Keywords to score them against
+        client: OpenAI client, created if not given
+        output_file: JSON file for the results, or None to skip saving. With a
+            columnar ARTIFACT_FORMAT the score matrix is saved instead, in
+            storage.results_artifact_directory(output_file)
         
-        for i in range(0, len(mentors_df), batch_size):
-            batch_df = mentors_df.iloc[i:i+batch_size]
-            print(f"\nProcessing batch of mentors {i+1}-{min(i+batch_size, len(mentors_df))}")
+    Returns:
+        list: One {'mentor_name', 'affinities'} result per scored mentor
+    """
+    check_settings()
+    # Lexical scores are computed locally and never mixed with cached, checkpointed or previous model scores
+    lexical = AFFINITY_MODE == 'lexical'
+    # Only synchronous scoring returns results while it runs
+    progressive = PROGRESSIVE_TOP_K > 0 and AFFINITY_MODE == 'sync'
+    if client is None and not lexical:
+        client = setup_openai()
+    with TRACER.span('prefilter', candidates=len(mentors_df)):
+        mentors_df = prefilter_mentors(mentors_df, keywords, client, ranked=progressive)
+    TRACER.annotate(mentors=len(mentors_df), keywords=len(keywords))
+    cache = setup_cache() if not lexical else None
+    
+    finished = {}
+    if INCREMENTAL_AFFINITY and output_file and not lexical:
+        finished = carry_forward(mentors_df, keywords, load_previous_results(output_file, keywords))
+        if finished:
+            print(f"\nIncremental: {len(finished)} unchanged mentors keep their previous scores, "
+                  f"{len(mentors_df) - len(finished)} added or changed")
+    
+    on_result = None
+    if AFFINITY_CHECKPOINT_FILE and not lexical:
+        checkpoint = CheckpointLog(AFFINITY_CHECKPOINT_FILE)
+        if RESUME_AFFINITY:
+            resumed, _ = resume_from_checkpoint(mentors_df, keywords, checkpoint)
+            resumed = {position: result for position, result in resumed.items() if position not in finished}
+            finished.update(resumed)
+            if resumed:
+                print(f"\nResuming: {len(resumed)} mentors already scored, {len(mentors_df) - len(finished)} pending")
+        else:
+            checkpoint.reset()
+        on_result = checkpoint_writer(checkpoint)
+    
+    pending_df = mentors_df.iloc[[position for position in range(len(mentors_df)) if position not in finished]]
+    results = []
+    sample_log = {}
+    batch_size = int(os.getenv('BATCH_SIZE', '10'))
+    
+    if lexical:
+        from lexical_scoring import score_mentors_lexical
+        print(f"\nScoring {len(pending_df)} mentors locally with BM25 and fuzzy keyword matching")
+        results = score_mentors_lexical(pending_df, keywords)
+    elif AFFINITY_MODE == 'batch':
+        # Imported here because batch_scoring builds on the prompt and cache helpers of this module
+        from batch_scoring import score_mentors_batch
+        print(f"\nScoring {len(pending_df)} mentors with the Batch API")
+        results = score_mentors_batch(pending_df, keywords, client, cache, on_result=on_result)
+    elif progressive:
+        # Imported here because progressive_ranking builds on score_mentors from this module
+        from progressive_ranking import score_progressively
+        print(f"\nScoring {len(pending_df)} mentors most relevant first, keeping a running top {PROGRESSIVE_TOP_K}")
+        results = score_progressively(pending_df, keywords, client, cache, on_result, list(finished.values()),
+                                      sample_log=sample_log)
+    elif MAX_CONCURRENCY > 1:
+        print(f"\nProcessing {len(pending_df)} mentors with up to {MAX_CONCURRENCY} concurrent requests")
+        results = process_concurrently(pending_df, keywords, client, cache, on_result=on_result, sample_log=sample_log)
+    else:
+        for i in range(0, len(pending_df), batch_size):
+            batch_df = pending_df.iloc[i:i+batch_size]
+            print(f"\nProcessing batch of mentors {i+1}-{min(i+batch_size, len(pending_df))}")
             
-            batch_results = process_batch(batch_df, keywords, client)
+            batch_results = process_batch(batch_df, keywords, client, cache, on_result, sample_log)
             results.extend(batch_results)
-        
-        with open('affinity_scores.json', 'w', encoding='utf-8') as f:
+    
+    if finished:
+        # Put carried forward and resumed mentors back in the order of mentors_df
+        results = in_mentor_order(mentors_df, finished, results)
+    
+    if RESAMPLE_SAMPLES > 0 and not lexical:
+        resample_uncertain(mentors_df, keywords, results, client, sample_log, on_result)
+    
+    if output_file and storage.columnar_enabled():
+        model = results[0]['model'] if results else os.getenv('MODEL_AFFINITY')
+        artifact_directory = storage.results_artifact_directory(output_file)
+        storage.save_scores(storage.results_to_scores(results, keywords, model), artifact_directory)
+        output_file = storage.scores_directory(artifact_directory)
+    elif output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
+    
+    print("\nAffinity evaluation completed successfully!")
+    if output_file:
+        print(f"Results saved to {output_file}")
+    
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Score cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries")
+        cache.close()
+    print_parse_stats()
+    return results
+
+@TRACER.stage('evaluate_affinity')
+def evaluate_chunked(chunks, keywords, client=None, output_file='affinity_scores.json'):
+    """
+    Scores mentors one chunk at a time, for directories too large to hold in memory
+    
+    Each chunk is scored and its results written out before the next one is
+    read, so memory mostly follows the chunk size. What still grows with the
+    directory is small: with a columnar ARTIFACT_FORMAT the score matrix
+    (about 30 bytes per mentor plus 4 per keyword) is saved at the end, and a
+    resumed run holds the checkpoint entries it reads once at the start.
+    Mentors already in the checkpoint are not scored again when
+    RESUME_AFFINITY is set. Prefiltering, progressive ranking, resampling and
+    incremental carry forward need every mentor at once and are skipped; the
+    score cache still avoids paying twice for a score. In lexical mode, BM25
+    statistics come from each chunk.
+    
+    Args:
+        chunks: DataFrames of mentors, e.g. load_mentor_chunks()
+        keywords: Keywords to score them against
+        client: OpenAI client, created if not given
+        output_file: JSON file the results are streamed to, or None. With a
+            columnar ARTIFACT_FORMAT the score matrix is saved instead, in
+            storage.results_artifact_directory(output_file)
+        
+    Returns:
+        int: Number of mentors with scores, resumed ones included
+    """
+    check_settings()
+    lexical = AFFINITY_MODE == 'lexical'
+    if client is None and not lexical:
+        client = setup_openai()
+    cache = setup_cache() if not lexical else None
+    on_result = None
+    checkpoint, done = None, {}
+    if AFFINITY_CHECKPOINT_FILE and not lexical:
+        checkpoint = CheckpointLog(AFFINITY_CHECKPOINT_FILE)
+        if RESUME_AFFINITY:
+            # Read once, every chunk resumes from the same entries
+            done = checkpoint.load(os.getenv('MODEL_AFFINITY'), keywords, scoring_signature())
+        else:
+            checkpoint.reset()
+        on_result = checkpoint_writer(checkpoint)
+    
+    columnar = bool(output_file) and storage.columnar_enabled()
+    results_file = open(output_file, 'w', encoding='utf-8') if output_file and not columnar else None
+    score_parts = []
+    scored = resumed = read = 0
+    model = os.getenv('MODEL_AFFINITY')
+    try:
+        for n, chunk_df in enumerate(chunks, 1):
+            print(f"\nScoring chunk {n}: mentors {read + 1}-{read + len(chunk_df)}")
+            read += len(chunk_df)
+            finished, pending_df = {}, chunk_df
+            if done:
+                finished, pending_df = resume_from_checkpoint(chunk_df, keywords, checkpoint, done)
+                resumed += len(finished)
+            if lexical:
+                # Imported here because lexical_scoring builds on create_context from this module
+                from lexical_scoring import score_mentors_lexical
+                results = score_mentors_lexical(pending_df, keywords)
+            elif AFFINITY_MODE == 'batch':
+                # Imported here because batch_scoring builds on the prompt and cache helpers of this module
+                from batch_scoring import score_mentors_batch
+                results = score_mentors_batch(pending_df, keywords, client, cache, on_result=on_result)
+            else:
+                results = score_mentors(pending_df, keywords, client, cache, MAX_CONCURRENCY, on_result)
+            if finished:
+                results = in_mentor_order(chunk_df, finished, results)
+            # Contexts do not repeat across chunks, so their prepared forms need not be kept
+            prepare_context.cache_clear()
             
-        print("\nAffinity evaluation completed successfully!")
-        print("Results saved to affinity_scores.json")
+            if results:
+                model = results[0]['model']
+            if columnar:
+                score_parts.append(storage.results_to_scores(results, keywords, model))
+            elif results_file is not None:
+                # One result per line, the file is a JSON list like the one evaluate writes
+                for i, result in enumerate(results):
+                    results_file.write(('[\n' if scored + i == 0 else ',\n') + json.dumps(result, ensure_ascii=False))
+            scored += len(results)
+        
+        if results_file is not None:
+            results_file.write('\n]\n' if scored else '[]\n')
+    finally:
+        if results_file is not None:
+            results_file.close()
+        if cache is not None:
+            cache.close()
+    
+    TRACER.annotate(mentors=scored, keywords=len(keywords))
+    if columnar:
+        artifact_directory = storage.results_artifact_directory(output_file)
+        storage.save_scores(storage.concat_scores(score_parts, keywords, model), artifact_directory)
+        output_file = storage.scores_directory(artifact_directory)
+    if resumed:
+        print(f"\nResumed {resumed} mentors already in {AFFINITY_CHECKPOINT_FILE}")
+    print(f"\nAffinity evaluation completed successfully! {scored} mentors scored in chunks of up to {MENTOR_CHUNK_SIZE}")
+    if output_file:
+        print(f"Results saved to {output_file}")
+    print_parse_stats()
+    return scored
+
+def main():
+    try:
+        client = setup_openai() if AFFINITY_MODE != 'lexical' else None
+        if MENTOR_CHUNK_SIZE > 0:
+            evaluate_chunked(load_mentor_chunks(), load_keywords(), client)
+        else:
+            mentors_df, keywords = load_data()
+            evaluate(mentors_df, keywords, client)
         return True
             
     except Exception as e:
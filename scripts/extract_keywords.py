@@ -1,17 +1,53 @@
 from openai import OpenAI
 import os
+import re
 import json
+import threading
 from dotenv import load_dotenv
 from prompts import KEYWORD_EXTRACTION_PROMPT
+from openai_client import setup_client
+from keyword_cache import KeywordCache
+from tracing import TRACER
 
 # Load environment variables
 load_dotenv()
 
 MAX_RETRIES = int(os.getenv('MAX_RETRIES_KEYWORDS', '3')) 
+KEYWORD_CACHE_FILE = os.getenv('KEYWORD_CACHE_FILE', 'keyword_cache.json')
+KEYWORD_CACHE_SIMILARITY = float(os.getenv('KEYWORD_CACHE_SIMILARITY', '1.0'))
+KEYWORD_SYNONYMS_FILE = os.getenv('KEYWORD_SYNONYMS_FILE', '')
+
+# Abbreviations and variants merged into one spelling, so "ML" and
+# "machine learning" are scored once
+KEYWORD_SYNONYMS = {
+    'ml': 'machine learning',
+    'ai': 'artificial intelligence',
+    'nlp': 'natural language processing',
+    'llm': 'large language model',
+    'ux': 'user experience',
+    'ui': 'user interface',
+    'pm': 'product management',
+    'vc': 'venture capital',
+    'hr': 'human resources',
+    'seo': 'search engine optimization',
+    'js': 'javascript',
+    'k8s': 'kubernetes',
+    'fintech': 'financial technology',
+    'start-up': 'startup',
+    'e-commerce': 'ecommerce',
+}
+
+# Words whose trailing "s" is not a plural
+SINGULAR_EXCEPTIONS = {'sales', 'news', 'series', 'species', 'aws', 'kubernetes', 'saas', 'paas', 'iaas', 'windows'}
+# Endings of singular words and names that end in "s" (bias, pandas, devops, analytics, node.js)
+SINGULAR_ENDINGS = ('ss', 'us', 'is', 'as', 'os', 'ops', 'ics', 'js')
+
+_keyword_cache = None
+_keyword_cache_lock = threading.Lock()
 
 def setup_openai():
-    """Configure OpenAI client"""
-    return OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    """Configure OpenAI client with shared rate limiting and backoff"""
+    return setup_client(max_concurrency=1)
 
 def validate_keywords(keywords) -> bool:
     """
@@ -45,21 +81,105 @@ def validate_keywords(keywords) -> bool:
         print(f"Validation error: {str(e)}")
         return False
 
+def load_synonyms() -> dict:
+    """Built-in synonyms plus any from KEYWORD_SYNONYMS_FILE (a JSON object)"""
+    synonyms = dict(KEYWORD_SYNONYMS)
+    if KEYWORD_SYNONYMS_FILE and os.path.exists(KEYWORD_SYNONYMS_FILE):
+        with open(KEYWORD_SYNONYMS_FILE, 'r', encoding='utf-8') as f:
+            synonyms.update({k.casefold(): v.casefold() for k, v in json.load(f).items()})
+    return synonyms
+
+def singularize(word: str) -> str:
+    """Light rule-based lemmatization of English plurals"""
+    if len(word) <= 3 or word in SINGULAR_EXCEPTIONS or word.endswith(SINGULAR_ENDINGS):
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('sses', 'xes', 'ches', 'shes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+def canonicalize_keywords(keywords: list, synonyms: dict = None) -> list:
+    """
+    Case folds, lemmatizes and merges synonymous keywords, keeping the first of each
+    
+    Synonyms are applied to the whole keyword and to each of its words, so
+    "ML" and "ML engineers" become "machine learning" and
+    "machine learning engineer".
+    """
+    synonyms = load_synonyms() if synonyms is None else synonyms
+    canonical = []
+    for keyword in keywords:
+        text = re.sub(r'\s+', ' ', keyword.casefold()).strip(' .,;:!?"\'')
+        text = synonyms.get(text, text)
+        words = [synonyms.get(word, word) for word in text.split(' ')]
+        text = ' '.join(singularize(word) for word in ' '.join(words).split(' '))
+        text = synonyms.get(text, text)
+        if text and text not in canonical:
+            canonical.append(text)
+    return canonical
+
+def get_keyword_cache():
+    """Shared keyword cache, or None when KEYWORD_CACHE_FILE is empty"""
+    global _keyword_cache
+    if not KEYWORD_CACHE_FILE:
+        return None
+    with _keyword_cache_lock:
+        if _keyword_cache is None:
+            _keyword_cache = KeywordCache(KEYWORD_CACHE_FILE, KEYWORD_CACHE_SIMILARITY)
+    return _keyword_cache
+
+def parse_keywords_response(content: str):
+    """
+    Parses the model answer into a keyword list, salvaging near misses
+    
+    Text around the JSON array is ignored and lists longer than 7 keep their
+    first 7 items, instead of paying for another request.
+    """
+    # Limpiar cualquier formato markdown o texto adicional
+    content = content.replace('```json', '').replace('```', '').strip()
+    try:
+        keywords = json.loads(content)
+    except json.JSONDecodeError:
+        match = re.search(r'\[.*\]', content, re.DOTALL)
+        if not match:
+            raise
+        keywords = json.loads(match.group(0))
+    
+    if isinstance(keywords, dict) and "keywords" in keywords:
+        keywords = keywords["keywords"]
+    if isinstance(keywords, list) and len(keywords) > 7:
+        keywords = keywords[:7]
+    return keywords
+
 def extract_keywords(description: str, client: OpenAI) -> list:
     """
     Extract relevant keywords from a description using ChatGPT API
     
+    Identical or near-identical descriptions are answered from the keyword
+    cache without calling the model.
+    
     Args:
         description (str): Input text description
         client (OpenAI): OpenAI client instance
         
     Returns:
-        list: List of extracted keywords
+        list: List of extracted keywords, canonicalized
     """
+    model = os.getenv('MODEL_KEYWORDS')
+    cache = get_keyword_cache()
+    if cache is not None:
+        cached = cache.get(description, model)
+        if cached:
+            print(f"Keywords loaded from cache: {cached}")
+            return cached
+    
     for attempt in range(MAX_RETRIES):
         try:
             response = client.chat.completions.create(
-                model=os.getenv('MODEL_KEYWORDS'),
+                model=model,
                 messages=[
                     {
                         "role": "system",
@@ -73,33 +193,27 @@ def extract_keywords(description: str, client: OpenAI) -> list:
                 temperature=float(os.getenv('TEMPERATURE_KEYWORDS')),
                 max_tokens=int(os.getenv('MAX_TOKENS_KEYWORDS'))
             )
-            
-            content = response.choices[0].message.content.strip()
-            print(f"API Response: {content}")  # Debug
-            
-            # Limpiar cualquier formato markdown o texto adicional
-            content = content.replace('```json', '').replace('```', '').strip()
-            
-            try:
-                keywords = json.loads(content)
-                if isinstance(keywords, dict) and "keywords" in keywords:
-                    keywords = keywords["keywords"]
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {str(e)}")
-                continue
-            
-            # Validate output format
-            if validate_keywords(keywords):
-                return keywords
-            else:
-                print(f"Attempt {attempt + 1}: Invalid format received, retrying...")
-                continue
-
         except Exception as e:
-            print(f"Attempt {attempt + 1}: Error processing request: {str(e)}")
-            if attempt == MAX_RETRIES - 1:
-                raise Exception("Maximum retries reached. Could not get valid keywords.")
+            # The client already retried with backoff, only malformed answers are requested again here
+            raise Exception(f"Keyword extraction request failed: {str(e)}")
+        
+        content = (response.choices[0].message.content or '').strip()
+        print(f"API Response: {content}")  # Debug
+        
+        try:
+            keywords = parse_keywords_response(content)
+        except json.JSONDecodeError as e:
+            print(f"Attempt {attempt + 1}: JSON decode error: {str(e)}")
             continue
+        
+        # Validate output format, again after canonicalizing since merged synonyms can leave too few
+        if validate_keywords(keywords):
+            keywords = canonicalize_keywords(keywords)
+        if validate_keywords(keywords):
+            if cache is not None:
+                cache.put(description, model, keywords)
+            return keywords
+        print(f"Attempt {attempt + 1}: Invalid format received, retrying...")
     
     return []
 
@@ -118,25 +232,40 @@ def read_description() -> str:
     except Exception as e:
         raise Exception(f"Error reading description from environment: {str(e)}")
 
-def main():
-    try:
-        # Read description from file
-        description = read_description()
+@TRACER.stage('extract_keywords')
+def run_keyword_extraction(client=None, output_file='extracted_keywords.json') -> list:
+    """
+    Extracts keywords for INPUT_DESCRIPTION and saves them
+    
+    Args:
+        client: OpenAI client, created if not given
+        output_file: JSON file for the keywords, or None to skip saving
         
-        if len(description) > 300:
-            print("Description exceeds 300 characters limit")
-            return
-            
-        client = setup_openai()
-        keywords = extract_keywords(description, client)
+    Returns:
+        list: Extracted keywords, empty if none could be extracted
+    """
+    # Read description from file
+    description = read_description()
+    
+    if len(description) > 300:
+        raise Exception("Description exceeds 300 characters limit")
         
-        if keywords:
-            print(f"\nInput description:\n{description}")
-            print(f"\nExtracted keywords: {keywords}")
-            save_keywords(keywords)
-            print(f"\nKeywords saved to extracted_keywords.json")
-        else:
-            print("\nError: Could not extract valid keywords after multiple attempts")
+    client = client or setup_openai()
+    keywords = extract_keywords(description, client)
+    
+    if keywords:
+        print(f"\nInput description:\n{description}")
+        print(f"\nExtracted keywords: {keywords}")
+        if output_file:
+            save_keywords(keywords, output_file)
+            print(f"\nKeywords saved to {output_file}")
+    else:
+        print("\nError: Could not extract valid keywords after multiple attempts")
+    return keywords
+
+def main():
+    try:
+        run_keyword_extraction()
             
     except Exception as e:
         print(f"\nError: {str(e)}")
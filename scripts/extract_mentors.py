@@ -1,9 +1,32 @@
 import csv
+import hashlib
+import json
 import os
+import sys
 import logging
+import html
+import glob
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+import pandas as pd
 from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+from mentor_records import MentorRecord, records_frame
+from tracing import TRACER
+import storage
 import re
 
+# Load environment variables
+load_dotenv()
+
+PROFILE_FIELDS = ['name', 'position', 'location', 'description']
+MENTOR_FIELDS = ['mentor_id'] + PROFILE_FIELDS + ['content_hash']
+STREAMING_EXTRACTION = os.getenv('STREAMING_EXTRACTION', 'false').lower() == 'true'
+MENTORS_HTML_SOURCE = os.getenv('MENTORS_HTML_SOURCE', 'Nova - Mentoring.html')
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', '0')) or os.cpu_count() or 1
+MENTORS_DIFF_FILE = os.getenv('MENTORS_DIFF_FILE', 'mentors_diff.json')
+
 # Configure logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -33,9 +56,110 @@ def clean_text(text):
     # Strip leading/trailing spaces
     return text.strip()
 
-def process_mentors_page(html_content):
+def parse_mentor_item(item):
+    """Extracts the mentor fields from one mentoring-user-list-item element into a MentorRecord"""
+    # Extract basic information
+    name = clean_text(item.find('p', class_='font-bold').text)
+    
+    # Get all text-nova-xs paragraphs
+    info_paragraphs = item.find_all('p', class_='text-nova-grey-700 text-nova-xs')
+    position = clean_text(info_paragraphs[0].text) if len(info_paragraphs) > 0 else ""
+    location = clean_text(info_paragraphs[1].text) if len(info_paragraphs) > 1 else ""
+    
+    # Get description
+    description = item.find('p', class_='text-nova-xs line-clamp-3')
+    description_text = clean_text(description.text) if description else ""
+    
+    return MentorRecord(name=name, position=position, location=location, description=description_text)
+
+def stable_id(*parts):
+    """Positive 63-bit integer derived from the given text, identical across runs"""
+    digest = hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') & ((1 << 63) - 1)
+
+def mentor_content_hash(mentor):
+    """Hash of the profile fields, changes whenever the mentor edits their profile"""
+    text = '\x1f'.join(str(mentor.get(field) or '') for field in PROFILE_FIELDS)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def identify_mentors(mentors):
+    """
+    Adds mentor_id and content_hash to each mentor record or dict
+    
+    The ID comes from the normalized name, so it survives edits to the rest
+    of the profile. Two different mentors with the same name fall back to
+    name and position. Works on lists and on streams of mentors.
+    """
+    seen = set()
+    for mentor in mentors:
+        mentor_id = stable_id(normalize_key(mentor['name']))
+        if mentor_id in seen:
+            mentor_id = stable_id(normalize_key(mentor['name']), normalize_key(mentor['position']))
+        while mentor_id in seen:
+            mentor_id = (mentor_id + 1) & ((1 << 63) - 1)
+        seen.add(mentor_id)
+        mentor['mentor_id'] = mentor_id
+        mentor['content_hash'] = mentor_content_hash(mentor)
+        yield mentor
+
+def load_snapshot(csv_file):
+    """
+    Reads {mentor_id: (name, content_hash)} from a mentors CSV, or {} if there is none
+    
+    Snapshots written before mentor IDs existed get theirs computed on the fly.
+    """
+    if not csv_file or not os.path.exists(csv_file):
+        return {}
+    with open(csv_file, 'r', encoding='utf-8', newline='') as file:
+        # Rows are read one at a time, only the IDs and hashes are kept
+        rows = csv.DictReader(file)
+        if 'mentor_id' not in (rows.fieldnames or []):
+            rows = identify_mentors(rows)
+        return {int(row['mentor_id']): (row['name'], row['content_hash']) for row in rows}
+
+def diff_snapshots(previous, current):
+    """
+    Compares two {mentor_id: (name, content_hash)} snapshots
+    
+    Returns:
+        dict: added, changed and removed mentors ({mentor_id, name}) and the unchanged count
+    """
+    def entries(snapshot, ids):
+        return [{'mentor_id': mentor_id, 'name': snapshot[mentor_id][0]} for mentor_id in ids]
+    
+    added = [mentor_id for mentor_id in current if mentor_id not in previous]
+    removed = [mentor_id for mentor_id in previous if mentor_id not in current]
+    changed = [mentor_id for mentor_id in current
+               if mentor_id in previous and previous[mentor_id][1] != current[mentor_id][1]]
+    return {
+        'previous_mentors': len(previous),
+        'current_mentors': len(current),
+        'added': entries(current, added),
+        'changed': entries(current, changed),
+        'removed': entries(previous, removed),
+        'unchanged': len(current) - len(added) - len(changed)
+    }
+
+def save_diff(diff, diff_file=MENTORS_DIFF_FILE):
+    with open(diff_file, 'w', encoding='utf-8') as file:
+        json.dump(diff, file, indent=2, ensure_ascii=False)
+    print(f"\nMentors diff: {len(diff['added'])} added, {len(diff['changed'])} changed, "
+          f"{len(diff['removed'])} removed, {diff['unchanged']} unchanged (saved to {diff_file})")
+
+def save_mentors(mentors_data, output_file='mentors.csv'):
+    """Save mentor records or dicts to CSV"""
+    with open(output_file, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=MENTOR_FIELDS)
+        writer.writeheader()
+        for mentor in mentors_data:
+            writer.writerow(mentor)
+
+def process_mentors_page(html_content, output_file='mentors.csv'):
     """
     Process the mentors page HTML and extract relevant information
+    
+    The mentors are saved to output_file unless it is None and returned as
+    MentorRecords.
     """
     try:
         soup = BeautifulSoup(html_content, 'html.parser')
@@ -48,62 +172,239 @@ def process_mentors_page(html_content):
         
         for item in mentor_items:
             try:
-                # Extract basic information
-                name = clean_text(item.find('p', class_='font-bold').text)
-                
-                # Get all text-nova-xs paragraphs
-                info_paragraphs = item.find_all('p', class_='text-nova-grey-700 text-nova-xs')
-                position = clean_text(info_paragraphs[0].text) if len(info_paragraphs) > 0 else ""
-                location = clean_text(info_paragraphs[1].text) if len(info_paragraphs) > 1 else ""
-                
-                # Get description
-                description = item.find('p', class_='text-nova-xs line-clamp-3')
-                description_text = clean_text(description.text) if description else ""
-                
-                mentor_data = {
-                    'name': name,
-                    'position': position,
-                    'location': location,
-                    'description': description_text
-                }
-                
+                mentor_data = parse_mentor_item(item)
                 mentors_data.append(mentor_data)
-                print(f"Extracted data for mentor: {name}")
+                print(f"Extracted data for mentor: {mentor_data['name']}")
                 
             except Exception as e:
                 print(f"Error processing mentor item: {str(e)}")
                 continue
         
-        # Save data to CSV
-        with open('mentors.csv', mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=['name', 'position', 'location', 'description'])
-            writer.writeheader()
-            for mentor in mentors_data:
-                writer.writerow(mentor)
+        # Records only hold plain strings, so the tree can go before the CSV is written
+        del mentor_items
+        soup.decompose()
+        mentors_data = list(identify_mentors(mentors_data))
         
-        print(f"\nSuccessfully processed {len(mentors_data)} mentors and saved to mentors.csv")
+        # Save data to CSV
+        if output_file:
+            save_mentors(mentors_data, output_file)
+            print(f"\nSuccessfully processed {len(mentors_data)} mentors and saved to {output_file}")
+        else:
+            print(f"\nSuccessfully processed {len(mentors_data)} mentors")
         return mentors_data
 
     except Exception as e:
         print_error("PROCESSING ERROR", str(e))
         raise
 
-def extract_mentors():
+class MentorItemCollector(HTMLParser):
+    """
+    Incremental HTML parser that cuts out the markup of each mentor list item
+    
+    Only the elements inside li[data-testid=mentoring-user-list-item] are kept,
+    so memory depends on the size of one mentor and not on the whole page.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.depth = 0
+        self.buffer = []
+        self.items = []
+    
+    def handle_starttag(self, tag, attrs):
+        if self.depth == 0:
+            if tag != 'li' or ('data-testid', 'mentoring-user-list-item') not in attrs:
+                return
+            self.buffer = []
+        if tag == 'li':
+            self.depth += 1
+        self.buffer.append(self.get_starttag_text())
+    
+    def handle_startendtag(self, tag, attrs):
+        if self.depth > 0:
+            self.buffer.append(self.get_starttag_text())
+    
+    def handle_endtag(self, tag):
+        if self.depth == 0:
+            return
+        self.buffer.append(f"</{tag}>")
+        if tag == 'li':
+            self.depth -= 1
+            if self.depth == 0:
+                self.items.append(''.join(self.buffer))
+                self.buffer = []
+    
+    def handle_data(self, data):
+        if self.depth > 0:
+            self.buffer.append(html.escape(data, quote=False))
+
+def iter_mentors(html_file_path, chunk_size=1 << 16):
+    """
+    Yields mentor records from a saved page while reading it in chunks
+    
+    Each mentor item is parsed on its own with the same field rules as
+    process_mentors_page, instead of building a tree for the whole page.
+    """
+    collector = MentorItemCollector()
+    with open(html_file_path, 'r', encoding='utf-8') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if chunk:
+                collector.feed(chunk)
+            else:
+                collector.close()
+            
+            for markup in collector.items:
+                try:
+                    item = BeautifulSoup(markup, 'html.parser').li
+                    yield parse_mentor_item(item)
+                except Exception as e:
+                    print(f"Error processing mentor item: {str(e)}")
+            collector.items = []
+            
+            if not chunk:
+                break
+
+def extract_mentors_streaming(html_file_path, output_file='mentors.csv'):
+    """
+    Extracts mentors with iter_mentors, writing each CSV row as soon as it is found
+    
+    Returns:
+        int: Number of mentors written
+    """
+    print("\nExtracting mentors information (streaming)...")
+    count = 0
+    with open(output_file, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=MENTOR_FIELDS)
+        writer.writeheader()
+        for mentor in identify_mentors(iter_mentors(html_file_path)):
+            writer.writerow(mentor)
+            count += 1
+            print(f"Extracted data for mentor: {mentor['name']}")
+    
+    print(f"\nSuccessfully processed {count} mentors and saved to {output_file}")
+    return count
+
+def resolve_html_files(source):
+    """Expands a file path, a directory or a glob pattern into the HTML files to parse"""
+    if os.path.isdir(source):
+        files = glob.glob(os.path.join(source, '*.html')) + glob.glob(os.path.join(source, '*.htm'))
+    elif glob.has_magic(source):
+        files = glob.glob(source)
+    else:
+        files = [source] if os.path.exists(source) else []
+    
+    if not files:
+        raise Exception(f"HTML file not found: {source}")
+    return sorted(files)
+
+def extract_mentors_from_file(html_file_path):
+    """Parses one saved page into a list of mentor records, used by the process pool"""
+    return list(iter_mentors(html_file_path))
+
+def normalize_key(text):
+    """Case, accent and whitespace insensitive form of a field, for deduplication"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', text).strip().casefold()
+
+def dedupe_mentors(mentors_data):
+    """
+    Drops mentors repeated across page snapshots, matching on normalized name and position
+    
+    The first occurrence is kept, with empty fields filled in from later copies.
+    """
+    unique = {}
+    for mentor in mentors_data:
+        key = (normalize_key(mentor['name']), normalize_key(mentor['position']))
+        if key not in unique:
+            unique[key] = mentor.copy()
+            continue
+        kept = unique[key]
+        for field in PROFILE_FIELDS:
+            if not kept[field] and mentor[field]:
+                kept[field] = mentor[field]
+    return list(unique.values())
+
+def extract_mentors_from_files(html_files, workers=EXTRACTION_WORKERS, output_file='mentors.csv'):
+    """
+    Parses several saved pages in a process pool and merges them without duplicates
+    """
+    workers = max(1, min(workers, len(html_files)))
+    print(f"\nExtracting mentors from {len(html_files)} files with {workers} processes...")
+    
+    mentors_data = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for html_file_path, file_mentors in zip(html_files, executor.map(extract_mentors_from_file, html_files)):
+            print(f"Found {len(file_mentors)} mentors in {html_file_path}")
+            mentors_data.extend(file_mentors)
+    
+    unique_mentors = list(identify_mentors(dedupe_mentors(mentors_data)))
+    print(f"\nRemoved {len(mentors_data) - len(unique_mentors)} duplicate mentors")
+    
+    if output_file:
+        save_mentors(unique_mentors, output_file)
+        print(f"\nSuccessfully processed {len(unique_mentors)} mentors and saved to {output_file}")
+    else:
+        print(f"\nSuccessfully processed {len(unique_mentors)} mentors")
+    return unique_mentors
+
+@TRACER.stage('extract_mentors')
+def extract_mentors(source=None, output_file='mentors.csv'):
     """
     Extract mentors information from the HTML file
+    
+    Every mentor gets a stable mentor_id and a content_hash. When output_file
+    already holds a previous snapshot, the mentors added, changed and removed
+    since then are saved to MENTORS_DIFF_FILE.
+    
+    Args:
+        source: HTML file, directory of saved pages or glob pattern.
+            Defaults to MENTORS_HTML_SOURCE.
+        output_file: CSV the mentors are saved to, or None to keep them in memory only
+        
+    Returns:
+        list: MentorRecords, or None when they were streamed straight to output_file
     """
     print("\nStarting mentor extraction process...")
     try:
-        # Read the HTML file
-        html_file_path = 'Nova - Mentoring.html'
-        if not os.path.exists(html_file_path):
-            raise Exception(f"HTML file not found: {html_file_path}")
+        html_files = resolve_html_files(source or MENTORS_HTML_SOURCE)
+        # The CSV about to be replaced is the snapshot the new one is compared with
+        previous_snapshot = load_snapshot(output_file) if MENTORS_DIFF_FILE else {}
+        
+        if len(html_files) > 1:
+            mentors_data = extract_mentors_from_files(html_files, output_file=output_file)
+        elif STREAMING_EXTRACTION and output_file:
+            extract_mentors_streaming(html_files[0], output_file)
+            mentors_data = None
+        elif STREAMING_EXTRACTION:
+            mentors_data = list(identify_mentors(iter_mentors(html_files[0])))
+        else:
+            # Read the HTML file
+            with open(html_files[0], 'r', encoding='utf-8') as file:
+                html_content = file.read()
+            
+            # Process mentors data
+            mentors_data = process_mentors_page(html_content, output_file)
+        
+        if MENTORS_DIFF_FILE and output_file:
+            save_diff(diff_snapshots(previous_snapshot, load_snapshot(output_file)))
         
-        with open(html_file_path, 'r', encoding='utf-8') as file:
-            html_content = file.read()
+        # Typed columnar copy for the later stages, which then skip parsing the CSV
+        if output_file and storage.columnar_enabled():
+            mentors_df = pd.read_csv(output_file) if mentors_data is None else records_frame(mentors_data)
+            storage.save_mentors_table(mentors_df)
+            print(f"Mentor table saved to {storage.mentors_directory()} ({storage.ARTIFACT_FORMAT})")
         
-        # Process mentors data
-        mentors_data = process_mentors_page(html_content)
+        # Keep the vector index in step with the new snapshot
+        if os.getenv('MENTOR_INDEX_DIR'):
+            from mentor_index import update_mentor_index
+            if mentors_data is None:
+                with open(output_file, 'r', encoding='utf-8', newline='') as file:
+                    update_mentor_index(csv.DictReader(file))
+            else:
+                update_mentor_index(mentors_data)
+        TRACER.annotate(files=len(html_files), mentors=len(mentors_data) if mentors_data is not None else None)
         return mentors_data
 
     except Exception as e:
@@ -112,6 +413,6 @@ def extract_mentors():
 
 if __name__ == "__main__":
     try:
-        extract_mentors()
+        extract_mentors(sys.argv[1] if len(sys.argv) > 1 else None)
     except Exception as e:
         print_error("FATAL ERROR", str(e))
\ No newline at end of file
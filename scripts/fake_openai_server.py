@@ -0,0 +1,323 @@
+import argparse
+import ast
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from embeddings import HashedTfidfEmbedder, tokenize
+from prompts import KEYWORD_EXTRACTION_PROMPT
+
+STOPWORDS = {'a', 'an', 'and', 'the', 'to', 'of', 'in', 'on', 'for', 'with', 'i', 'my', 'me', 'want',
+             'looking', 'someone', 'who', 'can', 'help', 'learn', 'about', 'is', 'are', 'be', 'at'}
+
+def stable_int(text: str) -> int:
+    return int.from_bytes(hashlib.md5(text.encode('utf-8')).digest()[:4], 'little')
+
+def fake_keywords(description: str) -> list:
+    """Picks 3-7 content words from the description, so the answer passes validate_keywords"""
+    words = [w for w in dict.fromkeys(tokenize(description)) if w not in STOPWORDS]
+    for filler in ('mentoring', 'career', 'leadership'):
+        if len(words) >= 3:
+            break
+        words.append(filler)
+    return words[:7]
+
+def fake_score(keyword: str, context: str, sample: int = 0) -> int:
+    """
+    Deterministic 1-100 score, high when the keyword's words appear in the context
+
+    Samples after the first (later choices of a request with n) move up to
+    10 points away from it, like answers at a non-zero temperature.
+    """
+    context_tokens = set(tokenize(context))
+    keyword_tokens = tokenize(keyword)
+    overlap = sum(token in context_tokens for token in keyword_tokens) / max(1, len(keyword_tokens))
+    score = 1 + 59 * overlap + stable_int(keyword + context) % 40
+    if sample:
+        score += stable_int(f"{sample}:{keyword}:{context}") % 21 - 10
+    return int(min(100, max(1, score)))
+
+def parse_affinity_prompt(prompt: str):
+    """Recovers the keywords and contexts from an affinity prompt"""
+    match = re.search(r"^Keywords: (\[.*?\])$", prompt, re.MULTILINE)
+    keywords = ast.literal_eval(match.group(1)) if match else []
+    contexts = re.findall(r"^Context \d+: (.*)$", prompt, re.MULTILINE)
+    return keywords, contexts
+
+def parse_multipart(body: bytes, content_type: str) -> dict:
+    """Splits a multipart/form-data body into {field name: bytes}"""
+    boundary = content_type.split('boundary=')[-1].strip('"').encode('utf-8')
+    fields = {}
+    for part in body.split(b'--' + boundary):
+        headers, separator, data = part.partition(b'\r\n\r\n')
+        name = re.search(rb'name="([^"]*)"', headers)
+        if separator and name:
+            fields[name.group(1).decode('utf-8')] = data[:-2] if data.endswith(b'\r\n') else data
+    return fields
+
+def chat_completion_content(messages: list, response_format: dict = None, sample: int = 0) -> str:
+    """Answers a chat request the way the pipeline prompts expect"""
+    system = messages[0]['content'] if messages else ''
+    user = messages[-1]['content'] if messages else ''
+    if system == KEYWORD_EXTRACTION_PROMPT['system']:
+        match = re.search(r'Text: "(.*)"', user, re.DOTALL)
+        return json.dumps(fake_keywords(match.group(1) if match else user))
+    # Keywords are in the system message, contexts in the user message
+    keywords, contexts = parse_affinity_prompt(f"{system}\n{user}")
+    scores = [[fake_score(keyword, context, sample) for keyword in keywords] for context in contexts]
+    if (response_format or {}).get('type') == 'json_schema':
+        return json.dumps({'scores': scores})
+    return json.dumps(scores)
+
+def chat_completion(body: dict, request_id: int) -> dict:
+    """Chat completion response object for a request body, with body['n'] choices"""
+    contents = [chat_completion_content(body.get('messages', []), body.get('response_format'), sample)
+                for sample in range(body.get('n') or 1)]
+    prompt_tokens = sum(len(str(m.get('content', ''))) for m in body.get('messages', [])) // 4
+    completion_tokens = sum(len(content) for content in contents) // 4
+    return {
+        'id': f"chatcmpl-{request_id}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model') or 'fake-model',
+        'choices': [{
+            'index': index,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop'
+        } for index, content in enumerate(contents)],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+    }
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Serves the subset of the OpenAI API the pipeline uses"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length', '0'))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def send_bytes(self, status: int, payload: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        match = re.search(r'/(batches|files)/([^/]+)(/content)?$', self.path)
+        with server.lock:
+            found = match and (server.batches if match.group(1) == 'batches' else server.files).get(match.group(2))
+            found = dict(found) if found else None
+        if found is None:
+            self.send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+        elif match.group(1) == 'batches':
+            self.send_json(200, found)
+        elif match.group(3):
+            self.send_bytes(200, found['content'])
+        else:
+            self.send_json(200, found['object'])
+
+    def do_POST(self):
+        server = self.server
+        # Batch API control requests are never failed on purpose, the requests inside a batch are
+        if self.path.endswith('/files'):
+            length = int(self.headers.get('Content-Length', '0'))
+            fields = parse_multipart(self.rfile.read(length), self.headers.get('Content-Type', ''))
+            self.send_json(200, server.create_file(fields.get('file', b''), fields.get('purpose', b'').decode('utf-8')))
+            return
+        if self.path.endswith('/batches'):
+            body = self.read_json()
+            if body.get('input_file_id') not in server.files:
+                self.send_json(404, {'error': {'message': f"No such file {body.get('input_file_id')}"}})
+            else:
+                self.send_json(200, server.create_batch(body['input_file_id'], body.get('endpoint'),
+                                                        body.get('completion_window')))
+            return
+
+        body = self.read_json()
+        failure = server.draw_failure()
+        time.sleep(server.latency)
+
+        if failure == 429:
+            self.send_json(429, {'error': {'message': 'Rate limit reached (fake)', 'type': 'requests',
+                                           'code': 'rate_limit_exceeded'}},
+                           {'Retry-After': str(server.retry_after)})
+        elif failure == 500:
+            self.send_json(500, {'error': {'message': 'Internal server error (fake)', 'type': 'server_error'}})
+        elif self.path.endswith('/chat/completions'):
+            self.send_json(200, chat_completion(body, server.request_count))
+        elif self.path.endswith('/embeddings'):
+            inputs = body.get('input', [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            vectors = server.embedder.embed(inputs)
+            self.send_json(200, {
+                'object': 'list',
+                'model': body.get('model') or 'fake-embedding',
+                'data': [{'object': 'embedding', 'index': i, 'embedding': vector.tolist()}
+                         for i, vector in enumerate(vectors)],
+                'usage': {'prompt_tokens': 0, 'total_tokens': 0}
+            })
+        else:
+            self.send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the OpenAI API with a fixed response latency
+
+    A share of requests can be failed on purpose: error_rate answers 500 and
+    rate_limit_rate answers 429 with a Retry-After of retry_after seconds.
+    Failures are drawn from a seeded generator, so runs are reproducible.
+
+    Batch API jobs (file upload, batch creation, status and file content)
+    are kept in memory and finish batch_delay seconds after creation; the
+    same failure rates apply to each request inside a batch.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 0.1, seed: int = 42,
+                 batch_delay: float = 1.0):
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.request_count = 0
+        self.error_count = 0
+        self.rate_limited_count = 0
+        self.lock = threading.Lock()
+        self.embedder = HashedTfidfEmbedder(256)
+        self.batch_delay = batch_delay
+        self.files = {}
+        self.batches = {}
+
+    def draw_failure(self):
+        """Counts the request and returns 429, 500 or None for a normal answer"""
+        with self.lock:
+            self.request_count += 1
+            draw = self.rng.random()
+            if draw < self.rate_limit_rate:
+                self.rate_limited_count += 1
+                return 429
+            if draw < self.rate_limit_rate + self.error_rate:
+                self.error_count += 1
+                return 500
+        return None
+
+    def create_file(self, content: bytes, purpose: str, filename: str = 'upload.jsonl') -> dict:
+        with self.lock:
+            file_id = f"file-{len(self.files) + 1}"
+            file_object = {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                           'filename': filename, 'purpose': purpose, 'status': 'processed'}
+            self.files[file_id] = {'object': file_object, 'content': content}
+        return file_object
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str) -> dict:
+        """Registers a batch and runs its requests in a background thread after batch_delay"""
+        with self.lock:
+            batch_id = f"batch-{len(self.batches) + 1}"
+            lines = [line for line in self.files[input_file_id]['content'].decode('utf-8').splitlines() if line.strip()]
+            batch = {
+                'id': batch_id, 'object': 'batch', 'endpoint': endpoint, 'errors': None,
+                'input_file_id': input_file_id, 'completion_window': completion_window or '24h',
+                'status': 'in_progress', 'output_file_id': None, 'error_file_id': None,
+                'created_at': int(time.time()), 'in_progress_at': int(time.time()), 'completed_at': None,
+                'request_counts': {'total': len(lines), 'completed': 0, 'failed': 0}, 'metadata': None
+            }
+            self.batches[batch_id] = batch
+        threading.Thread(target=self.run_batch, args=(batch_id, lines), daemon=True).start()
+        return dict(batch)
+
+    def run_batch(self, batch_id: str, lines: list):
+        time.sleep(self.batch_delay)
+        outputs, errors = [], []
+        for n, line in enumerate(lines):
+            request = json.loads(line)
+            failure = self.draw_failure()
+            if failure:
+                response = {'status_code': failure, 'request_id': f"req-{n}",
+                            'body': {'error': {'message': f"Request failed with {failure} (fake)"}}}
+                errors.append({'id': f"batch_req_{n}", 'custom_id': request['custom_id'],
+                               'response': response, 'error': None})
+            else:
+                response = {'status_code': 200, 'request_id': f"req-{n}",
+                            'body': chat_completion(request['body'], n)}
+                outputs.append({'id': f"batch_req_{n}", 'custom_id': request['custom_id'],
+                                'response': response, 'error': None})
+
+        def to_file(entries):
+            if not entries:
+                return None
+            content = ''.join(json.dumps(entry) + '\n' for entry in entries).encode('utf-8')
+            return self.create_file(content, 'batch_output', f"{batch_id}_output.jsonl")['id']
+
+        output_file_id, error_file_id = to_file(outputs), to_file(errors)
+        with self.lock:
+            self.batches[batch_id].update({
+                'status': 'completed', 'output_file_id': output_file_id, 'error_file_id': error_file_id,
+                'completed_at': int(time.time()),
+                'request_counts': {'total': len(lines), 'completed': len(outputs), 'failed': len(errors)}
+            })
+
+    def counters(self) -> dict:
+        with self.lock:
+            return {'requests': self.request_count, 'errors': self.error_count,
+                    'rate_limited': self.rate_limited_count}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serves in a background thread and returns self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible API for local testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument('--retry-after', type=float, default=0.1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--batch-delay', type=float, default=1.0, help="Seconds before a submitted batch completes")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.error_rate, args.rate_limit_rate,
+                              args.retry_after, batch_delay=args.batch_delay)
+    print(f"Fake OpenAI API listening on {server.base_url} (latency {args.latency}s, "
+          f"{args.error_rate:.0%} errors, {args.rate_limit_rate:.0%} rate limited)")
+    print(f"Point the pipeline at it with OPENAI_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import List, Optional
+
+def normalize_description(description: str) -> str:
+    """Case, accent, punctuation and whitespace insensitive form of a description"""
+    text = unicodedata.normalize('NFKD', description)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = re.sub(r'[^\w\s+#]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class KeywordCache:
+    """
+    Persistent cache of extracted keywords, keyed by model and normalized description
+
+    An exact match on the normalized description is a hit. Below that, the
+    cached description with the most similar set of words is used when its
+    Jaccard similarity reaches similarity_threshold (1.0, the default,
+    disables this). Long descriptions that differ in a single word score close
+    to 1, so thresholds below 1 can return the keywords of a different search.
+    """
+
+    def __init__(self, path: str = 'keyword_cache.json', similarity_threshold: float = 1.0):
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for entry in json.load(f):
+                    self.entries[(entry['model'], entry['description'])] = entry['keywords']
+
+    def get(self, description: str, model: str) -> Optional[List[str]]:
+        """Returns cached keywords for an identical or near-identical description"""
+        normalized = normalize_description(description)
+        with self.lock:
+            if (model, normalized) in self.entries:
+                return list(self.entries[(model, normalized)])
+            if self.similarity_threshold >= 1:
+                return None
+
+            words = set(normalized.split())
+            best, best_similarity = None, 0.0
+            for (entry_model, entry_description), keywords in self.entries.items():
+                if entry_model != model:
+                    continue
+                similarity = jaccard(words, set(entry_description.split()))
+                if similarity > best_similarity:
+                    best, best_similarity = keywords, similarity
+            if best is not None and best_similarity >= self.similarity_threshold:
+                return list(best)
+        return None
+
+    def put(self, description: str, model: str, keywords: List[str]):
+        """Stores keywords and rewrites the cache file atomically"""
+        with self.lock:
+            self.entries[(model, normalize_description(description))] = list(keywords)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([
+                    {'model': model, 'description': description, 'keywords': keywords}
+                    for (model, description), keywords in self.entries.items()
+                ], f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,251 @@
+import argparse
+import difflib
+import json
+import math
+import os
+import sys
+import time
+from typing import List
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from embeddings import tokenize, top_k_indices
+from evaluate_affinity import cache_key, create_context, mentor_result, setup_cache
+from mentor_records import records_from_frame
+from affinity_parser import MIN_SCORE, MAX_SCORE
+import merge_results
+import storage
+
+# Load environment variables
+load_dotenv()
+
+LEXICAL_BM25_K1 = float(os.getenv('LEXICAL_BM25_K1', '1.5'))
+LEXICAL_BM25_B = float(os.getenv('LEXICAL_BM25_B', '0.75'))
+LEXICAL_FUZZY_CUTOFF = float(os.getenv('LEXICAL_FUZZY_CUTOFF', '0.85'))
+# Recorded as the model of lexical results, so they are never mistaken for model scores
+LEXICAL_MODEL = 'lexical-bm25'
+# Shorter tokens are only matched exactly, fuzzy matches of "go" or "ai" are mostly noise
+MIN_FUZZY_TOKEN_LENGTH = 4
+
+class LexicalScorer:
+    """
+    BM25 inverted index over mentor contexts, with fuzzy matching of keyword tokens
+
+    Each keyword is scored as a BM25 query of its tokens. Tokens of
+    MIN_FUZZY_TOKEN_LENGTH or more characters also match close spellings
+    (difflib ratio of at least fuzzy_cutoff), weighted by their similarity,
+    so "kubernete" still finds "kubernetes" and "mentors" finds "mentor".
+    Needs no network access.
+    """
+
+    def __init__(self, contexts: List[str], k1: float = LEXICAL_BM25_K1, b: float = LEXICAL_BM25_B,
+                 fuzzy_cutoff: float = LEXICAL_FUZZY_CUTOFF):
+        self.k1 = k1
+        self.b = b
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.size = len(contexts)
+        postings = {}
+        lengths = np.zeros(len(contexts), dtype=np.float32)
+        for doc, context in enumerate(contexts):
+            tokens = tokenize(context)
+            lengths[doc] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc, count))
+
+        self.postings = {
+            token: (np.array([doc for doc, _ in entries], dtype=np.int64),
+                    np.array([count for _, count in entries], dtype=np.float32))
+            for token, entries in postings.items()
+        }
+        self.vocabulary = list(self.postings)
+        self.idf = {token: math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for token, (docs, _) in self.postings.items()}
+        self.max_idf = math.log(1 + (self.size - 0.5) / 1.5) if self.size else 0.0
+        average_length = lengths.mean() if len(contexts) and lengths.mean() > 0 else 1.0
+        # Per document part of the BM25 denominator
+        self.length_norm = k1 * (1 - b + b * lengths / average_length)
+
+    def expand(self, token: str) -> list:
+        """(vocabulary term, weight) pairs matching token exactly or fuzzily"""
+        matches = [(token, 1.0)] if token in self.postings else []
+        if len(token) >= MIN_FUZZY_TOKEN_LENGTH:
+            for term in difflib.get_close_matches(token, self.vocabulary, n=3, cutoff=self.fuzzy_cutoff):
+                if term != token:
+                    matches.append((term, difflib.SequenceMatcher(None, token, term).ratio()))
+        return matches
+
+    def raw_scores(self, keyword: str):
+        """
+        BM25 score of every context for one keyword
+
+        Returns:
+            tuple: (scores as float32 array, score of a single exact mention of
+            every token in a context of average length, used to normalise)
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        reference = 0.0
+        for token in tokenize(keyword):
+            matches = self.expand(token)
+            reference += max((self.idf[term] for term, _ in matches), default=self.max_idf)
+            token_scores = np.zeros(self.size, dtype=np.float32)
+            for term, weight in matches:
+                docs, counts = self.postings[term]
+                term_scores = weight * self.idf[term] * counts * (self.k1 + 1) / (counts + self.length_norm[docs])
+                # A context can match a token through several spellings, only the best one counts
+                token_scores[docs] = np.maximum(token_scores[docs], term_scores)
+            scores += token_scores
+        return scores, reference
+
+    def score(self, keywords: List[str]) -> np.ndarray:
+        """
+        Scores every context against every keyword on the 1-100 scale of the model scores
+
+        Returns:
+            np.ndarray: Integer matrix with one row per context and one column per keyword
+        """
+        matrix = np.full((self.size, len(keywords)), MIN_SCORE, dtype=np.int64)
+        for column, keyword in enumerate(keywords):
+            scores, reference = self.raw_scores(keyword)
+            if reference <= 0:
+                continue
+            # One mention of every token scores about 63, more mentions approach 100
+            relevance = 1 - np.exp(-scores / reference)
+            matrix[:, column] = np.rint(MIN_SCORE + (MAX_SCORE - MIN_SCORE) * relevance).astype(np.int64)
+        return matrix
+
+def score_mentors_lexical(mentors_df, keywords) -> list:
+    """
+    Scores every mentor locally, in the result shape of score_mentors
+
+    Returns:
+        list: One result per mentor in the order of mentors_df, with LEXICAL_MODEL as model
+    """
+    rows = records_from_frame(mentors_df)
+    matrix = LexicalScorer([create_context(row) for row in rows]).score(keywords)
+    results = []
+    for row, scores in zip(rows, matrix):
+        result = mentor_result(row, {keyword: int(score) for keyword, score in zip(keywords, scores)})
+        result['model'] = LEXICAL_MODEL
+        results.append(result)
+    return results
+
+def lexical_shortlist(contexts: List[str], keywords: List[str], top_k: int):
+    """
+    Ranks contexts by their mean lexical score over the keywords
+
+    Returns:
+        tuple: (indexes of the top_k contexts best first, relevance of every context)
+    """
+    relevance = LexicalScorer(contexts).score(keywords).mean(axis=1) if keywords else np.zeros(len(contexts))
+    return top_k_indices(relevance, top_k), relevance
+
+def spearman(a: np.ndarray, b: np.ndarray):
+    """Spearman rank correlation, or None when either side is constant"""
+    ranks_a = pd.Series(a).rank().to_numpy()
+    ranks_b = pd.Series(b).rank().to_numpy()
+    if len(a) < 2 or ranks_a.std() == 0 or ranks_b.std() == 0:
+        return None
+    return float(np.corrcoef(ranks_a, ranks_b)[0, 1])
+
+def cached_model_matrix(mentors_df, keywords: List[str], cache) -> np.ndarray:
+    """Model scores of every (mentor, keyword) pair found in the score cache, NaN elsewhere"""
+    contexts = [create_context(row) for row in records_from_frame(mentors_df)]
+    cached = cache.get_many(cache_key(context, keyword) for context in contexts for keyword in keywords)
+    return np.array([[cached.get(cache_key(context, keyword), np.nan) for keyword in keywords]
+                     for context in contexts], dtype=np.float64).reshape(len(contexts), len(keywords))
+
+def compare_to_model(mentors_df, keywords: List[str], model_matrix: np.ndarray, top_ks=(5, 10, 20)) -> dict:
+    """
+    Measures how well lexical scores reproduce the model's scores and ranking
+
+    Only mentors with a model score for every keyword are compared.
+
+    Returns:
+        dict: Mentors compared, lexical scoring time, Spearman correlation per
+        keyword and of the aggregated ranking, and top-K overlap of the rankings
+    """
+    complete = ~np.isnan(model_matrix).any(axis=1)
+    compared_df = mentors_df[complete]
+    model_matrix = model_matrix[complete]
+
+    start_time = time.perf_counter()
+    lexical_matrix = LexicalScorer([create_context(row) for row in records_from_frame(compared_df)]).score(keywords)
+    seconds = time.perf_counter() - start_time
+
+    _, model_ranking = merge_results.rank_mentors(model_matrix, keywords)
+    _, lexical_ranking = merge_results.rank_mentors(lexical_matrix.astype(np.float64), keywords)
+    overlap = {}
+    for k in top_ks:
+        if k <= len(compared_df):
+            model_top = set(top_k_indices(model_ranking, k))
+            lexical_top = set(top_k_indices(lexical_ranking, k))
+            overlap[k] = len(model_top & lexical_top) / k
+    return {
+        'mentors': len(compared_df),
+        'seconds': seconds,
+        'keyword_spearman': {keyword: spearman(lexical_matrix[:, i], model_matrix[:, i])
+                             for i, keyword in enumerate(keywords)},
+        'ranking_spearman': spearman(lexical_ranking, model_ranking),
+        'top_k_overlap': overlap
+    }
+
+def print_comparison(comparison: dict):
+    def correlation_text(correlation):
+        return f"{correlation:.3f}" if correlation is not None else "n/a (constant scores)"
+
+    print(f"\nLexical vs model scores on {comparison['mentors']} mentors "
+          f"(lexical scoring took {comparison['seconds'] * 1000:.1f} ms)")
+    for keyword, correlation in comparison['keyword_spearman'].items():
+        print(f"  {keyword:<30} Spearman {correlation_text(correlation)}")
+    print(f"  {'aggregated ranking':<30} Spearman {correlation_text(comparison['ranking_spearman'])}")
+    for k, overlap in comparison['top_k_overlap'].items():
+        print(f"  Top {k} overlap: {overlap:.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local lexical scorer against model scores")
+    parser.add_argument('--source', choices=['results', 'cache'], default='results',
+                        help="Model scores from affinity_scores.json (or the columnar scores) or from the score cache")
+    parser.add_argument('--keywords-file', default='extracted_keywords.json', help="Keywords looked up with --source cache")
+    parser.add_argument('--top-k', type=int, nargs='+', default=[5, 10, 20])
+    parser.add_argument('--output', help="Also write the comparison to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        if args.source == 'cache':
+            cache = setup_cache()
+            if cache is None:
+                raise Exception("AFFINITY_CACHE_FILE is empty, there is no score cache to compare against")
+            mentors_df = pd.read_csv('mentors.csv')
+            with open(args.keywords_file, 'r', encoding='utf-8') as f:
+                keywords = json.load(f)
+            model_matrix = cached_model_matrix(mentors_df, keywords, cache)
+            cache.close()
+        else:
+            mentors_df, affinity_scores = merge_results.load_data()
+            models = {affinity_scores.model} if isinstance(affinity_scores, storage.ScoreMatrix) \
+                else {result.get('model') for result in affinity_scores}
+            if LEXICAL_MODEL in models:
+                raise Exception("The saved scores come from the lexical scorer, re-run evaluate_affinity.py "
+                                "with AFFINITY_MODE=sync or use --source cache")
+            keywords, model_matrix = merge_results.build_score_matrix(mentors_df, affinity_scores)
+
+        comparison = compare_to_model(mentors_df, keywords, model_matrix, args.top_k)
+        if not comparison['mentors']:
+            raise Exception("No mentor has model scores for every keyword")
+        print_comparison(comparison)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(comparison, f, indent=2, ensure_ascii=False)
+            print(f"\nComparison saved to {args.output}")
+        return True
+    except Exception as e:
+        print(f"\nError: {str(e)}")
+        return False
+
+if __name__ == "__main__":
+    success = main()
+    if not success:
+        sys.exit(1)
@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from fake_openai_server import FakeOpenAIServer
+from synthetic_data import TOPICS, generate_mentors
+
+def configure_environment(base_url: str):
+    """Points the OpenAI client at the fake server, keeping any model settings already set"""
+    os.environ['OPENAI_BASE_URL'] = base_url
+    os.environ['OPENAI_API_KEY'] = 'load-test'
+    for name, value in {'MODEL_KEYWORDS': 'fake-model', 'MODEL_AFFINITY': 'fake-model',
+                        'TEMPERATURE_KEYWORDS': '0.3', 'TEMPERATURE_AFFINITY': '0.3',
+                        'MAX_TOKENS_KEYWORDS': '100'}.items():
+        os.environ.setdefault(name, value)
+
+def start_service(mentors_df, cache):
+    """Runs the search service on a free port in a background thread and returns its URL"""
+    import search_service
+
+    ready = threading.Event()
+    address = {}
+
+    def on_ready(sockname):
+        address['url'] = f"http://{sockname[0]}:{sockname[1]}"
+        ready.set()
+
+    service = search_service.SearchService(mentors_df, cache=cache)
+    thread = threading.Thread(
+        target=lambda: asyncio.run(search_service.serve(service, '127.0.0.1', 0, on_ready)), daemon=True
+    )
+    thread.start()
+    ready.wait(timeout=30)
+    return address['url']
+
+def post_search(url: str, description: str) -> float:
+    """Sends one search and returns its latency in seconds"""
+    request = urllib.request.Request(
+        f"{url}/search",
+        data=json.dumps({'description': description, 'top_k': 10}).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    start_time = time.time()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        json.loads(response.read())
+    return time.time() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the search service against a fake model server")
+    parser.add_argument('--mentors', type=int, default=500, help="Synthetic mentors loaded by the service")
+    parser.add_argument('--requests', type=int, default=50, help="Searches to send")
+    parser.add_argument('--concurrency', type=int, default=8, help="Searches in flight at once")
+    parser.add_argument('--latency', type=float, default=0.05, help="Fake model latency in seconds")
+    parser.add_argument('--distinct', type=int, default=10, help="Distinct descriptions, repeats hit the cache")
+    parser.add_argument('--no-cache', action='store_true', help="Run without the affinity score cache")
+    args = parser.parse_args()
+
+    fake_server = FakeOpenAIServer(latency=args.latency).start()
+    configure_environment(fake_server.base_url)
+
+    from affinity_cache import AffinityCache
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep the keyword cache and trace of the run out of the caller's directory
+        os.environ['KEYWORD_CACHE_FILE'] = os.path.join(workdir, 'keyword_cache.json')
+        os.environ['TRACE_FILE'] = os.path.join(workdir, 'trace.jsonl')
+        cache = None if args.no_cache else AffinityCache(os.path.join(workdir, 'cache.sqlite'))
+        mentors_df = pd.DataFrame(generate_mentors(args.mentors))
+        descriptions = [
+            f"I want a mentor in {TOPICS[i % len(TOPICS)]} and {TOPICS[(i * 7 + 3) % len(TOPICS)]}"
+            for i in range(args.distinct)
+        ]
+
+        latencies, errors = [], 0
+        # The service prints per mentor progress, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            url = start_service(mentors_df, cache)
+            start_time = time.time()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                futures = [executor.submit(post_search, url, descriptions[i % len(descriptions)])
+                           for i in range(args.requests)]
+                for future in futures:
+                    try:
+                        latencies.append(future.result())
+                    except Exception:
+                        errors += 1
+            elapsed = time.time() - start_time
+
+        print(f"\nLoad test: {args.requests} searches, {args.concurrency} concurrent, "
+              f"{args.mentors} mentors, model latency {args.latency}s")
+        print(f"Throughput: {len(latencies) / elapsed:.2f} searches/s over {elapsed:.2f}s")
+        if latencies:
+            print(f"Latency p50: {np.percentile(latencies, 50):.3f}s  p95: {np.percentile(latencies, 95):.3f}s  "
+                  f"max: {max(latencies):.3f}s")
+        print(f"Errors: {errors}")
+        print(f"Model requests: {fake_server.request_count} ({fake_server.request_count / max(1, args.requests):.1f} per search)")
+        if cache is not None:
+            stats = cache.stats()
+            print(f"Score cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+            cache.close()
+
+    fake_server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Iterable, List
+import numpy as np
+from dotenv import load_dotenv
+from evaluate_affinity import create_context
+from embeddings import get_embedder, top_k_indices
+
+# Load environment variables
+load_dotenv()
+
+MENTOR_INDEX_DIR = os.getenv('MENTOR_INDEX_DIR', '')
+
+def mentor_key(mentor) -> str:
+    """Identifies a mentor across snapshots by normalised name"""
+    return re.sub(r'\s+', ' ', str(mentor['name'])).strip().lower()
+
+def content_hash(mentor) -> str:
+    """Hash of the text that gets embedded, used to detect edited profiles"""
+    return hashlib.sha1(create_context(mentor).encode('utf-8')).hexdigest()
+
+def setup_embedder():
+    """Creates the embedding backend configured in the environment"""
+    backend = os.getenv('EMBEDDING_BACKEND', 'tfidf')
+    client = None
+    if backend == 'openai':
+        from openai_client import setup_client
+        client = setup_client()
+    return get_embedder(
+        backend, client,
+        os.getenv('MODEL_EMBEDDING', 'text-embedding-3-small'),
+        int(os.getenv('EMBEDDING_DIMENSIONS', '2048'))
+    )
+
+def embedder_signature(embedder) -> str:
+    """Describes the embedding space, vectors from different spaces cannot be mixed"""
+    detail = getattr(embedder, 'dimensions', None) or getattr(embedder, 'model', '')
+    return f"{embedder.name}:{detail}"
+
+class MentorIndex:
+    """
+    Mentor profile embeddings stored on disk and updated incrementally
+
+    The vectors live in embeddings.npy and are memory-mapped on load, while
+    metadata.json keeps one entry per row (key, content hash, name, position,
+    location) plus the embedding space they were computed in. Only new or
+    edited mentors are embedded again on update.
+
+    The embedder is used without fit(), so hashed TF-IDF vectors stay
+    comparable between updates instead of depending on the corpus.
+    """
+
+    def __init__(self, directory: str = 'mentor_index'):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, 'embeddings.npy')
+        self.metadata_path = os.path.join(directory, 'metadata.json')
+        self.signature = None
+        self.entries = []
+        self.vectors = None
+        self.load()
+
+    def load(self):
+        """Reads the metadata and memory-maps the vectors, if the index exists"""
+        if not (os.path.exists(self.metadata_path) and os.path.exists(self.vectors_path)):
+            return
+        with open(self.metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        self.signature = metadata['signature']
+        self.entries = metadata['mentors']
+        self.vectors = np.load(self.vectors_path, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, mentors: Iterable[dict], embedder) -> dict:
+        """
+        Makes the index match mentors, in their order, re-embedding only what changed
+
+        mentors is read once, so it can be a stream such as a csv.DictReader;
+        only the profiles to embed are kept besides the index entries.
+
+        Returns:
+            dict: Number of added, changed, removed and unchanged mentors
+        """
+        signature = embedder_signature(embedder)
+        reusable = {}
+        if signature == self.signature and self.vectors is not None:
+            reusable = {(entry['key'], entry['hash']): row for row, entry in enumerate(self.entries)}
+        previous_keys = {entry['key'] for entry in self.entries}
+
+        entries, rows, to_embed, texts = [], [], [], []
+        for mentor in mentors:
+            entry = {
+                'key': mentor_key(mentor),
+                'hash': content_hash(mentor),
+                'name': mentor['name'],
+                'position': mentor['position'],
+                'location': mentor['location']
+            }
+            rows.append(reusable.get((entry['key'], entry['hash'])))
+            if rows[-1] is None:
+                to_embed.append(len(entries))
+                texts.append(create_context(mentor))
+            entries.append(entry)
+
+        new_vectors = embedder.embed(texts) if texts else None
+        if new_vectors is not None:
+            dimensions = new_vectors.shape[1]
+        elif self.vectors is not None:
+            dimensions = self.vectors.shape[1]
+        else:
+            dimensions = 0
+        vectors = np.zeros((len(entries), dimensions), dtype=np.float32)
+        for i, row in enumerate(rows):
+            if row is not None:
+                vectors[i] = self.vectors[row]
+        if new_vectors is not None:
+            vectors[to_embed] = new_vectors
+
+        current_keys = {entry['key'] for entry in entries}
+        added = sum(1 for i in to_embed if entries[i]['key'] not in previous_keys)
+        stats = {
+            'added': added,
+            'changed': len(to_embed) - added,
+            'removed': len(previous_keys - current_keys),
+            'unchanged': len(entries) - len(to_embed)
+        }
+
+        # Prefilter queries update the index every time, only rewrite it when the snapshot changed
+        if to_embed or signature != self.signature or entries != self.entries:
+            self._save(signature, entries, vectors)
+        return stats
+
+    def _save(self, signature: str, entries: List[dict], vectors: np.ndarray):
+        os.makedirs(self.directory, exist_ok=True)
+        # Release the old memory map before its file is replaced
+        self.vectors = None
+        # Unique temporary files, so concurrent searches never write to the same one
+        fd, tmp_vectors = tempfile.mkstemp(suffix='.npy', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, vectors)
+        os.replace(tmp_vectors, self.vectors_path)
+        fd, tmp_metadata = tempfile.mkstemp(suffix='.json', dir=self.directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'signature': signature, 'mentors': entries}, f, ensure_ascii=False)
+        os.replace(tmp_metadata, self.metadata_path)
+        self.load()
+
+    def query(self, keywords: List[str], embedder, top_k: int = 10):
+        """
+        Finds the mentors whose profiles are closest to the keywords
+
+        Returns:
+            tuple: (row indexes best first, mean cosine similarity of every row)
+        """
+        if self.vectors is None or len(self.entries) == 0:
+            return np.array([], dtype=int), np.array([], dtype=np.float32)
+        if embedder_signature(embedder) != self.signature:
+            raise Exception(f"Index was built with {self.signature}, not {embedder_signature(embedder)}")
+        keyword_vectors = embedder.embed(keywords)
+        relevance = (self.vectors @ keyword_vectors.T).mean(axis=1)
+        return top_k_indices(relevance, top_k), relevance
+
+def update_mentor_index(mentors: Iterable[dict], directory: str = None, embedder=None) -> dict:
+    """Brings the index in directory (MENTOR_INDEX_DIR by default) up to date with mentors"""
+    index = MentorIndex(directory or MENTOR_INDEX_DIR)
+    stats = index.update(mentors, embedder or setup_embedder())
+    print(f"\nMentor index updated: {stats['added']} added, {stats['changed']} changed, "
+          f"{stats['removed']} removed, {stats['unchanged']} unchanged")
+    return stats
+
+def main():
+    try:
+        keywords = sys.argv[1:]
+        if not keywords:
+            print("Usage: python mentor_index.py <keyword> [<keyword> ...]")
+            return
+
+        with open('mentors.csv', 'r', encoding='utf-8', newline='') as f:
+            mentors = list(csv.DictReader(f))
+
+        embedder = setup_embedder()
+        index = MentorIndex(MENTOR_INDEX_DIR or 'mentor_index')
+        update_mentor_index(mentors, index.directory, embedder)
+        index.load()
+
+        start_time = time.time()
+        top_k = int(os.getenv('TOP_K_RESULTS', '10'))
+        indexes, relevance = index.query(keywords, embedder, top_k)
+        elapsed_ms = (time.time() - start_time) * 1000
+
+        print(f"\nTop {len(indexes)} mentors for {keywords} ({elapsed_ms:.1f} ms):")
+        for i in indexes:
+            entry = index.entries[i]
+            print(f"{entry['name']} ({entry['position']}): {relevance[i]:.3f}")
+
+    except Exception as e:
+        print(f"\nError: {str(e)}")
+
+if __name__ == "__main__":
+    main()
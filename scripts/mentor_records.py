@@ -0,0 +1,76 @@
+import sys
+from typing import Iterable, List
+import pandas as pd
+
+def intern_text(value):
+    """Interns strings so repeated values share one object, other values are returned as they are"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+class MentorRecord:
+    """
+    One mentor in fixed slots instead of a dict or a pandas row
+
+    Supports the item access the pipeline uses on mentor dicts and rows
+    (record['name'], 'mentor_id' in record, record.get, keys), so a record
+    can go wherever a mentor dict or row went. Positions and locations
+    repeat across thousands of mentors and are interned, so each distinct
+    value is stored once.
+    """
+
+    __slots__ = ('mentor_id', 'name', 'position', 'location', 'description', 'content_hash')
+    FIELDS = dict.fromkeys(__slots__).keys()
+
+    def __init__(self, mentor_id=None, name='', position='', location='', description='', content_hash=None):
+        self.mentor_id = mentor_id
+        self.name = name
+        self.position = intern_text(position)
+        self.location = intern_text(location)
+        self.description = description
+        self.content_hash = content_hash
+
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        setattr(self, field, intern_text(value) if field in ('position', 'location') else value)
+
+    def __contains__(self, field):
+        """True for fields that are set, like a dict or row that has the column"""
+        return field in self.FIELDS and getattr(self, field) is not None
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def copy(self):
+        return MentorRecord(*(getattr(self, field) for field in self.__slots__))
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return f"MentorRecord({self.mentor_id!r}, {self.name!r})"
+
+def records_from_frame(mentors_df) -> List[MentorRecord]:
+    """
+    Mentor records for the rows of a DataFrame, in order
+
+    Reads whole columns at once instead of creating a Series per row like
+    iterrows. Missing values keep the form pandas gives them (NaN), so
+    contexts and hashes built from records match those built from rows;
+    columns the frame does not have are None.
+    """
+    columns = [mentors_df[field].tolist() if field in mentors_df.columns else [None] * len(mentors_df)
+               for field in MentorRecord.__slots__]
+    return [MentorRecord(*values) for values in zip(*columns)]
+
+def records_frame(records: Iterable[MentorRecord]) -> pd.DataFrame:
+    """DataFrame with one column per MentorRecord field, the layout of mentors.csv"""
+    records = list(records)
+    return pd.DataFrame({field: [getattr(record, field) for record in records] for field in MentorRecord.__slots__})
@@ -1,12 +1,34 @@
 import pandas as pd
 import json
+import os
 import numpy as np
+from dotenv import load_dotenv
+from tracing import TRACER
+import storage
+
+# Load environment variables
+load_dotenv()
+
+RANKING_AGGREGATION = os.getenv('RANKING_AGGREGATION', 'mean')
+KEYWORD_WEIGHTS = json.loads(os.getenv('KEYWORD_WEIGHTS') or '{}')
+SOFTMAX_TEMPERATURE = float(os.getenv('SOFTMAX_TEMPERATURE', '10'))
+AGGREGATIONS = ('mean', 'min', 'weighted', 'softmax')
 
 def load_data():
-    """Load data from mentors.csv and affinity_scores.json"""
+    """Load data from mentors.csv and affinity_scores.json, or from the columnar artifacts"""
     try:
-        # Load mentors CSV
-        mentors_df = pd.read_csv('mentors.csv')
+        # Load mentors, from the columnar table when extraction wrote one
+        if storage.columnar_enabled() and storage.mentors_table_exists():
+            mentors_df = storage.load_mentors_table()
+        else:
+            mentors_df = pd.read_csv('mentors.csv')
+        
+        # evaluate_affinity.py saves the score matrix whenever the format is columnar
+        if storage.columnar_enabled():
+            affinity_scores = storage.load_scores()
+            if affinity_scores is None:
+                raise Exception(f"Error loading files: no scores in {storage.scores_directory()}")
+            return mentors_df, affinity_scores
         
         # Load affinity results
         with open('affinity_scores.json', 'r', encoding='utf-8') as f:
@@ -16,55 +38,178 @@ def load_data():
     except FileNotFoundError as e:
         raise Exception(f"Error loading files: {str(e)}")
 
-def process_results(mentors_df, affinity_scores):
-    """Process and combine results"""
-    # Create DataFrame with affinity results
-    affinity_df = pd.DataFrame(affinity_scores)
+def build_score_matrix(mentors_df, affinity_scores):
+    """
+    Lays affinity results out as a dense mentors x keywords matrix
     
-    # Convert affinities column from dict to new columns
-    affinities_expanded = pd.json_normalize(affinity_df['affinities'])
+    Rows follow mentors_df, so no join on names is needed afterwards. Mentors
+    without a result get a row of NaN. affinity_scores is a list of results
+    or a storage.ScoreMatrix; with mentor IDs on both sides rows are matched
+    on the integer IDs, otherwise on names.
     
-    # Calculate average affinity for each mentor
-    affinity_df['average_affinity'] = affinities_expanded.mean(axis=1)
+    Returns:
+        tuple: (keywords, float matrix of shape (len(mentors_df), len(keywords)))
+    """
+    if not isinstance(affinity_scores, storage.ScoreMatrix) and 'mentor_id' in mentors_df.columns \
+            and affinity_scores and all('mentor_id' in result for result in affinity_scores):
+        keywords = list(dict.fromkeys(keyword for result in affinity_scores for keyword in result['affinities']))
+        affinity_scores = storage.results_to_scores(affinity_scores, keywords)
+    if isinstance(affinity_scores, storage.ScoreMatrix):
+        rows = pd.Index(affinity_scores.mentor_ids).get_indexer(mentors_df['mentor_id'])
+        matrix = np.full((len(mentors_df), len(affinity_scores.keywords)), np.nan)
+        matrix[rows >= 0] = affinity_scores.matrix[rows[rows >= 0]]
+        return list(affinity_scores.keywords), matrix
     
-    # Merge with original mentors DataFrame using name
-    merged_df = mentors_df.merge(
-        affinity_df[['mentor_name', 'affinities', 'average_affinity']], 
-        left_on='name', 
-        right_on='mentor_name', 
-        how='left'
-    )
+    keywords = []
+    for result in affinity_scores:
+        for keyword in result['affinities']:
+            if keyword not in keywords:
+                keywords.append(keyword)
     
-    # Remove redundant mentor_name column from merge
-    merged_df = merged_df.drop('mentor_name', axis=1)
+    # Mentors sharing a name are matched to results in order
+    positions = {}
+    for position, name in enumerate(mentors_df['name']):
+        positions.setdefault(name, []).append(position)
     
-    # Sort by average_affinity in descending order
-    merged_df = merged_df.sort_values('average_affinity', ascending=False)
+    matrix = np.full((len(mentors_df), len(keywords)), np.nan)
+    for result in affinity_scores:
+        rows = positions.get(result['mentor_name'])
+        if rows:
+            matrix[rows.pop(0)] = [result['affinities'].get(keyword, np.nan) for keyword in keywords]
     
-    return merged_df
+    return keywords, matrix
 
-def main():
-    try:
-        # Load data
-        mentors_df, affinity_scores = load_data()
+def keyword_weights(keywords, weights=None):
+    """Weight vector for keywords, 1.0 for any keyword without an explicit weight"""
+    weights = KEYWORD_WEIGHTS if weights is None else weights
+    return np.array([float(weights.get(keyword, 1.0)) for keyword in keywords])
+
+def aggregate_scores(matrix, weights=None, aggregation=RANKING_AGGREGATION, temperature=SOFTMAX_TEMPERATURE):
+    """
+    Combines per-keyword scores into one score per mentor
+    
+    Args:
+        matrix: mentors x keywords scores, NaN where missing
+        weights: Per-keyword weights, used by 'weighted' and 'softmax'
+        aggregation: 'mean', 'min', 'weighted' (weighted mean) or 'softmax'
+            (temperature-scaled log-sum-exp, between the mean and the maximum)
+        temperature: Softmax temperature, lower values get closer to the maximum
         
-        # Process and combine results
-        final_df = process_results(mentors_df, affinity_scores)
+    Returns:
+        ndarray: One score per row, NaN for rows without scores
+    """
+    if aggregation not in AGGREGATIONS:
+        raise Exception(f"Unknown aggregation '{aggregation}', expected one of {AGGREGATIONS}")
+    
+    present = ~np.isnan(matrix)
+    has_scores = present.any(axis=1)
+    scores = np.full(matrix.shape[0], np.nan)
+    if not has_scores.any():
+        return scores
+    
+    values = np.where(present, matrix, 0.0)[has_scores]
+    mask = present[has_scores]
+    if weights is None:
+        weights = np.ones(matrix.shape[1])
+    w = mask * np.asarray(weights, dtype=float)
+    
+    if aggregation == 'mean':
+        aggregated = values.sum(axis=1) / mask.sum(axis=1)
+    elif aggregation == 'min':
+        aggregated = np.where(mask, values, np.inf).min(axis=1)
+    elif aggregation == 'weighted':
+        aggregated = (values * w).sum(axis=1) / np.maximum(w.sum(axis=1), 1e-12)
+    else:
+        # Shift by the row maximum before exponentiating to stay numerically stable
+        peak = np.where(mask, values, -np.inf).max(axis=1, keepdims=True)
+        exp = w * np.exp((values - peak) / temperature)
+        aggregated = peak[:, 0] + temperature * np.log(exp.sum(axis=1) / np.maximum(w.sum(axis=1), 1e-12))
+    
+    scores[has_scores] = aggregated
+    return scores
+
+def top_k(scores, k):
+    """Indexes of the k best scores, best first, found with argpartition instead of a full sort"""
+    ranked = np.where(np.isnan(scores), -np.inf, scores)
+    k = min(k, len(ranked))
+    if k <= 0:
+        return np.array([], dtype=int)
+    candidates = np.argpartition(-ranked, k - 1)[:k]
+    return candidates[np.argsort(-ranked[candidates], kind='stable')]
+
+def rank_mentors(matrix, keywords, weights=None, aggregation=RANKING_AGGREGATION, k=None):
+    """
+    Ranks mentors from the score matrix without re-scoring anything
+    
+    Returns:
+        tuple: (row indexes best first, aggregated score of every row)
+    """
+    scores = aggregate_scores(matrix, keyword_weights(keywords, weights), aggregation)
+    if k is not None:
+        return top_k(scores, k), scores
+    # Stable full ranking with mentors without scores last
+    order = np.argsort(np.where(np.isnan(scores), np.inf, -scores), kind='stable')
+    return order, scores
+
+def ranked_frame(mentors_df, keywords, matrix, scores, order):
+    """
+    Builds the output table: mentors in ranking order with their affinities
+    
+    Every keyword gets its own float32 affinity_<keyword> column, empty where
+    the mentor has no score, instead of a dict per mentor.
+    """
+    merged_df = mentors_df.reset_index(drop=True)
+    affinities = pd.DataFrame(np.asarray(matrix, dtype=np.float32), columns=[f'affinity_{keyword}' for keyword in keywords])
+    merged_df = pd.concat([merged_df, affinities], axis=1)
+    merged_df['average_affinity'] = scores
+    return merged_df.iloc[order]
+
+def process_results(mentors_df, affinity_scores, weights=None, aggregation=RANKING_AGGREGATION):
+    """Process and combine results"""
+    keywords, matrix = build_score_matrix(mentors_df, affinity_scores)
+    order, scores = rank_mentors(matrix, keywords, weights, aggregation)
+    return ranked_frame(mentors_df, keywords, matrix, scores, order)
+
+@TRACER.stage('merge_results')
+def merge(mentors_df, affinity_scores, output_file='mentors_with_affinities.csv'):
+    """
+    Combines mentors and affinity results, saves them and prints a summary
+    
+    Args:
+        mentors_df: Extracted mentors
+        affinity_scores: Results from the affinity evaluation
+        output_file: CSV for the final ranking, or None to skip saving
         
-        # Save results
-        output_file = 'mentors_with_affinities.csv'
+    Returns:
+        DataFrame: Mentors sorted by average affinity
+    """
+    # Process and combine results
+    final_df = process_results(mentors_df, affinity_scores)
+    
+    # Save results
+    if output_file:
         final_df.to_csv(output_file, index=False, encoding='utf-8')
-        
-        print(f"\nProcess completed successfully!")
+    
+    print(f"\nProcess completed successfully!")
+    if output_file:
         print(f"Results saved to: {output_file}")
-        print(f"Total mentors processed: {len(final_df)}")
-        print(f"Global average affinity: {final_df['average_affinity'].mean():.2f}")
+    print(f"Total mentors processed: {len(final_df)}")
+    print(f"Global average affinity: {final_df['average_affinity'].mean():.2f}")
+    
+    # Print top 3 mentors by affinity
+    print(f"\nTop 3 mentors by affinity ({RANKING_AGGREGATION}):")
+    top_3 = final_df[['name', 'average_affinity']].head(3)
+    for _, row in top_3.iterrows():
+        print(f"{row['name']}: {row['average_affinity']:.2f}")
+    
+    return final_df
+
+def main():
+    try:
+        # Load data
+        mentors_df, affinity_scores = load_data()
         
-        # Print top 3 mentors by affinity
-        print("\nTop 3 mentors by affinity:")
-        top_3 = final_df[['name', 'average_affinity']].head(3)
-        for _, row in top_3.iterrows():
-            print(f"{row['name']}: {row['average_affinity']:.2f}")
+        merge(mentors_df, affinity_scores)
         
     except Exception as e:
         print(f"\nError: {str(e)}")
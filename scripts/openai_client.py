@@ -0,0 +1,203 @@
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+import openai
+from openai import OpenAI
+from dotenv import load_dotenv
+from tracing import TRACER, usage_attributes
+
+# Load environment variables
+load_dotenv()
+
+REQUESTS_PER_MINUTE = float(os.getenv('REQUESTS_PER_MINUTE', '0'))
+TOKENS_PER_MINUTE = float(os.getenv('TOKENS_PER_MINUTE', '0'))
+MAX_RETRIES_API = int(os.getenv('MAX_RETRIES_API', '5'))
+BACKOFF_BASE_SECONDS = float(os.getenv('BACKOFF_BASE_SECONDS', '1'))
+BACKOFF_MAX_SECONDS = float(os.getenv('BACKOFF_MAX_SECONDS', '60'))
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously up to a per-minute budget
+
+    A limit of 0 disables the bucket.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.available = per_minute
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1):
+        """Blocks until amount can be taken from the bucket"""
+        if self.capacity <= 0:
+            return
+        # A single request larger than the whole budget would never fit otherwise
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, amount: float):
+        """Gives back (positive) or takes (negative) tokens once the real usage is known"""
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+
+class AdaptiveConcurrency:
+    """
+    Limits requests in flight, halving the limit on throttling and growing it back slowly
+
+    Additive increase, multiplicative decrease: after a full window of
+    successful calls at the current limit, the limit grows by one, up to
+    max_concurrency.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_concurrency:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    def on_throttle(self):
+        with self.condition:
+            self.limit = max(1, self.limit // 2)
+            self.successes = 0
+
+def status_code(error) -> int:
+    return getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+
+def is_retryable(error) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying"""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    code = status_code(error)
+    return code is not None and (code == 429 or code >= 500)
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it sent Retry-After"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+def estimate_request_tokens(kwargs) -> int:
+    """Rough prompt plus completion tokens of a request, about four characters per token"""
+    if 'messages' in kwargs:
+        text = ''.join(str(message.get('content', '')) for message in kwargs['messages'])
+        # Every one of the n answers is billed as completion tokens
+        return len(text) // 4 + (kwargs.get('max_tokens') or 256) * (kwargs.get('n') or 1)
+    inputs = kwargs.get('input', '')
+    return len(''.join(inputs) if isinstance(inputs, list) else str(inputs)) // 4
+
+class RateLimitedClient:
+    """
+    Wraps an OpenAI client with rate limiting, backoff and adaptive concurrency
+
+    Exposes chat.completions.create and embeddings.create like the wrapped
+    client, so call sites do not change. Every call waits for the request and
+    token buckets, runs within the adaptive concurrency limit and is retried
+    with jittered exponential backoff (or the server's Retry-After) on 429s,
+    server errors and connection problems. The files and batches endpoints of
+    the Batch API are passed through unchanged.
+    """
+
+    def __init__(self, client, requests_per_minute: float = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = TOKENS_PER_MINUTE,
+                 max_concurrency: int = 8, max_retries: int = MAX_RETRIES_API):
+        self.client = client
+        self.max_retries = max_retries
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_chat_completion))
+        self.embeddings = SimpleNamespace(create=self.create_embedding)
+        self.files = client.files
+        self.batches = client.batches
+
+    def create_chat_completion(self, **kwargs):
+        return self._call(self.client.chat.completions.create, kwargs, 'openai.chat')
+
+    def create_embedding(self, **kwargs):
+        return self._call(self.client.embeddings.create, kwargs, 'openai.embeddings')
+
+    def _call(self, create, kwargs, span_name='openai.call'):
+        estimated_tokens = estimate_request_tokens(kwargs)
+        with TRACER.span(span_name, model=kwargs.get('model'), retries=0, throttled=0) as span:
+            for attempt in range(self.max_retries + 1):
+                self.requests.acquire(1)
+                self.tokens.acquire(estimated_tokens)
+                try:
+                    with self.concurrency:
+                        response = create(**kwargs)
+                except Exception as e:
+                    if not is_retryable(e) or attempt == self.max_retries:
+                        raise
+                    span['retries'] += 1
+                    if status_code(e) == 429:
+                        span['throttled'] += 1
+                        self.concurrency.on_throttle()
+                    delay = retry_after(e)
+                    if delay is None:
+                        delay = backoff_delay(attempt)
+                    print(f"API call failed ({str(e)}), retrying in {delay:.1f}s...")
+                    time.sleep(delay)
+                    continue
+
+                self.concurrency.on_success()
+                usage = getattr(response, 'usage', None)
+                span.update(usage_attributes(kwargs.get('model'), usage))
+                if usage is not None and getattr(usage, 'total_tokens', None):
+                    self.tokens.adjust(estimated_tokens - usage.total_tokens)
+                return response
+
+def setup_client(max_concurrency: int = 8):
+    """Creates the rate limited OpenAI client shared by the pipeline scripts"""
+    # Retries are handled by the wrapper, with backoff shared across threads
+    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+    return RateLimitedClient(client, max_concurrency=max_concurrency)
@@ -0,0 +1,123 @@
+import heapq
+import os
+import time
+from collections import deque
+from typing import List
+import numpy as np
+from dotenv import load_dotenv
+import evaluate_affinity as affinity
+from merge_results import RANKING_AGGREGATION, aggregate_scores, keyword_weights
+
+# Load environment variables
+load_dotenv()
+
+# Mentors scored per wave, 0 for one request per worker thread
+PROGRESSIVE_WAVE_SIZE = int(os.getenv('PROGRESSIVE_WAVE_SIZE', '0'))
+# Early stopping is a heuristic with no bound on the scores left, so it is off by default
+PROGRESSIVE_PATIENCE = int(os.getenv('PROGRESSIVE_PATIENCE', '0'))
+PROGRESSIVE_MARGIN = float(os.getenv('PROGRESSIVE_MARGIN', '5'))
+
+class RunningTopK:
+    """
+    The k best mentors seen so far, kept in a min-heap of aggregated scores
+
+    Scores are aggregated exactly like merge_results ranks them, so the
+    running top-K matches the final ranking of the mentors scored so far.
+    """
+
+    def __init__(self, k: int, keywords: List[str], weights=None, aggregation: str = RANKING_AGGREGATION):
+        self.k = k
+        self.keywords = keywords
+        self.weights = keyword_weights(keywords, weights)
+        self.aggregation = aggregation
+        self.heap = []
+        self.pushed = 0
+
+    def score(self, result: dict) -> float:
+        row = np.array([[result['affinities'].get(keyword, np.nan) for keyword in self.keywords]], dtype=np.float64)
+        return float(aggregate_scores(row, self.weights, self.aggregation)[0])
+
+    def push(self, result: dict) -> float:
+        """Adds a mentor result and returns its aggregated score"""
+        score = self.score(result)
+        # The counter breaks ties in favour of the mentor seen first, like the stable final sort
+        entry = (score, -self.pushed, result)
+        self.pushed += 1
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+        return score
+
+    @property
+    def full(self) -> bool:
+        return len(self.heap) >= self.k
+
+    @property
+    def threshold(self) -> float:
+        """Score a mentor has to beat to enter the top-K, -inf until k mentors were seen"""
+        return self.heap[0][0] if self.full else float('-inf')
+
+    def top(self) -> list:
+        """(score, result) pairs, best first"""
+        return [(score, result) for score, _, result in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
+
+def print_top(running: RunningTopK, scored: int, total: int, elapsed: float):
+    print(f"\nTop {running.k} after {scored} of {total} mentors ({elapsed:.1f}s):")
+    for rank, (score, result) in enumerate(running.top(), 1):
+        print(f"  {rank:>2}. {result['mentor_name']} ({score:.1f})")
+
+def score_progressively(mentors_df, keywords, client, cache=None, on_result=None, finished=None,
+                        top_k: int = affinity.PROGRESSIVE_TOP_K, wave_size: int = PROGRESSIVE_WAVE_SIZE,
+                        patience: int = PROGRESSIVE_PATIENCE, margin: float = PROGRESSIVE_MARGIN, on_update=None,
+                        sample_log=None):
+    """
+    Scores mentors in waves, most relevant first, keeping a running top-K
+
+    mentors_df must be ordered by prefilter relevance. After each wave the
+    running top-K is printed, or passed to on_update(top, scored, total) when
+    given. With a patience above 0, scoring stops early once the top-K is
+    full and none of the last `patience` mentors scored came within `margin`
+    of its threshold. This is a heuristic: the mentors left rank lower in the
+    prefilter, but nothing bounds their scores, so one of them could still
+    have entered the top-K. The default patience of 0 scores every mentor.
+    finished holds results known before scoring, such as carried forward or
+    resumed mentors, which seed the top-K. sample_log is passed on to
+    score_mentors.
+
+    Returns:
+        list: Results of the mentors scored, in the order of mentors_df
+    """
+    running = RunningTopK(top_k, keywords)
+    for result in finished or []:
+        running.push(result)
+    if wave_size <= 0:
+        wave_size = max(1, affinity.CONTEXTS_PER_REQUEST * affinity.MAX_CONCURRENCY)
+
+    recent = deque(maxlen=patience)
+    results = []
+    start_time = time.perf_counter()
+    total = len(mentors_df)
+    for start in range(0, total, wave_size):
+        wave_df = mentors_df.iloc[start:start + wave_size]
+        wave_results = affinity.score_mentors(wave_df, keywords, client, cache, affinity.MAX_CONCURRENCY, on_result,
+                                              sample_log)
+        previous_top = [id(result) for _, result in running.top()]
+        for result in wave_results:
+            recent.append(running.push(result))
+        results.extend(wave_results)
+
+        scored = start + len(wave_df)
+        if [id(result) for _, result in running.top()] != previous_top or scored == len(wave_df):
+            if on_update is not None:
+                on_update(running.top(), scored, total)
+            else:
+                print_top(running, scored, total, time.perf_counter() - start_time)
+
+        if scored < total and patience > 0 and running.full and len(recent) == patience \
+                and max(recent) + margin < running.threshold:
+            print(f"\nStopping early (heuristic): the last {patience} mentors scored at most {max(recent):.1f}, "
+                  f"below the top {top_k} threshold of {running.threshold:.1f}; {total - scored} mentors ranked "
+                  f"lower by the prefilter left unscored and may still belong in the top {top_k}")
+            break
+    return results
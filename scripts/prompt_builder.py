@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+from typing import List
+from dotenv import load_dotenv
+from prompts import AFFINITY_EVALUATION_PROMPT
+
+# Load environment variables
+load_dotenv()
+
+AFFINITY_CONTEXT_MAX_TOKENS = int(os.getenv('AFFINITY_CONTEXT_MAX_TOKENS', '200'))
+TOKENIZER_ENCODING = os.getenv('TOKENIZER_ENCODING', 'o200k_base')
+# Part of the prompt contract: text answers and structured output are parsed differently
+AFFINITY_RESPONSE_FORMAT = os.getenv('AFFINITY_RESPONSE_FORMAT', 'text')
+# Tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# tiktoken is optional, without it tokens are estimated at about four characters each
+try:
+    import tiktoken
+    ENCODING = tiktoken.get_encoding(TOKENIZER_ENCODING)
+except Exception:
+    ENCODING = None
+
+# The affinity prompt before compaction, kept only to report the token savings
+PREVIOUS_AFFINITY_PROMPT = {
+    "system": "You are an AI trained to evaluate semantic affinity between keywords and contexts.",
+    "batch": """Evaluate the relationship between each keyword and the provided contexts, assigning an affinity score between 1 and 100 for each combination.
+
+Keywords: {keywords}
+
+{contexts}
+
+Return ONLY a list of lists with numbers, where each sublist contains the affinity scores for one context, in the same order as the keywords.
+Example format: [[80, 45, 90], [70, 65, 85], [55, 95, 75]]"""
+}
+
+def count_tokens(text: str) -> int:
+    """Tokens of text with tiktoken, or an estimate of about four characters per token"""
+    if ENCODING is not None:
+        return len(ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+def normalize_context(context: str) -> str:
+    """
+    Compacts a mentor context without changing its meaning
+
+    Normalizes Unicode, drops the 'nan' left by missing CSV fields, collapses
+    whitespace and runs of repeated punctuation.
+    """
+    text = unicodedata.normalize('NFKC', context)
+    parts = [part.strip() for part in text.split(' - ')]
+    text = ' - '.join(part for part in parts if part and part.lower() != 'nan')
+    text = re.sub(r'([!?.,;:\-_*=~])\1{2,}', r'\1', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to at most max_tokens, at a word boundary, marking the cut with an ellipsis"""
+    if max_tokens <= 0 or count_tokens(text) <= max_tokens:
+        return text
+    if ENCODING is not None:
+        cut = ENCODING.decode(ENCODING.encode(text)[:max_tokens - 1])
+    else:
+        cut = text[:(max_tokens - 1) * 4]
+    if ' ' in cut:
+        cut = cut[:cut.rindex(' ')]
+    return cut.rstrip(' ,;:-') + '…'
+
+@lru_cache(maxsize=100000)
+def prepare_context(context: str, max_tokens: int = AFFINITY_CONTEXT_MAX_TOKENS) -> str:
+    """The normalized, truncated context that is sent to the model and used in cache keys"""
+    return truncate_tokens(normalize_context(context), max_tokens)
+
+def format_keywords(keywords: List[str]) -> str:
+    return json.dumps(list(keywords), ensure_ascii=False)
+
+def system_prompt(keywords: List[str]) -> str:
+    return AFFINITY_EVALUATION_PROMPT["system"].format(keywords=format_keywords(keywords))
+
+def context_line(number: int, context: str) -> str:
+    return AFFINITY_EVALUATION_PROMPT["context"].format(number=number, context=prepare_context(context))
+
+def build_messages(contexts: List[str], keywords: List[str]) -> list:
+    """
+    Chat messages scoring contexts against keywords
+
+    Instructions and keywords go in the system message, identical for every
+    pack of a run, and the user message only lists the prepared contexts.
+    """
+    return [
+        {"role": "system", "content": system_prompt(keywords)},
+        {"role": "user", "content": "\n".join(context_line(i + 1, context) for i, context in enumerate(contexts))}
+    ]
+
+def prompt_tokens(contexts: List[str], keywords: List[str]) -> int:
+    """Input tokens of the messages built for contexts and keywords"""
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+               for message in build_messages(contexts, keywords))
+
+def cache_template() -> str:
+    """Everything besides context and keyword that decides a score, for the score cache key"""
+    return (AFFINITY_EVALUATION_PROMPT["system"] + AFFINITY_EVALUATION_PROMPT["context"]
+            + f"|max_tokens={AFFINITY_CONTEXT_MAX_TOKENS}|response_format={AFFINITY_RESPONSE_FORMAT}")
+
+def previous_prompt_tokens(contexts: List[str], keywords: List[str]) -> int:
+    """Input tokens the same pack took with PREVIOUS_AFFINITY_PROMPT and raw contexts"""
+    user = PREVIOUS_AFFINITY_PROMPT["batch"].format(
+        keywords=keywords, contexts="\n".join(f"Context {i+1}: {ctx}" for i, ctx in enumerate(contexts)))
+    return (count_tokens(PREVIOUS_AFFINITY_PROMPT["system"]) + count_tokens(user)
+            + 2 * MESSAGE_OVERHEAD_TOKENS)
+
+def token_report(contexts: List[str], keywords: List[str], packs: List[List[int]]) -> dict:
+    """
+    Input tokens of scoring contexts in the given packs, before and after compaction
+
+    Returns:
+        dict: Mentors, requests, total and per mentor tokens before and after,
+        the shared prefix tokens and how many contexts were truncated
+    """
+    before = sum(previous_prompt_tokens([contexts[i] for i in pack], keywords) for pack in packs)
+    after = sum(prompt_tokens([contexts[i] for i in pack], keywords) for pack in packs)
+    mentors = max(1, len(contexts))
+    return {
+        'mentors': len(contexts),
+        'requests': len(packs),
+        'tokens_before': before,
+        'tokens_after': after,
+        'tokens_per_mentor_before': before / mentors,
+        'tokens_per_mentor_after': after / mentors,
+        'reduction': 1 - after / before if before else 0.0,
+        'shared_prefix_tokens': count_tokens(system_prompt(keywords)) + MESSAGE_OVERHEAD_TOKENS,
+        'truncated_contexts': sum(prepare_context(context).endswith('…') for context in contexts),
+        'tokenizer': TOKENIZER_ENCODING if ENCODING is not None else 'estimate (4 characters per token)'
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Report affinity prompt tokens per mentor before and after compaction")
+    parser.add_argument('mentors_file', nargs='?', default='mentors.csv')
+    parser.add_argument('--keywords-file', default='extracted_keywords.json')
+    parser.add_argument('--contexts-per-request', type=int, help="Mentors per prompt, defaults to CONTEXTS_PER_REQUEST")
+    parser.add_argument('--output', help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        # Imported here because evaluate_affinity builds its prompts with this module
+        import pandas as pd
+        from evaluate_affinity import CONTEXTS_PER_REQUEST, create_context, pack_contexts
+        from mentor_records import records_from_frame
+
+        mentors_df = pd.read_csv(args.mentors_file)
+        with open(args.keywords_file, 'r', encoding='utf-8') as f:
+            keywords = json.load(f)
+        contexts = [create_context(row) for row in records_from_frame(mentors_df)]
+        packs = pack_contexts(contexts, keywords, args.contexts_per_request or CONTEXTS_PER_REQUEST)
+        report = token_report(contexts, keywords, packs)
+
+        print(f"Affinity prompt tokens for {report['mentors']} mentors and {len(keywords)} keywords "
+              f"in {report['requests']} requests ({report['tokenizer']}):")
+        print(f"  Before: {report['tokens_before']} tokens, {report['tokens_per_mentor_before']:.1f} per mentor")
+        print(f"  After:  {report['tokens_after']} tokens, {report['tokens_per_mentor_after']:.1f} per mentor "
+              f"({report['reduction']:.1%} fewer)")
+        print(f"  Shared prefix: {report['shared_prefix_tokens']} tokens per request")
+        print(f"  Contexts truncated to {AFFINITY_CONTEXT_MAX_TOKENS} tokens: {report['truncated_contexts']}")
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nReport saved to {args.output}")
+        return True
+    except Exception as e:
+        print(f"\nError: {str(e)}")
+        return False
+
+if __name__ == "__main__":
+    success = main()
+    if not success:
+        sys.exit(1)
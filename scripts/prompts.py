@@ -6,18 +6,13 @@ Text: "{}"
 """
 }
 
+# The system message holds everything shared by the packs of a run, keywords included,
+# so the user message only lists contexts. It is far below the 1024 tokens provider-side
+# prompt caching needs, so it is not cached
 AFFINITY_EVALUATION_PROMPT = {
-    "system": "You are an AI trained to evaluate semantic affinity between keywords and contexts.",
-    "user": """You are an expert in semantic affinity analysis. Evaluate the relationship between each keyword and the provided context, assigning an affinity score between 1 and 100. Use the context to judge how relevant each keyword is in relation to it.
+    "system": """Score the semantic affinity of each keyword to each mentor context, from 1 (unrelated) to 100 (central to the profile).
+Return ONLY a JSON list of lists of integers: one list per context in the given order, one score per keyword in keyword order, e.g. [[80, 45, 90], [70, 65, 85]]
 
-Action:
-1. For each keyword in the input list, analyze its semantic relationship with the context.
-2. Assign an affinity score between 1 and 100, where 1 indicates very low affinity and 100 indicates very high affinity.
-3. Return a list of integers representing the affinity of each keyword in the order presented.
-
-Input:
-- Keywords: {keywords}
-- Context: "{context}"
-
-Return only the list of numbers, nothing else."""
-} 
\ No newline at end of file
+Keywords: {keywords}""",
+    "context": "Context {number}: {context}"
+}
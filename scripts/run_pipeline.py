@@ -1,8 +1,14 @@
 import subprocess
 import sys
+import os
 import json
 import time
 from pathlib import Path
+import tracing
+import storage
+
+IN_PROCESS = '--in-process' in sys.argv or os.getenv('PIPELINE_MODE', 'subprocess') == 'in_process'
+WRITE_ARTIFACTS = os.getenv('WRITE_ARTIFACTS', 'true').lower() == 'true'
 
 def format_execution_time(seconds):
     """Format execution time in minutes and seconds if over 60 seconds"""
@@ -12,7 +18,7 @@ def format_execution_time(seconds):
         return f"{minutes} min {remaining_seconds:.2f} sec"
     return f"{seconds:.2f} seconds"
 
-def run_script(script_name, description):
+def run_script(script_name, description, timings=None):
     """Execute a Python script and handle its result"""
     print(f"\n{'='*50}")
     print(f"Running {script_name}: {description}")
@@ -43,6 +49,8 @@ def run_script(script_name, description):
         return_code = process.poll()
         
         execution_time = time.time() - start_time
+        if timings is not None:
+            timings.append((script_name, execution_time))
         print(f"\nExecution time for {script_name}: {format_execution_time(execution_time)}")
         
         # Check for errors
@@ -54,8 +62,10 @@ def run_script(script_name, description):
             
         # Verify that expected output files exist after each step
         if script_name == 'evaluate_affinity.py':
-            if not Path('affinity_scores.json').exists():
-                print(f"Error: affinity_scores.json was not created by {script_name}")
+            scores_file = (os.path.join(storage.scores_directory(), 'metadata.json')
+                           if storage.columnar_enabled() else 'affinity_scores.json')
+            if not Path(scores_file).exists():
+                print(f"Error: {scores_file} was not created by {script_name}")
                 return False
             
         return True
@@ -64,6 +74,97 @@ def run_script(script_name, description):
         print(f"Error executing {script_name}: {str(e)}")
         return False
 
+def print_stage_timings(timings, total_execution_time):
+    """Print how long each stage took and its share of the total"""
+    print("\nStage timings:")
+    for stage, seconds in timings:
+        share = seconds / total_execution_time * 100 if total_execution_time else 0
+        print(f"  {stage:<45} {format_execution_time(seconds):>18} {share:>5.1f}%")
+
+def run_stage(description, step, timings):
+    """Run one in-process stage and record its execution time"""
+    print(f"\n{'='*50}")
+    print(description)
+    print(f"{'='*50}\n")
+    
+    start_time = time.time()
+    result = step()
+    execution_time = time.time() - start_time
+    timings.append((description, execution_time))
+    print(f"\nExecution time for {description}: {format_execution_time(execution_time)}")
+    return result
+
+def run_in_process(timings):
+    """
+    Run every step in this interpreter, handing data between stages in memory
+    
+    Modules and the OpenAI client are loaded once. Intermediate files are only
+    written when WRITE_ARTIFACTS is enabled, except extracted_keywords.json,
+    which is needed for the keywords review. With MENTOR_CHUNK_SIZE set,
+    mentors are scored chunk by chunk from mentors.csv (or the columnar
+    mentor table) like evaluate_affinity.py does, so mentors.csv and the
+    affinity scores are always written.
+    """
+    start_time = time.time()
+    import pandas as pd
+    import numpy as np
+    import extract_mentors
+    import extract_keywords
+    import evaluate_affinity
+    import merge_results
+    from mentor_records import records_frame
+    timings.append(('Importing modules', time.time() - start_time))
+    
+    chunked = evaluate_affinity.MENTOR_CHUNK_SIZE > 0
+    mentors_file = 'mentors.csv' if WRITE_ARTIFACTS or chunked else None
+    mentors_data = run_stage('Extracting mentors data',
+                             lambda: extract_mentors.extract_mentors(output_file=mentors_file), timings)
+    if chunked:
+        # Scoring reads the mentors back chunk by chunk
+        mentors_df = mentors_data = None
+    elif mentors_data is None:
+        # Streaming extraction wrote straight to disk
+        mentors_df = pd.read_csv(mentors_file)
+    else:
+        # Match pd.read_csv, which reads empty fields as NaN
+        mentors_df = records_frame(mentors_data).replace('', np.nan)
+    
+    client = evaluate_affinity.setup_openai()
+    keywords_file = 'extracted_keywords.json'
+    keywords = run_stage('Extracting keywords from input description',
+                         lambda: extract_keywords.run_keyword_extraction(client, keywords_file), timings)
+    if not keywords:
+        return False
+    
+    print("\nKeywords extraction completed.")
+    if not review_keywords():
+        print("\nPipeline failed during keywords review! Stopping execution.")
+        return False
+    with open(keywords_file, 'r', encoding='utf-8') as f:
+        keywords = json.load(f)
+    print("\nContinuing with pipeline execution...")
+    
+    if chunked:
+        run_stage('Evaluating mentor affinities',
+                  lambda: evaluate_affinity.evaluate_chunked(
+                      evaluate_affinity.load_mentor_chunks(), keywords, client, 'affinity_scores.json'
+                  ), timings)
+        # Ranking needs every mentor, read from the files the chunks were written to
+        mentors_df, results = merge_results.load_data()
+    else:
+        results = run_stage('Evaluating mentor affinities',
+                            lambda: evaluate_affinity.evaluate(
+                                mentors_df, keywords, client,
+                                'affinity_scores.json' if WRITE_ARTIFACTS else None
+                            ), timings)
+    
+    run_stage('Merging results and calculating metrics',
+              lambda: merge_results.merge(
+                  mentors_df, results,
+                  'mentors_with_affinities.csv' if WRITE_ARTIFACTS else None
+              ), timings)
+    return True
+
 def review_keywords():
     """Allow user to review and edit keywords in the file"""
     keywords_file = 'extracted_keywords.json'
@@ -95,6 +196,8 @@ def review_keywords():
 
 def main():
     pipeline_start_time = time.time()
+    # One trace run id shared with every child script
+    os.environ['TRACE_RUN_ID'] = tracing.TRACER.run_id
     
     # Define pipeline steps
     pipeline_steps = [
@@ -105,44 +208,62 @@ def main():
     ]
     
     print("\nStarting mentorship matching pipeline...")
+    timings = []
     
     pipeline_success = True
-    for i, (script, description) in enumerate(pipeline_steps, 1):
-        print(f"\nStep {i}/{len(pipeline_steps)}")
-        
-        if not Path(script).exists():
-            print(f"Error: Script {script} not found!")
+    if IN_PROCESS:
+        try:
+            pipeline_success = run_in_process(timings)
+        except Exception as e:
+            print(f"\nError: {str(e)}")
             pipeline_success = False
-            break
-        
-        # Run the script
-        if not run_script(script, description):
+        if not pipeline_success:
             print("\nPipeline failed! Stopping execution.")
-            pipeline_success = False
-            break
-        
-        # After extracting keywords, pause for review
-        if script == 'extract_keywords.py':
-            print("\nKeywords extraction completed.")
-            if not review_keywords():
-                print("\nPipeline failed during keywords review! Stopping execution.")
+    else:
+        for i, (script, description) in enumerate(pipeline_steps, 1):
+            print(f"\nStep {i}/{len(pipeline_steps)}")
+            
+            if not Path(script).exists():
+                print(f"Error: Script {script} not found!")
                 pipeline_success = False
                 break
-            print("\nContinuing with pipeline execution...")
-        
-        # Add a small delay between steps
-        time.sleep(1)
+            
+            # Run the script
+            if not run_script(script, description, timings):
+                print("\nPipeline failed! Stopping execution.")
+                pipeline_success = False
+                break
+            
+            # After extracting keywords, pause for review
+            if script == 'extract_keywords.py':
+                print("\nKeywords extraction completed.")
+                if not review_keywords():
+                    print("\nPipeline failed during keywords review! Stopping execution.")
+                    pipeline_success = False
+                    break
+                print("\nContinuing with pipeline execution...")
     
     total_execution_time = time.time() - pipeline_start_time
     
+    print_stage_timings(timings, total_execution_time)
+    
+    # Child scripts write their spans to the trace file, in-process spans are also kept in memory
+    tracing.TRACER.close()
+    if tracing.TRACE_FILE:
+        tracing.print_summary(tracing.load_spans(tracing.TRACE_FILE, tracing.TRACER.run_id))
+    else:
+        tracing.print_summary(tracing.TRACER.spans())
+    
     if pipeline_success:
         print("\n✨ Pipeline completed successfully! ✨")
         print(f"Total execution time: {format_execution_time(total_execution_time)}")
         print("\nGenerated files:")
-        print("- mentors.csv: Extracted mentor data")
+        if WRITE_ARTIFACTS or not IN_PROCESS:
+            print("- mentors.csv: Extracted mentor data")
         print("- extracted_keywords.json: Keywords from input description")
-        print("- affinity_scores.json: Individual affinity scores")
-        print("- mentors_with_affinities.csv: Final results with rankings")
+        if WRITE_ARTIFACTS or not IN_PROCESS:
+            print("- affinity_scores.json: Individual affinity scores")
+            print("- mentors_with_affinities.csv: Final results with rankings")
     else:
         print("\nPipeline failed! Some steps were not completed successfully.")
         print(f"Time until failure: {format_execution_time(total_execution_time)}")
@@ -0,0 +1,169 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import numpy as np
+from dotenv import load_dotenv
+from mentor_records import records_from_frame
+from merge_results import aggregate_scores, keyword_weights
+from tracing import TRACER
+
+# Load environment variables
+load_dotenv()
+
+SAMPLE_AGGREGATION = os.getenv('SAMPLE_AGGREGATION', 'median')
+SAMPLE_AGGREGATIONS = ('median', 'trimmed_mean')
+# Share of the lowest and of the highest samples the trimmed mean drops
+SAMPLE_TRIM_FRACTION = float(os.getenv('SAMPLE_TRIM_FRACTION', '0.2'))
+RESAMPLE_TOP_K = int(os.getenv('RESAMPLE_TOP_K', '10'))
+RESAMPLE_MARGIN = float(os.getenv('RESAMPLE_MARGIN', '5'))
+RESAMPLE_MIN_VARIANCE = float(os.getenv('RESAMPLE_MIN_VARIANCE', '100'))
+# Extra samples per uncertain pair after scoring, 0 skips resampling
+RESAMPLE_SAMPLES = int(os.getenv('RESAMPLE_SAMPLES', '0'))
+
+def consensus_score(samples: List[float], aggregation: str = SAMPLE_AGGREGATION,
+                    trim_fraction: float = SAMPLE_TRIM_FRACTION):
+    """
+    Combines the sampled scores of one (mentor, keyword) pair
+
+    Args:
+        samples: Scores the model gave the pair, at least one
+        aggregation: 'median' or 'trimmed_mean' (mean without the trim_fraction
+            lowest and highest samples)
+
+    Returns:
+        int or float: The consensus score, an int when it is whole
+    """
+    if aggregation not in SAMPLE_AGGREGATIONS:
+        raise Exception(f"Unknown SAMPLE_AGGREGATION '{aggregation}', use median or trimmed_mean")
+    values = np.sort(np.asarray(samples, dtype=np.float64))
+    if aggregation == 'median':
+        score = float(np.median(values))
+    else:
+        # Always keep at least one sample
+        cut = min(int(len(values) * trim_fraction), (len(values) - 1) // 2)
+        score = float(values[cut:len(values) - cut].mean())
+    score = round(score, 1)
+    return int(score) if score.is_integer() else score
+
+def score_variance(samples: List[float]):
+    """Sample variance of the scores of one pair, or None with fewer than two samples"""
+    if len(samples) < 2:
+        return None
+    return round(float(np.var(np.asarray(samples, dtype=np.float64), ddof=1)), 1)
+
+def sampling_signature(samples: int, aggregation: str = SAMPLE_AGGREGATION) -> str:
+    """Cache key suffix, so consensus scores never mix with single samples; empty for one sample"""
+    return f"|samples={samples}|{aggregation}" if samples > 1 else ''
+
+def select_uncertain(results: list, keywords: List[str], top_k: int = RESAMPLE_TOP_K,
+                     margin: float = RESAMPLE_MARGIN, min_variance: float = RESAMPLE_MIN_VARIANCE,
+                     max_samples: int = 0) -> dict:
+    """
+    Picks the (mentor, keyword) pairs worth more samples
+
+    A mentor whose aggregated score is within margin of the top_k cut-off
+    gets every keyword resampled, since a few points decide whether it is
+    ranked in. Elsewhere only pairs whose variance is at least min_variance
+    (0 disables this) are resampled. Pairs whose score already combines
+    max_samples samples (their 'samples' count, 1 when missing) are left
+    out, so carried forward and resumed pairs are not resampled twice; 0
+    keeps every pair.
+
+    Returns:
+        dict: {index into results: keywords to resample}
+    """
+    selected = {}
+    matrix = np.array([[result['affinities'].get(keyword, np.nan) for keyword in keywords]
+                       for result in results], dtype=np.float64).reshape(len(results), len(keywords))
+    scores = aggregate_scores(matrix, keyword_weights(keywords))
+    ranked = np.sort(scores[~np.isnan(scores)])[::-1]
+    if 0 < top_k < len(ranked):
+        cutoff = ranked[top_k - 1]
+        for i in np.flatnonzero(np.abs(scores - cutoff) <= margin):
+            selected[int(i)] = list(keywords)
+    if min_variance > 0:
+        for i, result in enumerate(results):
+            if i in selected:
+                continue
+            variance = result.get('variance') or {}
+            noisy = [keyword for keyword in keywords if (variance.get(keyword) or 0) >= min_variance]
+            if noisy:
+                selected[i] = noisy
+    if max_samples > 0:
+        for i in list(selected):
+            counts = results[i].get('samples') or {}
+            selected[i] = [keyword for keyword in selected[i] if counts.get(keyword, 1) < max_samples]
+            if not selected[i]:
+                del selected[i]
+    return selected
+
+def resample_uncertain(mentors_df, keywords, results, client, sample_log=None, on_result=None,
+                       top_k: int = RESAMPLE_TOP_K, margin: float = RESAMPLE_MARGIN,
+                       min_variance: float = RESAMPLE_MIN_VARIANCE, samples: int = RESAMPLE_SAMPLES):
+    """
+    Requests more samples for the pairs picked by select_uncertain and updates their results in place
+
+    New samples are added to those in sample_log ({context: {keyword:
+    samples}}, as filled by score_mentors); a result without logged samples,
+    such as a carried forward one, counts its score as a single sample. The
+    consensus scores, variances and sample counts are recomputed and reach
+    the checkpoint through on_result. They are not cached: the cache only
+    serves scores of AFFINITY_SAMPLES samples. Pairs that already have
+    AFFINITY_SAMPLES + samples samples are skipped.
+
+    Returns:
+        int: Number of (mentor, keyword) pairs resampled
+    """
+    # Imported here because evaluate_affinity aggregates its samples with this module
+    import evaluate_affinity as affinity
+
+    if samples < 1:
+        return 0
+    selected = select_uncertain(results, keywords, top_k, margin, min_variance, affinity.AFFINITY_SAMPLES + samples)
+    if not selected:
+        return 0
+    sample_log = sample_log if sample_log is not None else {}
+    rows = {affinity.row_key(row): row for row in records_from_frame(mentors_df)}
+    contexts = {i: affinity.create_context(rows[affinity.result_key(results[i])]) for i in selected}
+
+    groups = {}
+    for i, selected_keywords in selected.items():
+        groups.setdefault(tuple(selected_keywords), []).append(i)
+    tasks = []
+    for group_keywords, indexes in groups.items():
+        for pack in affinity.pack_contexts([contexts[i] for i in indexes], list(group_keywords)):
+            tasks.append(([indexes[j] for j in pack], list(group_keywords)))
+
+    pairs = sum(len(selected_keywords) for selected_keywords in selected.values())
+    print(f"\nResampling {pairs} uncertain pairs of {len(selected)} mentors with {samples} more samples each")
+
+    def run_task(task):
+        indexes, task_keywords = task
+        task_contexts = [contexts[i] for i in indexes]
+        try:
+            sampled = affinity.get_affinity_samples(task_contexts, task_keywords, client, samples)
+        except Exception as e:
+            print(f"Error resampling {len(indexes)} mentors: {str(e)}")
+            return
+        for i, context, rows_sampled in zip(indexes, task_contexts, sampled):
+            if not rows_sampled:
+                continue
+            result = results[i]
+            logged = sample_log.setdefault(context, {})
+            variance = result.setdefault('variance', {})
+            counts = result.setdefault('samples', {})
+            for column, keyword in enumerate(task_keywords):
+                history = logged.setdefault(keyword, [result['affinities'][keyword]])
+                history.extend(row[column] for row in rows_sampled)
+                result['affinities'][keyword] = consensus_score(history)
+                variance[keyword] = score_variance(history)
+                counts[keyword] = counts.get(keyword, 1) + len(rows_sampled)
+            if on_result is not None:
+                on_result(rows[affinity.result_key(result)], context, result)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, affinity.MAX_CONCURRENCY))
+    try:
+        list(executor.map(TRACER.bind(run_task), tasks))
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return pairs
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from dotenv import load_dotenv
+import evaluate_affinity
+import merge_results
+from affinity_parser import PARSE_STATS
+from extract_keywords import extract_keywords, validate_keywords
+from openai_client import setup_client
+
+# Load environment variables
+load_dotenv()
+
+SEARCH_SERVICE_HOST = os.getenv('SEARCH_SERVICE_HOST', '127.0.0.1')
+SEARCH_SERVICE_PORT = int(os.getenv('SEARCH_SERVICE_PORT', '8000'))
+SEARCH_SERVICE_WORKERS = int(os.getenv('SEARCH_SERVICE_WORKERS', '8'))
+MAX_REQUEST_BYTES = 64 * 1024
+
+class SearchService:
+    """
+    Warm search state: the mentor table, the score cache and one pooled OpenAI client
+
+    Everything is loaded once and shared by all requests, so a search only
+    pays for keyword extraction and the (mentor, keyword) pairs not cached yet.
+    """
+
+    def __init__(self, mentors_df, client=None, cache=None):
+        self.mentors_df = mentors_df
+        # Every worker may have MAX_CONCURRENCY_AFFINITY requests in flight at once
+        self.client = client or setup_client(SEARCH_SERVICE_WORKERS * max(1, evaluate_affinity.MAX_CONCURRENCY))
+        self.cache = cache
+
+    def search(self, description: str = None, keywords: list = None, top_k: int = 10) -> dict:
+        """Extracts keywords (unless given), scores mentors and returns the top_k"""
+        timings = {}
+        start_time = time.time()
+        if not keywords:
+            if not description:
+                raise ValueError("Either 'description' or 'keywords' is required")
+            keywords = extract_keywords(description, self.client)
+            if not keywords:
+                raise RuntimeError("Could not extract valid keywords")
+        elif not validate_keywords(keywords):
+            raise ValueError("'keywords' must be a list of 3-7 non-empty strings")
+        timings['keywords'] = time.time() - start_time
+
+        step_time = time.time()
+        candidates_df = evaluate_affinity.prefilter_mentors(self.mentors_df, keywords, self.client)
+        results = evaluate_affinity.score_mentors(
+            candidates_df, keywords, self.client, self.cache, evaluate_affinity.MAX_CONCURRENCY
+        )
+        timings['scoring'] = time.time() - step_time
+
+        step_time = time.time()
+        matrix_keywords, matrix = merge_results.build_score_matrix(candidates_df, results)
+        order, scores = merge_results.rank_mentors(matrix, matrix_keywords, k=top_k)
+        ranked = []
+        for i in order:
+            if pd.isna(scores[i]):
+                continue
+            row = candidates_df.iloc[i]
+            ranked.append({
+                'name': row['name'],
+                'position': row['position'] if pd.notna(row['position']) else '',
+                'location': row['location'] if pd.notna(row['location']) else '',
+                'score': round(float(scores[i]), 2),
+                'affinities': {k: float(v) for k, v in zip(matrix_keywords, matrix[i]) if not pd.isna(v)}
+            })
+        timings['ranking'] = time.time() - step_time
+        timings['total'] = time.time() - start_time
+
+        return {'keywords': keywords, 'results': ranked, 'timings': timings}
+
+async def read_request(reader):
+    """Reads one HTTP/1.1 request, returning (method, path, body bytes)"""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', '0'))
+    if length > MAX_REQUEST_BYTES:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    return method, path, body
+
+def http_response(status: int, body: dict) -> bytes:
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+    payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    head = (f"HTTP/1.1 {status} {reasons.get(status, 'Error')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n")
+    return head.encode('latin-1') + payload
+
+async def handle_connection(reader, writer, service, executor):
+    try:
+        request = await read_request(reader)
+        if request is None:
+            return
+        method, path, body = request
+
+        if path == '/health' and method == 'GET':
+            status, response = 200, {'status': 'ok', 'mentors': len(service.mentors_df)}
+        elif path == '/metrics' and method == 'GET':
+            status, response = 200, {'affinity_parsing': PARSE_STATS.stats(),
+                                     'score_cache': service.cache.stats() if service.cache is not None else None}
+        elif path == '/search' and method == 'POST':
+            try:
+                payload = json.loads(body or b'{}')
+                if not isinstance(payload, dict):
+                    raise ValueError("The request body must be a JSON object")
+                loop = asyncio.get_running_loop()
+                # Scoring blocks on HTTP calls, keep it off the event loop
+                response = await loop.run_in_executor(executor, lambda: service.search(
+                    payload.get('description'), payload.get('keywords'), int(payload.get('top_k', 10))
+                ))
+                status = 200
+            except (ValueError, json.JSONDecodeError) as e:
+                status, response = 400, {'error': str(e)}
+            except Exception as e:
+                status, response = 500, {'error': str(e)}
+        elif path in ('/search', '/health', '/metrics'):
+            status, response = 405, {'error': f"{method} not allowed on {path}"}
+        else:
+            status, response = 404, {'error': f"Unknown path {path}"}
+
+        writer.write(http_response(status, response))
+        await writer.drain()
+    except Exception as e:
+        print(f"Error handling request: {str(e)}")
+    finally:
+        writer.close()
+
+async def serve(service, host: str = SEARCH_SERVICE_HOST, port: int = SEARCH_SERVICE_PORT, ready=None):
+    """Serves POST /search, GET /health and GET /metrics until cancelled"""
+    executor = ThreadPoolExecutor(max_workers=SEARCH_SERVICE_WORKERS)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(reader, writer, service, executor), host, port
+    )
+    address = server.sockets[0].getsockname()
+    print(f"\nSearch service listening on http://{address[0]}:{address[1]} ({len(service.mentors_df)} mentors)")
+    if ready is not None:
+        ready(address)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+def main():
+    try:
+        mentors_df = pd.read_csv(sys.argv[1] if len(sys.argv) > 1 else 'mentors.csv')
+        service = SearchService(mentors_df, cache=evaluate_affinity.setup_cache())
+        asyncio.run(serve(service))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"\nError: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import json
+import os
+import shutil
+from typing import List, NamedTuple, Optional
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+ARTIFACT_FORMAT = os.getenv('ARTIFACT_FORMAT', 'csv')
+ARTIFACT_DIR = os.getenv('ARTIFACT_DIR', 'artifacts')
+COLUMNAR_FORMATS = ('parquet', 'npy')
+
+# Parquet is optional, the npy format only needs NumPy
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+class ScoreMatrix(NamedTuple):
+    """Dense affinity scores: one row per mentor_id, one column per keyword, NaN where missing"""
+    mentor_ids: np.ndarray
+    keywords: List[str]
+    matrix: np.ndarray
+    content_hashes: Optional[np.ndarray] = None
+    model: Optional[str] = None
+    # Variance of sampled scores, same shape as matrix, NaN for single samples
+    variances: Optional[np.ndarray] = None
+    # Number of samples behind each consensus score, NaN where it was not recorded
+    sample_counts: Optional[np.ndarray] = None
+
+def columnar_enabled(artifact_format: str = ARTIFACT_FORMAT) -> bool:
+    if artifact_format not in ('csv',) + COLUMNAR_FORMATS:
+        raise Exception(f"Unknown ARTIFACT_FORMAT '{artifact_format}', use csv, parquet or npy")
+    if artifact_format == 'parquet' and not PARQUET_AVAILABLE:
+        raise Exception("ARTIFACT_FORMAT=parquet needs pyarrow (pip install pyarrow), or use npy")
+    return artifact_format in COLUMNAR_FORMATS
+
+def _replace_directory(directory: str, write):
+    """Writes into a temporary directory and swaps it in, so readers never see half an artifact"""
+    tmp_directory = directory + '.tmp'
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    write(tmp_directory)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+
+def _save_metadata(directory: str, metadata: dict):
+    with open(os.path.join(directory, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False)
+
+def _load_metadata(directory: str) -> dict:
+    with open(os.path.join(directory, 'metadata.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_string_column(directory: str, name: str, values):
+    """Stores strings as one UTF-8 buffer plus int64 offsets; missing values become empty strings"""
+    encoded = [('' if pd.isna(value) else str(value)).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, f'{name}.offsets.npy'), offsets)
+    np.save(os.path.join(directory, f'{name}.utf8.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+def load_string_column(directory: str, name: str, start: int = 0, stop: int = None) -> np.ndarray:
+    """Reads a string column back (rows start to stop, all by default), empty strings as NaN like pd.read_csv"""
+    offsets = np.load(os.path.join(directory, f'{name}.offsets.npy'), mmap_mode='r')
+    buffer = np.load(os.path.join(directory, f'{name}.utf8.npy'), mmap_mode='r')
+    stop = len(offsets) - 1 if stop is None else min(stop, len(offsets) - 1)
+    values = np.empty(max(0, stop - start), dtype=object)
+    for i in range(len(values)):
+        begin, end = offsets[start + i], offsets[start + i + 1]
+        values[i] = buffer[begin:end].tobytes().decode('utf-8') if end > begin else np.nan
+    return values
+
+def mentors_directory(directory: str = ARTIFACT_DIR) -> str:
+    return os.path.join(directory, 'mentors')
+
+def scores_directory(directory: str = ARTIFACT_DIR) -> str:
+    return os.path.join(directory, 'scores')
+
+def results_artifact_directory(results_file: str) -> str:
+    """
+    Artifact directory holding the score matrix that replaces results_file
+
+    The pipeline's affinity_scores.json maps to ARTIFACT_DIR. Any other
+    results file, such as a batch search's, gets its own directory beside it,
+    so separate runs never overwrite or carry forward each other's scores.
+    """
+    if os.path.abspath(results_file) == os.path.abspath('affinity_scores.json'):
+        return ARTIFACT_DIR
+    return os.path.splitext(results_file)[0] + '_artifacts'
+
+def save_mentors_table(mentors_df, directory: str = ARTIFACT_DIR, artifact_format: str = ARTIFACT_FORMAT):
+    """Saves the mentor table with typed columns: mentor_id as int64, text fields as strings"""
+    columnar_enabled(artifact_format)
+
+    def write(target):
+        if artifact_format == 'parquet':
+            mentors_df.to_parquet(os.path.join(target, 'mentors.parquet'), index=False)
+        else:
+            for column in mentors_df.columns:
+                if column == 'mentor_id':
+                    np.save(os.path.join(target, 'mentor_id.npy'), mentors_df[column].to_numpy(dtype=np.int64))
+                else:
+                    save_string_column(target, column, mentors_df[column])
+        _save_metadata(target, {'format': artifact_format, 'rows': len(mentors_df),
+                                'columns': list(mentors_df.columns)})
+
+    _replace_directory(mentors_directory(directory), write)
+
+def load_mentors_table(columns: List[str] = None, directory: str = ARTIFACT_DIR):
+    """
+    Loads the mentor table, or only the given columns
+
+    Only the requested columns are read from disk, in either format.
+    """
+    path = mentors_directory(directory)
+    metadata = _load_metadata(path)
+    columns = [column for column in metadata['columns'] if columns is None or column in columns]
+    if metadata['format'] == 'parquet':
+        return pd.read_parquet(os.path.join(path, 'mentors.parquet'), columns=columns)
+
+    return _load_rows(path, columns)
+
+def iter_mentors_table(chunk_size: int, columns: List[str] = None, directory: str = ARTIFACT_DIR):
+    """Yields the mentor table (or only the given columns) chunk_size rows at a time, reading only those rows"""
+    path = mentors_directory(directory)
+    metadata = _load_metadata(path)
+    columns = [column for column in metadata['columns'] if columns is None or column in columns]
+    if metadata['format'] == 'parquet':
+        # Only reached when pyarrow is installed, see columnar_enabled
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(os.path.join(path, 'mentors.parquet'))
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+    for start in range(0, metadata['rows'], chunk_size):
+        yield _load_rows(path, columns, start, start + chunk_size)
+
+def _load_rows(path: str, columns: List[str], start: int = 0, stop: int = None):
+    data = {}
+    for column in columns:
+        if column == 'mentor_id':
+            data[column] = np.array(np.load(os.path.join(path, 'mentor_id.npy'), mmap_mode='r')[start:stop])
+        else:
+            data[column] = load_string_column(path, column, start, stop)
+    return pd.DataFrame(data, columns=columns)
+
+def mentors_table_exists(directory: str = ARTIFACT_DIR) -> bool:
+    return os.path.exists(os.path.join(mentors_directory(directory), 'metadata.json'))
+
+def _pair_matrix(results: list, keywords: List[str], field: str) -> Optional[np.ndarray]:
+    """Per-pair values of results under field ({keyword: value}) as a matrix, or None if no result has any"""
+    if not any(result.get(field) for result in results):
+        return None
+    values = np.full((len(results), len(keywords)), np.nan, dtype=np.float32)
+    for row, result in enumerate(results):
+        entry = result.get(field) or {}
+        values[row] = [np.nan if entry.get(keyword) is None else entry[keyword] for keyword in keywords]
+    return values
+
+def _concat_pairs(parts: List[ScoreMatrix], field: str) -> Optional[np.ndarray]:
+    """Stacks a per-pair field of score matrices, with NaN for the parts without it"""
+    if all(getattr(part, field) is None for part in parts):
+        return None
+    return np.concatenate([
+        getattr(part, field) if getattr(part, field) is not None
+        else np.full(part.matrix.shape, np.nan, dtype=np.float32)
+        for part in parts
+    ])
+
+def results_to_scores(affinity_scores: list, keywords: List[str], model: str = None) -> ScoreMatrix:
+    """Converts {'mentor_id', 'content_hash', 'affinities'} results into a ScoreMatrix"""
+    scored = list(affinity_scores)
+    for result in scored:
+        if 'mentor_id' not in result:
+            raise Exception(f"Result for {result.get('mentor_name')} has no mentor_id; columnar scores need a "
+                            f"mentors.csv with mentor IDs (re-run extract_mentors.py) or ARTIFACT_FORMAT=csv")
+    matrix = np.full((len(scored), len(keywords)), np.nan, dtype=np.float32)
+    for row, result in enumerate(scored):
+        matrix[row] = [result['affinities'].get(keyword, np.nan) for keyword in keywords]
+    return ScoreMatrix(
+        mentor_ids=np.array([result['mentor_id'] for result in scored], dtype=np.int64),
+        keywords=list(keywords),
+        matrix=matrix,
+        content_hashes=np.array([result.get('content_hash') or '' for result in scored], dtype='S16'),
+        model=model,
+        variances=_pair_matrix(scored, keywords, 'variance'),
+        sample_counts=_pair_matrix(scored, keywords, 'samples')
+    )
+
+def concat_scores(parts: List[ScoreMatrix], keywords: List[str], model: str = None) -> ScoreMatrix:
+    """Stacks score matrices over the same keywords, such as the chunks of a chunked run"""
+    if not parts:
+        return results_to_scores([], keywords, model)
+    return ScoreMatrix(
+        mentor_ids=np.concatenate([part.mentor_ids for part in parts]),
+        keywords=list(keywords),
+        matrix=np.concatenate([part.matrix for part in parts]),
+        content_hashes=np.concatenate([part.content_hashes for part in parts]),
+        model=model,
+        variances=_concat_pairs(parts, 'variances'),
+        sample_counts=_concat_pairs(parts, 'sample_counts')
+    )
+
+def scores_to_results(scores: ScoreMatrix, names=None) -> list:
+    """Expands a ScoreMatrix into result dicts, skipping missing scores"""
+    results = []
+    for row, mentor_id in enumerate(scores.mentor_ids):
+        result = {
+            'mentor_name': names[row] if names is not None else None,
+            'affinities': {keyword: int(score) if float(score).is_integer() else float(score)
+                           for keyword, score in zip(scores.keywords, scores.matrix[row]) if not np.isnan(score)},
+            'mentor_id': int(mentor_id),
+            'model': scores.model
+        }
+        if scores.content_hashes is not None:
+            result['content_hash'] = scores.content_hashes[row].decode('ascii')
+        if scores.variances is not None:
+            variance = {keyword: float(value) for keyword, value in zip(scores.keywords, scores.variances[row])
+                        if not np.isnan(value)}
+            if variance:
+                result['variance'] = variance
+        if scores.sample_counts is not None:
+            samples = {keyword: int(value) for keyword, value in zip(scores.keywords, scores.sample_counts[row])
+                       if not np.isnan(value)}
+            if samples:
+                result['samples'] = samples
+        results.append(result)
+    return results
+
+def save_scores(scores: ScoreMatrix, directory: str = ARTIFACT_DIR, artifact_format: str = ARTIFACT_FORMAT):
+    """Saves the score matrix densely: float32 scores plus mentor IDs, content hashes and keywords"""
+    columnar_enabled(artifact_format)
+
+    def write(target):
+        if artifact_format == 'parquet':
+            table = pd.DataFrame(scores.matrix, columns=scores.keywords)
+            table.insert(0, 'mentor_id', scores.mentor_ids)
+            table.insert(1, 'content_hash', [value.decode('ascii') for value in scores.content_hashes])
+            if scores.variances is not None:
+                for column, keyword in enumerate(scores.keywords):
+                    table[f'variance:{keyword}'] = scores.variances[:, column]
+            if scores.sample_counts is not None:
+                for column, keyword in enumerate(scores.keywords):
+                    table[f'samples:{keyword}'] = scores.sample_counts[:, column]
+            table.to_parquet(os.path.join(target, 'scores.parquet'), index=False)
+        else:
+            np.save(os.path.join(target, 'matrix.npy'), scores.matrix.astype(np.float32))
+            np.save(os.path.join(target, 'mentor_ids.npy'), scores.mentor_ids)
+            np.save(os.path.join(target, 'content_hashes.npy'), scores.content_hashes)
+            if scores.variances is not None:
+                np.save(os.path.join(target, 'variance.npy'), scores.variances.astype(np.float32))
+            if scores.sample_counts is not None:
+                np.save(os.path.join(target, 'samples.npy'), scores.sample_counts.astype(np.float32))
+        _save_metadata(target, {'format': artifact_format, 'keywords': scores.keywords, 'model': scores.model,
+                                'rows': len(scores.mentor_ids), 'variance': scores.variances is not None,
+                                'samples': scores.sample_counts is not None})
+
+    _replace_directory(scores_directory(directory), write)
+
+def load_scores(keywords: List[str] = None, directory: str = ARTIFACT_DIR) -> Optional[ScoreMatrix]:
+    """
+    Loads the score matrix, or only the columns of the given keywords
+
+    Returns None when no scores were saved yet. With the npy format the
+    matrix is memory-mapped, so selecting columns does not read the rest.
+    """
+    path = scores_directory(directory)
+    if not os.path.exists(os.path.join(path, 'metadata.json')):
+        return None
+    metadata = _load_metadata(path)
+    selected = [keyword for keyword in metadata['keywords'] if keywords is None or keyword in keywords]
+
+    if metadata['format'] == 'parquet':
+        variance_columns = [f'variance:{keyword}' for keyword in selected] if metadata.get('variance') else []
+        sample_columns = [f'samples:{keyword}' for keyword in selected] if metadata.get('samples') else []
+        table = pd.read_parquet(os.path.join(path, 'scores.parquet'),
+                                columns=['mentor_id', 'content_hash'] + selected + variance_columns + sample_columns)
+        return ScoreMatrix(
+            mentor_ids=table['mentor_id'].to_numpy(dtype=np.int64),
+            keywords=selected,
+            matrix=table[selected].to_numpy(dtype=np.float32),
+            content_hashes=table['content_hash'].to_numpy(dtype='S16'),
+            model=metadata['model'],
+            variances=table[variance_columns].to_numpy(dtype=np.float32) if variance_columns else None,
+            sample_counts=table[sample_columns].to_numpy(dtype=np.float32) if sample_columns else None
+        )
+
+    matrix = np.load(os.path.join(path, 'matrix.npy'), mmap_mode='r')
+    columns = [metadata['keywords'].index(keyword) for keyword in selected]
+    return ScoreMatrix(
+        mentor_ids=np.load(os.path.join(path, 'mentor_ids.npy')),
+        keywords=selected,
+        matrix=np.asarray(matrix[:, columns]),
+        content_hashes=np.load(os.path.join(path, 'content_hashes.npy')),
+        model=metadata['model'],
+        variances=np.asarray(np.load(os.path.join(path, 'variance.npy'), mmap_mode='r')[:, columns])
+        if metadata.get('variance') else None,
+        sample_counts=np.asarray(np.load(os.path.join(path, 'samples.npy'), mmap_mode='r')[:, columns])
+        if metadata.get('samples') else None
+    )
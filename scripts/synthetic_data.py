@@ -0,0 +1,81 @@
+import csv
+import html
+import random
+
+FIRST_NAMES = ['Ana', 'Carlos', 'Lucía', 'David', 'Marta', 'Javier', 'Sofía', 'Pablo', 'Elena', 'Andrés']
+LAST_NAMES = ['García', 'Martínez', 'López', 'Sánchez', 'Pérez', 'Gómez', 'Fernández', 'Ruiz', 'Díaz', 'Moreno']
+POSITIONS = ['Data Scientist', 'Product Manager', 'Software Engineer', 'UX Designer', 'Investment Banker',
+             'Marketing Director', 'Machine Learning Engineer', 'Strategy Consultant', 'CTO', 'Founder & CEO']
+COMPANIES = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark Industries', 'Wayne Enterprises']
+LOCATIONS = ['Madrid, Spain', 'London, United Kingdom', 'Berlin, Germany', 'Paris, France', 'New York, USA']
+TOPICS = ['machine learning', 'product strategy', 'fundraising', 'cloud architecture', 'team leadership',
+          'user research', 'growth marketing', 'data engineering', 'venture capital', 'career transitions',
+          'python', 'negotiation', 'public speaking', 'operations', 'sustainability']
+
+def generate_mentor(rng: random.Random, i: int) -> dict:
+    """Creates one fake mentor record"""
+    topics = rng.sample(TOPICS, 3)
+    return {
+        'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}",
+        'position': f"{rng.choice(POSITIONS)} at {rng.choice(COMPANIES)}",
+        'location': rng.choice(LOCATIONS),
+        'description': f"I help people with {topics[0]}, {topics[1]} and {topics[2]}. "
+                       f"Happy to share what I learned over {rng.randint(3, 25)} years in the industry."
+    }
+
+def generate_mentors(count: int, seed: int = 42) -> list:
+    """Creates count fake mentor records, reproducible for a given seed"""
+    rng = random.Random(seed)
+    return [generate_mentor(rng, i) for i in range(count)]
+
+def render_mentor_item(mentor: dict) -> str:
+    """Renders a mentor the way the saved Nova mentoring page lays out list items"""
+    e = html.escape
+    return (
+        '<li data-testid="mentoring-user-list-item" class="flex gap-4 p-4 border-b">'
+        '<div class="shrink-0"><img src="avatar.png" alt="" class="rounded-full w-12 h-12"/></div>'
+        '<div class="flex flex-col">'
+        f'<p class="font-bold text-nova-sm">{e(mentor["name"])}</p>'
+        f'<p class="text-nova-grey-700 text-nova-xs">{e(mentor["position"])}</p>'
+        f'<p class="text-nova-grey-700 text-nova-xs">{e(mentor["location"])}</p>'
+        f'<p class="text-nova-xs line-clamp-3">{e(mentor["description"])}<br>\n</p>'
+        '<button type="button" class="btn">Request mentoring</button>'
+        '</div></li>\n'
+    )
+
+def write_mentors_page(path: str, count: int, seed: int = 42) -> list:
+    """Writes a synthetic mentoring page with count mentors and returns the mentors"""
+    mentors = generate_mentors(count, seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Nova - Mentoring</title>'
+                '<style>.btn { color: red; }</style><script>window.__STATE__ = {"a": "<li>"};</script>'
+                '</head><body><nav><ul><li>Home</li><li>Mentoring</li></ul></nav>'
+                '<main><ul class="divide-y">\n')
+        for mentor in mentors:
+            f.write(render_mentor_item(mentor))
+        f.write('</ul></main></body></html>\n')
+    return mentors
+
+def write_mentors_csv(path: str, count: int, seed: int = 42) -> list:
+    """Writes count synthetic mentors in the mentors.csv layout and returns them"""
+    mentors = generate_mentors(count, seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['name', 'position', 'location', 'description'])
+        writer.writeheader()
+        writer.writerows(mentors)
+    return mentors
+
+def generate_keyword_sets(count: int, min_keywords: int = 3, max_keywords: int = 7, seed: int = 42) -> list:
+    """Creates count keyword lists of 3-7 topics, as extract_keywords would return"""
+    rng = random.Random(seed)
+    return [rng.sample(TOPICS, rng.randint(min_keywords, max_keywords)) for _ in range(count)]
+
+def generate_descriptions(count: int, seed: int = 42) -> list:
+    """Creates count search descriptions that mention two to three topics"""
+    rng = random.Random(seed)
+    descriptions = []
+    for _ in range(count):
+        topics = rng.sample(TOPICS, rng.randint(2, 3))
+        descriptions.append(f"I am looking for a mentor with experience in {', '.join(topics[:-1])} "
+                            f"and {topics[-1]} to help me grow my career")
+    return descriptions
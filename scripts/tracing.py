@@ -0,0 +1,260 @@
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+TRACE_FILE = os.getenv('TRACE_FILE', 'trace.jsonl')
+# Spans kept in memory, so a long-lived search service does not grow without bound
+MAX_SPANS_IN_MEMORY = 100000
+
+# USD per 1M tokens (input, output); MODEL_PRICES in .env adds or overrides models
+MODEL_PRICES = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4.1-nano': (0.10, 0.40),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'text-embedding-3-small': (0.02, 0.0),
+    'text-embedding-3-large': (0.13, 0.0),
+}
+MODEL_PRICES.update({model: tuple(prices) for model, prices in json.loads(os.getenv('MODEL_PRICES', '{}')).items()})
+
+def model_prices(model: str):
+    """Prices of model, matching dated snapshots such as gpt-4o-2024-08-06 by their longest known prefix"""
+    if not model:
+        return None
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    prefixes = [known for known in MODEL_PRICES if model.startswith(known + '-')]
+    return MODEL_PRICES[max(prefixes, key=len)] if prefixes else None
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int = 0):
+    """Estimated USD cost of a call, or None for models without a known price"""
+    prices = model_prices(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+def usage_attributes(model: str, usage) -> dict:
+    """Token counts and estimated cost from a response's usage"""
+    if usage is None:
+        return {}
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    # Prompt tokens served from the provider's prompt cache
+    cached_tokens = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', 0) or 0
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cached_tokens': cached_tokens,
+        'cost_usd': estimate_cost(model, prompt_tokens, completion_tokens)
+    }
+
+class Tracer:
+    """
+    Records nested timing spans and writes each finished one as a JSON line
+
+    Spans nest per thread. Every span also carries the pipeline stage that
+    was open when it started. The stage is kept per thread (in a context
+    variable), so concurrent searches never see each other's stage; work
+    handed to worker threads is wrapped with bind() to keep its stage. All
+    spans of a run share a run_id, which run_pipeline.py passes to its child
+    scripts through TRACE_RUN_ID.
+    """
+
+    def __init__(self, path: str = TRACE_FILE, run_id: str = None):
+        self.path = path
+        self.run_id = run_id or os.getenv('TRACE_RUN_ID') or uuid.uuid4().hex[:12]
+        self.stage_var = contextvars.ContextVar(f'trace_stage_{id(self)}', default=None)
+        self.finished = deque(maxlen=MAX_SPANS_IN_MEMORY)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.file = None
+
+    @property
+    def current_stage(self):
+        return self.stage_var.get()
+
+    def bind(self, fn):
+        """Wraps fn so it runs under the stage open now, for functions run by worker threads"""
+        stage = self.current_stage
+
+        def bound(*args, **kwargs):
+            token = self.stage_var.set(stage)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.stage_var.reset(token)
+        return bound
+
+    def _stack(self) -> list:
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Times the enclosed block; yields its attribute dict so callers can add to it
+
+        An exception marks the span as failed and is re-raised.
+        """
+        stack = self._stack()
+        record = {
+            'run_id': self.run_id,
+            'span_id': uuid.uuid4().hex[:16],
+            'parent_id': stack[-1]['span_id'] if stack else None,
+            'name': name,
+            'stage': self.current_stage,
+            'start': time.time(),
+            'status': 'ok',
+            'attributes': attributes
+        }
+        stack.append(record)
+        start_time = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            record['status'] = 'error'
+            record['error'] = str(e) or type(e).__name__
+            raise
+        finally:
+            record['duration_ms'] = (time.perf_counter() - start_time) * 1000
+            stack.pop()
+            self._finish(record)
+
+    @contextmanager
+    def stage(self, name: str, **attributes):
+        """Span for a whole pipeline stage; also usable as a function decorator"""
+        token = self.stage_var.set(name)
+        try:
+            with self.span(name, **attributes) as span_attributes:
+                yield span_attributes
+        finally:
+            self.stage_var.reset(token)
+
+    def annotate(self, **attributes):
+        """Adds attributes to the innermost open span of this thread"""
+        stack = self._stack()
+        if stack:
+            stack[-1]['attributes'].update(attributes)
+
+    def _finish(self, record: dict):
+        with self.lock:
+            self.finished.append(record)
+            if not self.path:
+                return
+            if self.file is None:
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+
+    def spans(self) -> list:
+        with self.lock:
+            return list(self.finished)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+TRACER = Tracer()
+
+def load_spans(path: str = TRACE_FILE, run_id: str = None) -> list:
+    """Spans of run_id from a trace file, or of the last run in it when run_id is None"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    if run_id is None and spans:
+        run_id = spans[-1]['run_id']
+    return [span for span in spans if span['run_id'] == run_id]
+
+def summarize(spans: list) -> list:
+    """
+    Aggregates spans by (stage, name)
+
+    Returns:
+        list: One dict per group with calls, errors, retries, latency
+        percentiles, tokens and cost, in order of the group's first start
+    """
+    groups = {}
+    for span in sorted(spans, key=lambda span: span['start']):
+        groups.setdefault((span['stage'] or span['name'], span['name']), []).append(span)
+
+    rows = []
+    for (stage, name), group in groups.items():
+        durations = [span['duration_ms'] for span in group]
+        attributes = [span['attributes'] for span in group]
+        costs = [a.get('cost_usd') for a in attributes if 'cost_usd' in a]
+        rows.append({
+            'stage': stage,
+            'name': name,
+            'calls': len(group),
+            'errors': sum(span['status'] == 'error' for span in group),
+            'retries': sum(a.get('retries', 0) for a in attributes),
+            'total_s': sum(durations) / 1000,
+            'p50_ms': float(np.percentile(durations, 50)),
+            'p95_ms': float(np.percentile(durations, 95)),
+            'prompt_tokens': sum(a.get('prompt_tokens', 0) for a in attributes),
+            'completion_tokens': sum(a.get('completion_tokens', 0) for a in attributes),
+            'cached_tokens': sum(a.get('cached_tokens', 0) for a in attributes),
+            'cost_usd': sum(cost for cost in costs if cost is not None),
+            'unpriced': sum(cost is None for cost in costs)
+        })
+    return rows
+
+def print_summary(spans: list):
+    """Prints the per stage and span table, total cost and cost per 1,000 scored mentors"""
+    rows = summarize(spans)
+    if not rows:
+        return
+    print(f"\nTrace summary (run {spans[0]['run_id']}):")
+    print(f"  {'stage':<20} {'span':<24} {'calls':>6} {'errors':>6} {'retries':>7} {'total s':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'prompt tok':>11} {'compl tok':>10} {'cost $':>9}")
+    for row in rows:
+        print(f"  {row['stage'][:20]:<20} {row['name'][:24]:<24} {row['calls']:>6} {row['errors']:>6} "
+              f"{row['retries']:>7} {row['total_s']:>9.2f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{row['prompt_tokens']:>11} {row['completion_tokens']:>10} {row['cost_usd']:>9.4f}")
+
+    total_cost = sum(row['cost_usd'] for row in rows)
+    print(f"  Estimated cost: ${total_cost:.4f}")
+    cached_tokens = sum(row['cached_tokens'] for row in rows)
+    if cached_tokens:
+        prompt_tokens = sum(row['prompt_tokens'] for row in rows)
+        print(f"  Prompt cache: {cached_tokens} of {prompt_tokens} prompt tokens cached ({cached_tokens / prompt_tokens:.0%})")
+    if any(row['unpriced'] for row in rows):
+        print("  Some calls used models without a known price; add them to MODEL_PRICES")
+
+    # Affinity cost grows with the number of mentors, the rest is per search
+    mentors = sum(span['attributes'].get('mentors', 0) for span in spans if span['name'] == 'evaluate_affinity')
+    if mentors:
+        affinity_cost = sum(row['cost_usd'] for row in rows if row['stage'] == 'evaluate_affinity')
+        print(f"  Affinity cost per 1,000 mentors: ${affinity_cost / mentors * 1000:.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a pipeline trace file")
+    parser.add_argument('trace_file', nargs='?', default=TRACE_FILE or 'trace.jsonl')
+    parser.add_argument('--run', help="Run id to summarize, defaults to the last run in the file")
+    args = parser.parse_args()
+
+    spans = load_spans(args.trace_file, args.run)
+    if not spans:
+        print(f"No spans found in {args.trace_file}")
+        return
+    print_summary(spans)
+
+if __name__ == "__main__":
+    main()